@@ -4,44 +4,46 @@ Tale Forge - ゲームブックシナリオエディタ
 """
 
 from pathlib import Path
-import pandas as pd
 import streamlit as st
 
-from editor import show_editor_tab
-from graph import show_graph_tab
-from gameplay import show_gameplay_tab
-from toml_export import import_from_toml
+from profiling import show_profiling_panel
 
-# 選択肢の数を定数で管理
-NUM_CHOICES = 3
+# pandasやgraphvizなどの重い依存関係は、起動時間を短くするため
+# 必要になった時点（シナリオの読み込みや各タブの表示時）に読み込む
 
 def load_scenario_file(path):
-    """シナリオファイルを読み込む"""
+    """
+    シナリオファイルを読み込む。
+
+    大きなファイルは最初のシーンを読み込んだ時点で返し、
+    残りはバックグラウンドで読み込む。
+    """
+    from scenario_loader import begin_session_load
+
     try:
-        scenario_content = path.read_text(encoding='utf-8')
-        df, image_data = import_from_toml(scenario_content)
-        return df, image_data
+        return begin_session_load(path)
     except Exception:
         st.error("シナリオファイルの読み込みに失敗しました。")
-        return None, None
+        return None, None, None
 
 def initialize_session_state():
     """セッション状態の初期化"""
     if 'data' not in st.session_state:
         default_scenario_path = Path('scenario.toml')
+        if not default_scenario_path.exists():
+            # scenario.tomlがなければ画像を含むバンドルを読み込む
+            default_scenario_path = Path('scenario.zip')
         if default_scenario_path.exists():
-            df, image_data = load_scenario_file(default_scenario_path)
+            df, edges, image_data = load_scenario_file(default_scenario_path)
             if df is not None:
                 st.session_state.data = df
+                st.session_state.edges = edges
                 st.session_state.image_data = image_data
         else:
-            # 新規データフレームを作成
-            st.session_state.data = pd.DataFrame({
-                'ID': ['BG'],
-                'ストーリー': [''],
-                **{f'選択{i}': [''] for i in range(1, NUM_CHOICES + 1)},
-                **{f'選択{i}遷移先': [''] for i in range(1, NUM_CHOICES + 1)}
-            })
+            # 新規シナリオを作成
+            from scene_model import empty_scenario
+
+            st.session_state.data, st.session_state.edges = empty_scenario()
             st.session_state.image_data = {}
 
 def main():
@@ -52,17 +54,51 @@ def main():
     # セッション状態の初期化
     initialize_session_state()
 
+    # バックグラウンドで読み込んだシナリオ全体を反映
+    from scenario_loader import apply_loaded_scenario, show_loading_progress
+    apply_loaded_scenario()
+    skipped = st.session_state.pop('scenario_skipped', 0)
+    if skipped:
+        st.toast(f"読み込めないシーンを{skipped}件読み飛ばしました")
+    show_loading_progress()
+
+    # 外部で編集されたscenario.tomlの変更をシーン単位で反映
+    from scenario_watcher import (
+        apply_scenario_update,
+        show_reload_watcher,
+        start_watcher
+    )
+    start_watcher(Path('scenario.toml'))
+    changed = apply_scenario_update()
+    if changed:
+        st.toast(f"scenario.tomlの変更を反映しました（{changed}シーン）")
+    show_reload_watcher()
+
     # タブの作成と各機能の表示
-    tab1, tab2, tab3 = st.tabs(["シーン編集", "シーン関係図", "ゲームブックを遊ぶ"])
-    
-    with tab1:
-        show_editor_tab()
-        
-    with tab2:
-        show_graph_tab()
-        
-    with tab3:
-        show_gameplay_tab()
+    # 選択中のタブだけを実行し、非表示のタブの処理を省略する
+    tab1, tab2, tab3 = st.tabs(
+        ["シーン編集", "シーン関係図", "ゲームブックを遊ぶ"],
+        key="active_tab",
+        on_change="rerun"
+    )
+
+    if tab1.open:
+        with tab1:
+            from editor import show_editor_tab
+            show_editor_tab()
+
+    if tab2.open:
+        with tab2:
+            from graph import show_graph_tab
+            show_graph_tab()
+
+    if tab3.open:
+        with tab3:
+            from gameplay import show_gameplay_tab
+            show_gameplay_tab()
+
+    # プロファイリング結果の表示（設定で有効な場合のみ）
+    show_profiling_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+主要な処理の実行時間を計測するベンチマークモジュール。
+
+scenario_generatorで生成した合成シナリオに対して、TOMLの
+インポート/エクスポート、シーン関係図の生成、シーン取得、
+SVG処理、Streamlitアプリ全体の再実行と、シナリオのメモリ使用量を計測し、
+結果をJSONで保存する。
+
+使用例:
+    python benchmark.py --sizes 100 1000 10000 --output bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import scenario_generator
+from graph import create_scene_graph
+from scene_model import memory_report, optimize_scenario, scene_rows
+from story_viewer import get_scene, get_svg_dimensions, prepare_svg_content
+from toml_export import (
+    clear_fragment_cache,
+    export_to_toml,
+    import_from_toml,
+    import_toml_stream
+)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    関数を指定回数実行し、実行時間の統計を返す。
+
+    引数:
+        func (callable): 計測する引数なしの関数。
+        repeat (int, オプション): 実行回数。
+        setup (callable, オプション): 毎回の実行の前に呼び出す引数なしの関数。
+            実行時間には含めない。
+
+    戻り値:
+        dict: 実行時間（秒）の最小値、中央値、平均値、最大値。
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+    }
+
+
+def git_commit():
+    """現在のGitコミットIDを取得する"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(APP_PATH),
+            check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# 再実行を計測するタブのラベル
+APP_TABS = {
+    'editor': "シーン編集",
+    'graph': "シーン関係図",
+    'gameplay': "ゲームブックを遊ぶ",
+}
+
+
+def run_app_rerun(workdir, tab=None, timeout=600):
+    """
+    AppTestでアプリを起動し、最初の実行と再実行を行う。
+
+    app.pyはカレントディレクトリのscenario.tomlを読み込むため、
+    実行中は一時的にworkdirへ移動する。
+
+    引数:
+        workdir (str): scenario.tomlを含むディレクトリ。
+        tab (str or None, オプション): 選択するタブのラベル。
+        timeout (float, オプション): 1回の実行のタイムアウト秒数。
+
+    戻り値:
+        callable: 1回の再実行を行う関数。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.run()
+        if tab is not None:
+            at.session_state['active_tab'] = tab
+            at.run()
+    finally:
+        os.chdir(cwd)
+
+    def rerun():
+        os.chdir(workdir)
+        try:
+            at.run()
+        finally:
+            os.chdir(cwd)
+
+    return rerun
+
+
+def benchmark_size(num_scenes, branching=3, text_length=200,
+                   image_ratio=0.1, image_format='svg', seed=0,
+                   repeat=5, run_app=True):
+    """
+    1つのシナリオ規模についてベンチマークを実行する。
+
+    引数:
+        num_scenes (int): シーン数。
+        branching (int, オプション): 1シーンあたりの選択肢の数。
+        text_length (int, オプション): ストーリーの文字数。
+        image_ratio (float, オプション): 画像を持つシーンの割合。
+        image_format (str, オプション): 画像形式（'svg'または'png'）。
+        seed (int, オプション): 乱数シード。
+        repeat (int, オプション): 各計測の実行回数。
+        run_app (bool, オプション): アプリ全体の再実行を計測するかどうか。
+
+    戻り値:
+        list: 計測結果の辞書のリスト。
+    """
+    results = []
+
+    def record(name, func, times=repeat, setup=None):
+        stats = measure(func, times, setup)
+        stats.update({'benchmark': name, 'scenes': num_scenes})
+        results.append(stats)
+        print(f"  {name:<24} median {stats['median'] * 1000:10.2f} ms")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        scenario_path = scenario_generator.write_scenario(
+            workdir,
+            num_scenes,
+            branching=branching,
+            text_length=text_length,
+            image_ratio=image_ratio,
+            image_format=image_format,
+            seed=seed,
+        )
+        with open(scenario_path, encoding='utf-8') as f:
+            toml_string = f.read()
+
+        df, edges, image_data = import_from_toml(toml_string)
+        df, edges = optimize_scenario(df, edges)
+
+        memory = memory_report(df, edges)[-1]['bytes']
+        results.append({
+            'benchmark': 'scenario_memory', 'scenes': num_scenes, 'bytes': memory
+        })
+        print(f"  {'scenario_memory':<24} {memory / 2**20:17.2f} MB")
+
+        record('import_from_toml', lambda: import_from_toml(toml_string))
+        toml_bytes = toml_string.encode('utf-8')
+        record(
+            'import_toml_stream',
+            lambda: import_toml_stream(io.BytesIO(toml_bytes))
+        )
+        # シーンごとの断片のキャッシュがない場合（全シーンを変換）と、
+        # 全シーンの断片がキャッシュ済みの場合を別々に計測する
+        record(
+            'export_to_toml_cold',
+            lambda: export_to_toml(df, edges, image_data),
+            setup=clear_fragment_cache
+        )
+        record('export_to_toml_warm', lambda: export_to_toml(df, edges, image_data))
+        record('create_scene_graph', lambda: create_scene_graph(df, edges))
+
+        # ランダムに選んだシーンの取得時間を計測する
+        rng = random.Random(seed)
+        ids = scenario_generator.scene_ids(num_scenes)
+        lookups = [rng.choice(ids) for _ in range(100)]
+
+        def lookup_scenes():
+            for scene_id in lookups:
+                get_scene(df, scene_id)
+
+        record('get_scene_x100', lookup_scenes)
+
+        rows = scene_rows(df)
+
+        def lookup_scene_rows():
+            for scene_id in lookups:
+                get_scene(df, scene_id, rows)
+
+        record('get_scene_rows_x100', lookup_scene_rows)
+
+        svg_content = scenario_generator.make_svg(rng)
+        record(
+            'svg_helpers_x1000',
+            lambda: [
+                (get_svg_dimensions(svg_content),
+                 prepare_svg_content(svg_content))
+                for _ in range(1000)
+            ]
+        )
+
+        if run_app:
+            # 選択中のタブごとに再実行時間を計測する
+            for name, label in APP_TABS.items():
+                rerun = run_app_rerun(workdir, tab=label)
+                record(f'app_rerun_{name}', rerun)
+
+    return results
+
+
+def main():
+    """コマンドラインからベンチマークを実行する"""
+    parser = argparse.ArgumentParser(description="Tale Forgeのベンチマーク")
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--branching', type=int, default=3)
+    parser.add_argument('--text-length', type=int, default=200)
+    parser.add_argument('--image-ratio', type=float, default=0.1)
+    parser.add_argument('--image-format', choices=['svg', 'png'], default='svg')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--app-max-scenes', type=int, default=10000,
+                        help="この規模を超えるシナリオではアプリ再実行を計測しない")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"{size}シーン:")
+        results.extend(benchmark_size(
+            size,
+            branching=args.branching,
+            text_length=args.text_length,
+            image_ratio=args.image_ratio,
+            image_format=args.image_format,
+            seed=args.seed,
+            repeat=args.repeat,
+            run_app=size <= args.app_max_scenes,
+        ))
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'branching': args.branching,
+            'text_length': args.text_length,
+            'image_ratio': args.image_ratio,
+            'image_format': args.image_format,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+シナリオと画像を1つのアーカイブにまとめたバンドルを提供するモジュール。
+
+バンドルはzip形式のファイルで、シーンの一覧（scenario.toml）を圧縮して
+格納し、画像（images/シーンID.拡張子）は無圧縮で格納する。無圧縮の
+メンバーはアーカイブ内の位置と大きさが分かればそのまま読めるため、
+1枚の画像をほかのメンバーを展開せずにメモリマップから読み込める。
+
+バンドル内の画像は「アーカイブのパス!/メンバー名」の形式のパスで
+画像データに記録し、image_cacheがバンドルから読み込む。
+
+使用例:
+    python bundle.py pack scenario.toml book.zip
+    python bundle.py list book.zip
+"""
+
+import argparse
+import io
+import mmap
+import os
+import struct
+import threading
+import zipfile
+from contextlib import contextmanager
+
+# シーンの一覧のメンバー名
+INDEX_MEMBER = 'scenario.toml'
+
+# バンドル内の画像のパスの区切り
+SEPARATOR = '!/'
+
+# ローカルファイルヘッダーの固定長部分の形式と大きさ
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+_lock = threading.Lock()
+# アーカイブの絶対パスをキー、(更新時刻, サイズ)とメンバーの位置の辞書を値とするキャッシュ
+_indexes = {}
+
+
+def is_bundle(path):
+    """
+    パスがバンドルのファイルかどうかを返す。
+
+    引数:
+        path (str or pathlib.Path): ファイルのパス。
+
+    戻り値:
+        bool: zip形式のファイルの場合はTrue。
+    """
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+def member_path(archive, member):
+    """
+    バンドル内のメンバーを指すパスを作成する。
+
+    引数:
+        archive (str): バンドルのパス。
+        member (str): メンバー名。
+
+    戻り値:
+        str: 「アーカイブのパス!/メンバー名」形式のパス。
+    """
+    return f"{os.fspath(archive)}{SEPARATOR}{member}"
+
+
+def split_member_path(path):
+    """
+    バンドル内のメンバーを指すパスを、アーカイブのパスとメンバー名に分ける。
+
+    引数:
+        path (str): パス。
+
+    戻り値:
+        tuple or None: (アーカイブのパス, メンバー名)。バンドル内のメンバーを
+            指していない場合はNone。
+    """
+    archive, separator, member = path.partition(SEPARATOR)
+    if not separator or not member:
+        return None
+    return archive, member
+
+
+def _read_index(archive, signature):
+    """アーカイブのメンバーごとの(データの位置, 大きさ, 圧縮方式)を読み込む"""
+    members = {}
+    with open(archive, 'rb') as f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            # データはローカルファイルヘッダーの可変長部分の後に続く
+            f.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            if header[0] != _LOCAL_SIGNATURE:
+                raise zipfile.BadZipFile(f"{info.filename}のヘッダーが壊れています。")
+            offset = (info.header_offset + _LOCAL_HEADER.size +
+                      header[-2] + header[-1])
+            members[info.filename] = (offset, info.compress_size, info.compress_type)
+    return signature, members
+
+
+def bundle_members(archive):
+    """
+    バンドルのメンバーの一覧を返す。結果はファイルが変わるまで再利用する。
+
+    引数:
+        archive (str): バンドルのパス。
+
+    戻り値:
+        dict: メンバー名をキー、(データの位置, 大きさ, 圧縮方式)を値とする辞書。
+
+    例外:
+        OSError: ファイルを読み込めない場合。
+        zipfile.BadZipFile: zip形式として読めない場合。
+    """
+    key = os.path.abspath(archive)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    cached = _read_index(key, signature)
+    with _lock:
+        _indexes[key] = cached
+    return cached[1]
+
+
+def read_member(archive, member):
+    """
+    バンドルから1つのメンバーを読み込む。
+
+    無圧縮のメンバーはアーカイブをメモリマップし、その範囲だけを読む。
+
+    引数:
+        archive (str): バンドルのパス。
+        member (str): メンバー名。
+
+    戻り値:
+        bytes: メンバーの内容。
+
+    例外:
+        KeyError: メンバーが存在しない場合。
+        OSError: ファイルを読み込めない場合。
+    """
+    offset, size, compress_type = bundle_members(archive)[member]
+    if compress_type != zipfile.ZIP_STORED:
+        with zipfile.ZipFile(archive) as zf:
+            return zf.read(member)
+    if size == 0:
+        return b''
+    with open(archive, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return mapped[offset:offset + size]
+
+
+def read_image_bytes(path):
+    """
+    画像の内容を読み込む。バンドル内のメンバーを指すパスにも対応する。
+
+    引数:
+        path (str): 画像のパス。
+
+    戻り値:
+        bytes: 画像の内容。
+
+    例外:
+        OSError: ファイルを読み込めない場合。
+        KeyError: バンドル内にメンバーが存在しない場合。
+    """
+    location = split_member_path(path)
+    if location is not None:
+        return read_member(*location)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def resolve_images(archive, image_data):
+    """
+    シナリオの画像のパスを、バンドル内のメンバーを指すパスに置き換える。
+
+    バンドルに含まれない画像のパスはそのまま残す。
+
+    引数:
+        archive (str): バンドルのパス。
+        image_data (dict): シーンIDをキー、画像のパスを値とする辞書。
+
+    戻り値:
+        dict: 画像のパスを置き換えた辞書。
+    """
+    members = bundle_members(archive)
+    return {
+        scene_id: member_path(archive, path) if path in members else path
+        for scene_id, path in image_data.items()
+    }
+
+
+def extract_images(image_data, image_dir='images'):
+    """
+    バンドル内の画像をディレクトリに書き出し、画像データのパスを
+    書き出したファイルのパスに置き換える。
+
+    バンドルから開いたシナリオをscenario.tomlに保存する前に呼び出し、
+    scenario.tomlに記録する画像のパス（images/シーンID.拡張子）に
+    ファイルを用意する。バンドル内に見つからない画像はそのまま残す。
+
+    引数:
+        image_data (dict): シーンIDをキー、画像のパスを値とする辞書。
+            内容を直接書き換える。
+        image_dir (str, オプション): 画像を書き出すディレクトリ。
+
+    戻り値:
+        list: 書き出した画像のパスのリスト。
+
+    例外:
+        OSError: 画像を書き出せない場合。
+    """
+    extracted = []
+    for scene_id, path in list(image_data.items()):
+        location = split_member_path(path)
+        if location is None:
+            continue
+        try:
+            data = read_member(*location)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            continue
+        _, ext = os.path.splitext(location[1])
+        os.makedirs(image_dir, exist_ok=True)
+        target = os.path.join(image_dir, f"{scene_id}{ext}")
+        temp_path = target + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, target)
+        image_data[scene_id] = target
+        extracted.append(target)
+    return extracted
+
+
+@contextmanager
+def open_index(archive):
+    """
+    バンドルのシーンの一覧を、展開しながら行ごとに読めるファイルとして開く。
+
+    引数:
+        archive (str): バンドルのパス。
+
+    戻り値:
+        file: バイナリモードのファイルオブジェクトを返すコンテキストマネージャ。
+
+    例外:
+        KeyError: シーンの一覧が含まれていない場合。
+    """
+    with zipfile.ZipFile(archive) as zf, zf.open(INDEX_MEMBER) as index:
+        yield index
+
+
+def index_size(archive):
+    """
+    バンドルのシーンの一覧の展開後の大きさを返す。進捗の表示に使う。
+
+    引数:
+        archive (str): バンドルのパス。
+
+    戻り値:
+        int: 展開後のバイト数。
+    """
+    with zipfile.ZipFile(archive) as zf:
+        return zf.getinfo(INDEX_MEMBER).file_size
+
+
+def read_bundle(archive, progress=None):
+    """
+    バンドルからシーンの表とエッジの表を読み込む。
+
+    引数:
+        archive (str): バンドルのパス。
+        progress (callable, オプション): toml_export.import_toml_streamに渡す
+            進捗の通知先。
+
+    戻り値:
+        tuple: (シーンの表, エッジの表, 画像データの辞書,
+            読み飛ばしたテーブルの見出しのリスト)。画像データのパスは
+            バンドル内のメンバーを指す。
+    """
+    from toml_export import import_toml_stream
+
+    with open_index(archive) as index:
+        scenes, edges, image_data, skipped = import_toml_stream(index, progress)
+    return scenes, edges, resolve_images(archive, image_data), skipped
+
+
+def write_bundle(out, scenes, edges, image_data):
+    """
+    シナリオと画像をバンドルに書き出す。
+
+    シーンの一覧は圧縮し、画像は無圧縮で格納する。画像は
+    シーンの一覧に記録するパス（images/シーンID.拡張子）に格納する。
+
+    引数:
+        out (str or file): 出力先のパスまたはバイナリモードのファイル。
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): シーンIDをキー、画像のパスを値とする辞書。
+
+    戻り値:
+        int: 格納した画像の数。
+    """
+    from scene_model import clean_value
+    from toml_export import export_to_toml
+
+    scene_ids = {clean_value(scene_id) for scene_id in scenes['ID'].tolist()}
+    count = 0
+    with zipfile.ZipFile(out, 'w') as zf:
+        zf.writestr(
+            INDEX_MEMBER,
+            export_to_toml(scenes, edges, image_data),
+            compress_type=zipfile.ZIP_DEFLATED
+        )
+        for scene_id, path in image_data.items():
+            if scene_id not in scene_ids:
+                continue
+            _, ext = os.path.splitext(path)
+            try:
+                data = read_image_bytes(path)
+            except (OSError, KeyError):
+                # 見つからない画像は格納しない（TOMLには記録される）
+                continue
+            zf.writestr(
+                f"images/{scene_id}{ext}", data,
+                compress_type=zipfile.ZIP_STORED
+            )
+            count += 1
+    return count
+
+
+def export_bundle(scenes, edges, image_data):
+    """
+    シナリオと画像をバンドルのバイト列に変換する。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。
+
+    戻り値:
+        bytes: バンドルの内容。
+    """
+    buffer = io.BytesIO()
+    write_bundle(buffer, scenes, edges, image_data)
+    return buffer.getvalue()
+
+
+def main():
+    """コマンドラインからバンドルを作成、または内容を一覧表示する"""
+    parser = argparse.ArgumentParser(description="シナリオのバンドルを扱う")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack = subparsers.add_parser('pack', help="scenario.tomlと画像をバンドルにする")
+    pack.add_argument('scenario')
+    pack.add_argument('output')
+    listing = subparsers.add_parser('list', help="バンドルの内容を表示する")
+    listing.add_argument('bundle')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        from toml_export import import_toml_stream
+
+        # 画像のパスはscenario.tomlからの相対パスとして扱う
+        base = os.path.dirname(os.path.abspath(args.scenario))
+        with open(args.scenario, 'rb') as f:
+            scenes, edges, image_data, _ = import_toml_stream(f)
+        image_data = {
+            scene_id: os.path.join(base, path)
+            for scene_id, path in image_data.items()
+        }
+        count = write_bundle(args.output, scenes, edges, image_data)
+        print(f"{len(scenes)}シーン、{count}枚の画像を{args.output}に書き出しました。")
+    else:
+        for name, (offset, size, compress_type) in bundle_members(args.bundle).items():
+            method = '無圧縮' if compress_type == zipfile.ZIP_STORED else '圧縮'
+            print(f"{name}\t{size}\t{method}\t@{offset}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,11 @@
 キャラクターの統計生成、管理、ダイスロール、メモ機能を提供するモジュール。
 """
 
-import random
 import streamlit as st
-import toml
-from pathlib import Path
+
+from play_state import dice_rng
+from playthrough import record_event
+from settings import get_setting
 
 
 def load_settings():
@@ -18,27 +19,23 @@ def load_settings():
     戻り値:
         bool: 恐怖値メカニクスが有効かどうか。
     """
-    try:
-        settings_path = Path('settings.toml')
-        if settings_path.exists():
-            settings = toml.load(settings_path)
-            return settings.get('show_fear', False)
-    except Exception:
-        pass
-    return False
+    return bool(get_setting('show_fear', False))
 
 
 def roll_dice(num_dice=2):
     """
     指定された数のサイコロを振る。
 
+    出目はセッションの乱数シードから決まり、セーブデータから復元できる。
+
     引数:
         num_dice (int, オプション): 振るサイコロの数。デフォルトは2。
 
     戻り値:
         list: サイコロロールの結果のリスト。
     """
-    return [random.randint(1, 6) for _ in range(num_dice)]
+    rng = dice_rng()
+    return [rng.randint(1, 6) for _ in range(num_dice)]
 
 
 def generate_initial_stats():
@@ -124,18 +121,21 @@ def show_character_management():
     if st.button("能力値を決定"):
         stats, _ = generate_initial_stats()
         st.session_state.character.update(stats)
+        record_event('stats', stats)
 
 
-def modify_stat(stat_name, value):
+def apply_stat_change(char, stat_name, value):
     """
     定められた制約内でキャラクターの能力値を変更する。
 
     引数:
+        char (dict): キャラクター情報の辞書。
         stat_name (str): 変更する能力値の名前。
         value (int): 現在の能力値に加える値。
-    """
-    char = st.session_state.character
 
+    戻り値:
+        int: 変更後の能力値。
+    """
     if stat_name == 'fear':
         # 恐怖値は0から最大値の間で変動
         new_value = max(0, min(char['fear']['max'], char['fear']['current'] + value))
@@ -147,11 +147,27 @@ def modify_stat(stat_name, value):
         # 値が0未満にならないようにする
         new_value = max(0, new_value)
         char[stat_name]['current'] = new_value
+    return new_value
+
 
+def modify_stat(stat_name, value):
+    """
+    セッションのキャラクターの能力値を変更し、プレイの記録に残す。
 
+    引数:
+        stat_name (str): 変更する能力値の名前。
+        value (int): 現在の能力値に加える値。
+    """
+    new_value = apply_stat_change(st.session_state.character, stat_name, value)
+    record_event('stat', stat_name, value, new_value)
+
+
+@st.fragment
 def show_character_stats():
     """
     キャラクターの能力値を表示し、変更を可能にする。
+
+    フラグメントとして実行されるため、能力値の変更ではこの部分のみが再描画される。
     """
     # キャラクターの初期化
     initialize_character_if_needed()
@@ -186,18 +202,27 @@ def show_character_stats():
             # 能力値変更ボタンの作成
             col1, col2 = st.columns(2)
             with col1:
-                if st.button("-1", key=f"dec_{stat_name}"):
-                    modify_stat(stat_name, -1)
-                    st.rerun()
+                st.button(
+                    "-1",
+                    key=f"dec_{stat_name}",
+                    on_click=modify_stat,
+                    args=(stat_name, -1)
+                )
             with col2:
-                if st.button("+1", key=f"inc_{stat_name}"):
-                    modify_stat(stat_name, 1)
-                    st.rerun()
+                st.button(
+                    "+1",
+                    key=f"inc_{stat_name}",
+                    on_click=modify_stat,
+                    args=(stat_name, 1)
+                )
 
 
+@st.fragment
 def show_notes():
     """
     所持品とヒントの統合メモ機能を表示する。
+
+    フラグメントとして実行されるため、メモの編集ではこの部分のみが再描画される。
     """
     # キャラクターの初期化
     initialize_character_if_needed()
@@ -215,9 +240,12 @@ def show_notes():
     )
 
 
+@st.fragment
 def show_dice_controls():
     """
     ゲームプレイ用のダイスロールコントロールを表示する。
+
+    フラグメントとして実行されるため、ダイスロールではこの部分のみが再描画される。
     """
     # キャラクターの初期化
     initialize_character_if_needed()
@@ -232,6 +260,7 @@ def show_dice_controls():
         if st.button("戦闘ロール (2d6)"):
             rolls = roll_dice()
             total = sum(rolls)
+            record_event('dice', 'combat', rolls)
             st.write(f"🎲 {rolls[0]} + {rolls[1]} = {total}")
 
     with col2:
@@ -240,9 +269,11 @@ def show_dice_controls():
             total = sum(rolls)
             current_luck = char['luck']['current']
             result = "成功！" if total <= current_luck else "失敗..."
+            record_event('dice', 'luck', rolls)
             st.write(f"🎲 {rolls[0]} + {rolls[1]} = {total} ({result})")
 
     with col3:
         if st.button("d6を振る"):
-            roll = random.randint(1, 6)
+            roll = roll_dice(1)[0]
+            record_event('dice', 'd6', [roll])
             st.write(f"🎲 {roll}")
\ No newline at end of file
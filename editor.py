@@ -5,11 +5,47 @@
 シーンの編集、画像管理、TOMLエクスポート機能を実装する。
 """
 
+import io
+import math
 import os
 import re
+import threading
+import pandas as pd
 import streamlit as st
 
-from toml_export import export_to_toml, import_from_toml
+from bundle import (
+    export_bundle,
+    extract_images,
+    index_size,
+    read_bundle,
+    split_member_path
+)
+from html_export import write_html
+from image_cache import invalidate_image, load_image
+from profiling import timed, timer
+from link_index import incoming_links
+from scenario_loader import is_loading
+from scenario_watcher import file_digest, set_scenario_source
+from scenario_state import (
+    get_choice_map,
+    get_link_index,
+    get_search_index,
+    rename_scene_id,
+    replace_scenario_data
+)
+from scene_model import (
+    SCENE_COLUMNS,
+    clean_value,
+    from_flat,
+    memory_report,
+    to_flat
+)
+from search_index import build_index, search
+from settings import get_setting
+from toml_export import export_to_toml, import_toml_stream
+
+# データエディターに一度に表示する行数の選択肢
+PAGE_SIZES = [50, 100, 500, 1000]
 
 
 def get_svg_dimensions(svg_content):
@@ -64,6 +100,7 @@ def save_image(image_file, scene_id):
         # 画像の保存
         with open(image_path, "wb") as f:
             f.write(image_file.getvalue())
+        invalidate_image(image_path)
 
         return image_path
     except Exception as e:
@@ -71,27 +108,351 @@ def save_image(image_file, scene_id):
         return None
 
 
-def save_scenario_toml(df, image_data):
+def save_bundle(bundle_file):
+    """
+    アップロードされたバンドルを保存し、パスを返す。
+
+    バンドル内の画像はアーカイブから直接読み込むため、展開せずに保存する。
+    ファイル名には内容のハッシュを含め、別のセッションが同じ名前のファイルを
+    アップロードしても上書きしないようにする。同じ内容のバンドルが
+    保存済みの場合はそのパスを返す。
+
+    引数:
+        bundle_file (UploadedFile): アップロードされたバンドル。
+
+    戻り値:
+        str: 保存されたバンドルのパス。
+    """
+    data = bundle_file.getvalue()
+    stem, ext = os.path.splitext(os.path.basename(bundle_file.name))
+    bundle_dir = get_setting('bundle_dir', 'bundles')
+    os.makedirs(bundle_dir, exist_ok=True)
+    bundle_path = os.path.join(
+        bundle_dir, f"{stem}-{file_digest(data)[:16]}{ext}"
+    )
+    if os.path.exists(bundle_path):
+        return bundle_path
+    temp_path = f"{bundle_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, bundle_path)
+    return bundle_path
+
+
+def save_scenario_toml(df, edges, image_data, choices_map=None):
     """
     シナリオをTOMLファイルに保存する。
 
+    バンドル内の画像はimagesディレクトリに書き出し、画像データのパスを
+    書き出したファイルに置き換えてから保存する。scenario.tomlには
+    images/シーンID.拡張子のパスを記録するため、バンドルを参照したままでは
+    次回の起動時や外部の編集の反映時に画像が見つからなくなる。
+
+    保存した内容はセッションの読み込み元として記録し、自分の保存を
+    外部の編集として反映し直さないようにする。
+
     引数:
-        df (pandas.DataFrame): シーンデータを含むデータフレーム。
-        image_data (dict): 画像データの辞書。
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。バンドル内の画像のパスは
+            書き換える。
+        choices_map (dict, オプション): エッジの表に対応するシーンごとの
+            選択肢の一覧。セッションのシナリオを保存する場合に指定する。
 
     戻り値:
         bool: 保存が成功したかどうか。
     """
     try:
-        toml_string = export_to_toml(df, image_data)
-        with open("scenario.toml", "w", encoding='utf-8') as f:
-            f.write(toml_string)
+        for image_path in extract_images(image_data):
+            invalidate_image(image_path)
+        toml_bytes = export_to_toml(
+            df, edges, image_data, choices_map
+        ).encode('utf-8')
+        with open("scenario.toml", "wb") as f:
+            f.write(toml_bytes)
+        set_scenario_source("scenario.toml", file_digest(toml_bytes))
         return True
     except Exception as e:
         st.error(f"TOMLファイルの保存中にエラーが発生しました: {str(e)}")
         return False
 
 
+def export_gamebook_html(df, edges, image_data, show_fear=False):
+    """
+    シナリオを画像を埋め込んだ静的なHTMLに変換する。
+
+    ダウンロードのボタンからスクリプトのスレッドの外で呼び出されるため、
+    セッションの状態は参照せず、必要な値は引数で受け取る。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。
+        show_fear (bool, オプション): 恐怖値メカニクスを有効にするかどうか。
+
+    戻り値:
+        bytes: UTF-8のHTML。
+    """
+    out = io.StringIO()
+    write_html(out, df, edges, image_data, show_fear=show_fear)
+    return out.getvalue().encode('utf-8')
+
+
+def find_dangling_links(df, edges):
+    """
+    存在しないシーンを遷移先に持つ行を検出する。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+
+    戻り値:
+        pandas.Series: リンク切れの遷移先を持つ行がTrueの真偽値のSeries。
+    """
+    destinations = edges['destination'].fillna('').str.strip()
+    broken = (destinations != '') & ~destinations.isin(df['ID'])
+    return df['ID'].isin(edges.loc[broken, 'source'])
+
+
+def filter_scenes(df, edges, id_prefix='', text='', dangling_only=False,
+                  search_index=None):
+    """
+    条件に一致するシーンの行を選択する。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        id_prefix (str, オプション): シーンIDの前方一致条件。
+        text (str, オプション): ストーリーと選択肢の検索語。
+        dangling_only (bool, オプション): リンク切れのある行のみを選択するかどうか。
+        search_index (dict, オプション): textの検索に使う全文検索インデックス。
+            Noneの場合はdf、edgesから構築する。
+
+    戻り値:
+        pandas.Series: 条件に一致する行がTrueの真偽値のSeries。
+    """
+    mask = pd.Series(True, index=df.index)
+    if id_prefix:
+        mask &= df['ID'].str.startswith(id_prefix).fillna(False)
+    if text:
+        if search_index is None:
+            search_index = build_index(df, edges)
+        matched_ids = search(search_index, text)
+        mask &= df['ID'].isin(matched_ids)
+    if dangling_only:
+        mask &= find_dangling_links(df, edges)
+    return mask
+
+
+def merge_edited_rows(df, edges, window, edited_window):
+    """
+    データエディターで編集した行を元のシーンの表とエッジの表に反映する。
+
+    表示中の行は元のインデックスで対応付けるため、シーンIDの変更も反映される。
+    表示中の範囲から消えた行は削除し、追加された行は末尾に加える。
+    追加された行のシーンIDが表示範囲外の既存シーンと一致する場合は、
+    そのシーンを上書きする。編集した行の選択肢は全て新しいエッジに置き換える。
+
+    引数:
+        df (pandas.DataFrame): 全シーンの表。
+        edges (pandas.DataFrame): 全選択肢のエッジの表。
+        window (pandas.DataFrame): データエディターに渡したシーンの行。
+        edited_window (pandas.DataFrame): データエディターが返した平坦な表。
+
+    戻り値:
+        tuple: 編集内容を反映した(シーンの表, エッジの表)。
+    """
+    edited_scenes, edited_edges = from_flat(edited_window)
+
+    existing = edited_scenes.index.isin(window.index)
+    updated_rows = edited_scenes[existing]
+    new_rows = edited_scenes[~existing]
+
+    removed = window.index.difference(updated_rows.index)
+    merged = df.drop(index=removed)
+    merged.loc[updated_rows.index, SCENE_COLUMNS] = updated_rows
+
+    # 表示中の行と、上書きされる表示範囲外の行の選択肢を置き換える
+    replaced_ids = {clean_value(value) for value in window['ID'].tolist()}
+    replaced_ids.update(edited_scenes['ID'].tolist())
+
+    if not new_rows.empty:
+        outside = ~merged.index.isin(updated_rows.index)
+        merged = merged[~(outside & merged['ID'].isin(new_rows['ID']))]
+
+        start = (df.index.max() + 1) if len(df.index) else 0
+        new_rows = new_rows.set_axis(
+            pd.RangeIndex(start, start + len(new_rows))
+        )
+        merged = pd.concat([merged, new_rows])
+
+    kept_edges = edges[~edges['source'].isin(replaced_ids)]
+    start = (edges.index.max() + 1) if len(edges.index) else 0
+    edited_edges = edited_edges.set_axis(
+        pd.RangeIndex(start, start + len(edited_edges))
+    )
+    return merged, pd.concat([kept_edges, edited_edges])
+
+
+def show_scene_window(df, edges):
+    """
+    検索条件とページを選択し、該当する行だけをデータエディターに表示する。
+
+    データエディターには選択肢を列に展開した平坦な表を渡す。
+    選択肢を追加できるよう、常に空の選択肢の列を1つ加える。
+
+    引数:
+        df (pandas.DataFrame): 全シーンの表。
+        edges (pandas.DataFrame): 全選択肢のエッジの表。
+
+    戻り値:
+        tuple: データエディターに渡したシーンの行と、編集後の平坦な表。
+    """
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        id_prefix = st.text_input("シーンID（前方一致）", key="filter_id_prefix")
+    with col2:
+        text = st.text_input(
+            "ストーリー・選択肢を検索",
+            key="filter_text",
+            help="空白区切りでAND検索、\"...\"でフレーズ検索、末尾の*で前方一致"
+        )
+    with col3:
+        dangling_only = st.checkbox("リンク切れのみ", key="filter_dangling")
+
+    index = get_search_index() if text else None
+    matched = df[filter_scenes(df, edges, id_prefix, text, dangling_only, index)]
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox("表示件数", PAGE_SIZES, index=1, key="page_size")
+    num_pages = max(1, math.ceil(len(matched) / page_size))
+    with col2:
+        page = st.number_input(
+            "ページ", min_value=1, max_value=num_pages, value=1, key="page"
+        )
+    with col3:
+        st.caption(f"{len(matched)} / {len(df)} シーン（{num_pages}ページ）")
+
+    start = (min(page, num_pages) - 1) * page_size
+    window = matched.iloc[start:start + page_size]
+
+    # 表示範囲やデータが変わったら編集状態を破棄する
+    revision = st.session_state.get('data_revision', 0)
+    editor_key = (
+        f"scene_editor_{revision}_{id_prefix}_{text}_"
+        f"{dangling_only}_{page_size}_{page}"
+    )
+    edited_window = st.data_editor(
+        to_flat(window, edges),
+        use_container_width=True,
+        num_rows="dynamic",
+        height=300,
+        key=editor_key
+    )
+    return window, edited_window
+
+
+def rename_scene_image(old_id, new_id):
+    """
+    シーンIDの変更に合わせて画像ファイルと画像データを更新する。
+
+    引数:
+        old_id (str): 変更前のシーンID。
+        new_id (str): 変更後のシーンID。
+    """
+    image_path = st.session_state.image_data.pop(old_id, None)
+    if image_path is None:
+        return
+
+    if os.path.exists(image_path):
+        _, ext = os.path.splitext(image_path)
+        new_path = os.path.join(os.path.dirname(image_path), f"{new_id}{ext}")
+        os.replace(image_path, new_path)
+        invalidate_image(image_path)
+        invalidate_image(new_path)
+        image_path = new_path
+    st.session_state.image_data[new_id] = image_path
+
+
+def _rename_scene_callback():
+    """シーンIDの変更ボタンのコールバック"""
+    old_id = st.session_state.link_scene_id.strip()
+    new_id = st.session_state.rename_new_id.strip()
+    try:
+        count = rename_scene_id(old_id, new_id)
+        rename_scene_image(old_id, new_id)
+    except (ValueError, OSError) as e:
+        st.session_state.link_message = ('error', str(e))
+        return
+
+    st.session_state.link_scene_id = new_id
+    st.session_state.rename_new_id = ''
+    message = f"シーンIDを {new_id} に変更し、{count}件の遷移先を更新しました。"
+    # IDを変更したらscenario.tomlにも自動保存
+    if save_scenario_toml(
+        st.session_state.data,
+        st.session_state.edges,
+        st.session_state.image_data,
+        get_choice_map()
+    ):
+        st.session_state.link_message = ('success', message)
+    else:
+        st.session_state.link_message = (
+            'warning', message + "scenario.tomlの保存には失敗しました。"
+        )
+
+
+def show_link_panel():
+    """
+    シーンを遷移先とする選択肢の一覧と、シーンIDの変更機能を表示する。
+    """
+    col1, col2 = st.columns(2)
+    with col1:
+        scene_id = st.text_input("シーンID", key="link_scene_id").strip()
+    with col2:
+        st.text_input("新しいシーンID", key="rename_new_id")
+
+    message = st.session_state.pop('link_message', None)
+    if message is not None:
+        level, text = message
+        getattr(st, level)(text)
+
+    if not scene_id:
+        return
+
+    edges = st.session_state.edges
+    index = get_link_index()
+    if scene_id not in index['rows']:
+        st.warning(f"シーン {scene_id} は存在しません。")
+
+    links = incoming_links(index, scene_id)
+    if links:
+        st.write(f"シーン {scene_id} へのリンク（{len(links)}件）")
+        st.dataframe(
+            [
+                {
+                    '参照元のシーン': source,
+                    '選択肢': order,
+                    '選択肢のテキスト': clean_value(edges.at[label, 'label']),
+                }
+                for source, label, order in links
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("このシーンを遷移先とする選択肢はありません。")
+
+    st.button(
+        "シーンIDを変更",
+        key="rename_scene",
+        on_click=_rename_scene_callback,
+        disabled=scene_id not in index['rows']
+    )
+
+
+@timed('show_editor_tab')
 def show_editor_tab():
     """
     シーン編集タブを表示する。
@@ -99,38 +460,84 @@ def show_editor_tab():
     TOMLファイルのインポート、データエディター、
     画像管理、エクスポート機能を提供する。
     """
-    # TOMLファイルのインポート
+    if is_loading():
+        st.info("シナリオを読み込んでいます。読み込みが終わると編集できます。")
+        return
+
+    # TOMLファイルまたはバンドル（画像を含むzip）のインポート
     uploaded_file = st.file_uploader(
-        "TOMLファイルをインポート", 
-        type=['toml']
+        "TOMLファイルまたはバンドルをインポート", 
+        type=['toml', 'zip']
     )
-    if uploaded_file is not None:
+    # 同じファイルを再実行のたびに読み込み直さないようにする
+    if (uploaded_file is not None and
+            st.session_state.get('imported_file_id') != uploaded_file.file_id):
         try:
-            toml_content = uploaded_file.read().decode('utf-8')
-            df, image_data = import_from_toml(toml_content)
-            if df is not None:
-                st.session_state.data = df
-                st.session_state.image_data.update(image_data)
-                st.success("TOMLファイルを正常にインポートしました！")
+            # テーブルごとに読み込み、進捗を表示する
+            progress_bar = st.progress(0.0, text="TOMLファイルを読み込んでいます...")
+            if uploaded_file.name.lower().endswith('.zip'):
+                bundle_path = save_bundle(uploaded_file)
+                total = index_size(bundle_path)
+            else:
+                bundle_path = None
+                total = uploaded_file.size
+
+            def show_progress(position, state):
+                progress_bar.progress(
+                    min(position / max(total, 1), 1.0),
+                    text=f"TOMLファイルを読み込んでいます...（{len(state['ids'])}シーン）"
+                )
+
+            if bundle_path is not None:
+                df, edges, image_data, skipped = read_bundle(
+                    bundle_path, show_progress
+                )
+            else:
+                uploaded_file.seek(0)
+                df, edges, image_data, skipped = import_toml_stream(
+                    uploaded_file, show_progress
+                )
+            progress_bar.empty()
+            replace_scenario_data(df, edges)
+            st.session_state.image_data.update(image_data)
+            # scenario.tomlとは別のシナリオのため、保存するまで外部の編集を反映しない
+            set_scenario_source(None)
+            st.session_state.imported_file_id = uploaded_file.file_id
+            st.success("TOMLファイルを正常にインポートしました！")
+            if skipped:
+                st.warning(
+                    f"読み込めないシーンを{len(skipped)}件読み飛ばしました: "
+                    + ", ".join(str(scene_id) for scene_id in skipped[:20])
+                )
         except Exception as e:
             st.error(f"TOMLファイルの読み込みに失敗しました: {str(e)}")
 
-    # データエディター
-    edited_df = st.data_editor(
-        st.session_state.data,
-        use_container_width=True,
-        num_rows="dynamic",
-        height=300
-    )
+    # データエディター（選択中の範囲のみを表示）
+    data = st.session_state.data
+    edges = st.session_state.edges
+    window, edited_window = show_scene_window(data, edges)
+
+    def edited_scenario():
+        """編集中の行を反映した(シーンの表, エッジの表)を返す"""
+        return merge_edited_rows(data, edges, window, edited_window)
 
     # 保存とエクスポートボタン
     col1, col2 = st.columns(2)
 
     with col1:
         if st.button("編集内容を反映"):
-            st.session_state.data = edited_df
+            edited_df, edited_edges = edited_scenario()
+            replace_scenario_data(
+                edited_df, edited_edges, window.index.union(edited_window.index)
+            )
             # 編集内容を反映したらscenario.tomlにも自動保存
-            if save_scenario_toml(edited_df, st.session_state.image_data):
+            # （選択肢の一覧は変更されたシーンだけ更新済みのものを使う）
+            if save_scenario_toml(
+                st.session_state.data,
+                st.session_state.edges,
+                st.session_state.image_data,
+                get_choice_map()
+            ):
                 st.success("データが更新され、scenario.tomlに保存されました！")
             else:
                 st.warning(
@@ -139,24 +546,59 @@ def show_editor_tab():
 
     with col2:
         try:
-            toml_string = export_to_toml(
-                edited_df, 
-                st.session_state.image_data
-            )
+            # TOMLはダウンロード時にのみ生成する
+            image_data = st.session_state.image_data
             st.download_button(
                 label="TOMLファイルをダウンロード",
-                data=toml_string,
+                data=lambda: export_to_toml(*edited_scenario(), image_data),
                 file_name="scenario.toml",
                 mime="application/toml"
             )
         except Exception as e:
             st.error(f"TOMLの生成に失敗しました: {str(e)}")
 
+        # 静的ファイルとして配信できるHTML版のゲームブック
+        # 恐怖値の設定はセッションを参照できるここで決めておく
+        # （ゲームプレイのタブを開く前は設定ファイルの値を使う）
+        show_fear = bool(st.session_state.get(
+            'show_fear', get_setting('show_fear', False)
+        ))
+        st.download_button(
+            label="HTMLゲームブックをダウンロード",
+            data=lambda: export_gamebook_html(
+                *edited_scenario(), image_data, show_fear
+            ),
+            file_name="gamebook.html",
+            mime="text/html"
+        )
+
+        # シナリオと画像をまとめた1つのファイル
+        st.download_button(
+            label="バンドル（画像を含むzip）をダウンロード",
+            data=lambda: export_bundle(*edited_scenario(), image_data),
+            file_name="scenario.zip",
+            mime="application/zip"
+        )
+
+    # リンク管理セクション
+    with st.expander("リンク管理（参照元の確認・シーンIDの変更）"):
+        show_link_panel()
+
+    with st.expander("メモリ使用量"):
+        if st.button("列ごとのメモリ使用量を集計"):
+            report = pd.DataFrame(memory_report(data, edges))
+            report['MB'] = report['bytes'] / 2**20
+            st.dataframe(report, hide_index=True)
+
     # 画像管理セクション
     st.subheader("画像管理")
+    window_ids = [
+        str(scene_id) for scene_id in edited_window['ID'].dropna().tolist()
+        if str(scene_id).strip()
+    ]
     selected_scene = st.selectbox(
-        "画像を追加するシーンを選択",
-        options=[row['ID'] for _, row in edited_df.iterrows() if row['ID']]
+        "画像を追加するシーンを選択（表示中のシーン）",
+        options=window_ids
     )
 
     if selected_scene:
@@ -171,7 +613,9 @@ def show_editor_tab():
             if saved_path:
                 st.session_state.image_data[selected_scene] = saved_path
                 # 画像を追加したらscenario.tomlにも自動保存
-                if save_scenario_toml(edited_df, st.session_state.image_data):
+                if save_scenario_toml(
+                    *edited_scenario(), st.session_state.image_data
+                ):
                     st.success("画像が追加され、scenario.tomlに保存されました！")
                 else:
                     st.warning(
@@ -187,39 +631,41 @@ def show_editor_tab():
         ):
             with cols[i % 3]:
                 try:
-                    if os.path.exists(image_path):
-                        if image_path.lower().endswith('.svg'):
-                            with open(image_path, 'r', encoding='utf-8') as f:
-                                svg_content = f.read()
-                                # SVGのサイズを取得
-                                width, height = get_svg_dimensions(svg_content)
-                                
-                                # アスペクト比を維持しながら表示サイズを調整
-                                container_width = 300  # コンテナの幅
-                                scale = container_width / width
-                                display_height = int(height * scale)
-
-                                # SVGを包むdivスタイルを設定
-                                wrapper_style = f"""
-                                    <div style="width: {container_width}px; 
-                                               height: {display_height}px; 
-                                               overflow: hidden;">
-                                        <div style="width: 100%; 
-                                                  height: 100%; 
-                                                  display: flex; 
-                                                  justify-content: center; 
-                                                  align-items: center;">
-                                            {svg_content}
-                                        </div>
+                    # ファイルとバンドル内の画像のどちらもキャッシュ経由で読み込む
+                    with timer('image_load'):
+                        image = load_image(image_path)
+                    if image is not None:
+                        if image['svg']:
+                            svg_content = image['content']
+                            # SVGのサイズを取得
+                            width, height = image['size']
+                            
+                            # アスペクト比を維持しながら表示サイズを調整
+                            container_width = 300  # コンテナの幅
+                            scale = container_width / width
+                            display_height = int(height * scale)
+
+                            # SVGを包むdivスタイルを設定
+                            wrapper_style = f"""
+                                <div style="width: {container_width}px; 
+                                           height: {display_height}px; 
+                                           overflow: hidden;">
+                                    <div style="width: 100%; 
+                                              height: 100%; 
+                                              display: flex; 
+                                              justify-content: center; 
+                                              align-items: center;">
+                                        {svg_content}
                                     </div>
-                                """
-                                st.components.v1.html(
-                                    wrapper_style, 
-                                    height=display_height
-                                )
+                                </div>
+                            """
+                            st.components.v1.html(
+                                wrapper_style, 
+                                height=display_height
+                            )
                         else:
                             st.image(
-                                image_path, 
+                                image['content'], 
                                 caption=f"シーン {scene_id}", 
                                 use_container_width=True
                             )
@@ -228,11 +674,14 @@ def show_editor_tab():
                             f"削除 (シーン {scene_id})", 
                             key=f"del_{scene_id}"
                         ):
-                            os.remove(image_path)
+                            # バンドル内の画像はアーカイブを変更せず、参照だけを外す
+                            if split_member_path(image_path) is None:
+                                os.remove(image_path)
+                            invalidate_image(image_path)
                             del st.session_state.image_data[scene_id]
                             # 画像を削除したらscenario.tomlにも自動保存
                             if save_scenario_toml(
-                                edited_df, 
+                                *edited_scenario(), 
                                 st.session_state.image_data
                             ):
                                 st.success(
@@ -14,9 +14,12 @@ from character_sheet import (
     show_dice_controls,
     show_notes
 )
+from play_state import show_path_navigator, show_play_controls
+from profiling import timed
 from story_viewer import show_story_view
 
 
+@timed('show_gameplay_tab')
 def show_gameplay_tab():
     """
     ゲームプレイタブを表示する。
@@ -26,6 +29,7 @@ def show_gameplay_tab():
     - キャラクター統計
     - ダイスコントロール
     - メモ
+    - 巻き戻しとセーブ・ロード
     - ストーリービュー
 
     JavaScriptを使用してページトップにスクロールする機能も含む。
@@ -38,6 +42,9 @@ def show_gameplay_tab():
 
         st.divider()
 
+        show_play_controls()
+        with st.expander("シーンへジャンプ（作者向け）"):
+            show_path_navigator('play_nav')
         show_story_view()
 
         # JavaScriptを使用してページトップへスクロール
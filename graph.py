@@ -6,6 +6,19 @@ import graphviz
 import streamlit as st
 import pandas as pd
 
+from play_state import show_path_navigator
+from profiling import timed
+from telemetry import scene_heat
+
+# ヒートマップの最も訪問回数の多いシーンの色（RGB）
+HEAT_COLOR = (230, 85, 13)
+
+# ヒートマップの訪問回数が0のシーンの色（lightgray）
+BASE_COLOR = (211, 211, 211)
+
+# ヒートマップで最も通過回数の多い選択肢の線の太さ
+MAX_PENWIDTH = 6.0
+
 def process_value(value) -> str:
     """DataFrameの値を適切な文字列に変換する
 
@@ -19,15 +32,37 @@ def process_value(value) -> str:
         return ""
     return str(value).strip()
 
-def create_scene_graph(data: pd.DataFrame) -> graphviz.Digraph:
+def heat_color(ratio: float) -> str:
+    """訪問回数の割合をノードの塗りつぶしの色に変換する
+
+    Args:
+        ratio (float): 最大の訪問回数に対する割合（0から1）
+
+    Returns:
+        str: '#rrggbb'形式の色
+    """
+    return '#' + ''.join(
+        f"{round(base + (heat - base) * ratio):02x}"
+        for base, heat in zip(BASE_COLOR, HEAT_COLOR)
+    )
+
+def create_scene_graph(data: pd.DataFrame, edges: pd.DataFrame,
+                       heat: tuple = None) -> graphviz.Digraph:
     """シーン関係図を生成する
 
     Args:
         data (pd.DataFrame): シーンデータを含むDataFrame
+        edges (pd.DataFrame): 選択肢のエッジを含むDataFrame
+        heat (tuple, optional): シーンIDごとの訪問回数と、(遷移元, 遷移先)ごとの
+            通過回数の辞書のタプル。指定するとノードの色とエッジの太さで表示する
 
     Returns:
         graphviz.Digraph: 生成されたグラフ
     """
+    visits, traversals = heat if heat is not None else ({}, {})
+    max_visits = max(visits.values(), default=0)
+    max_traversals = max(traversals.values(), default=0)
+
     # グラフの基本設定
     graph = graphviz.Digraph()
     graph.attr(
@@ -54,54 +89,63 @@ def create_scene_graph(data: pd.DataFrame) -> graphviz.Digraph:
         len='1.5'
     )
 
-    # 有効なシーンIDを収集
-    valid_scenes = set()
-    destination_scenes = set()
-
-    # まず全ての有効なシーンIDとその遷移先を収集
-    for _, row in data.iterrows():
-        scene_id = process_value(row['ID'])
-        if not scene_id:
-            continue
-        
-        valid_scenes.add(scene_id)
-        
-        # 遷移先を収集
-        for i in range(1, 4):  # 選択肢1から3まで
-            dest = process_value(row[f'選択{i}遷移先'])
-            if dest:
-                destination_scenes.add(dest)
+    # 有効なシーンIDとストーリーを収集（同じIDが複数ある場合は最初の行を使用）
+    stories = {}
+    for scene_id, story in zip(data['ID'].tolist(), data['ストーリー'].tolist()):
+        scene_id = process_value(scene_id)
+        if scene_id and scene_id not in stories:
+            stories[scene_id] = process_value(story)
+
+    # 有効なシーンから出ている選択肢とその遷移先を収集
+    ordered = edges.sort_values('order', kind='stable')
+    scene_edges = [
+        (source, process_value(choice), process_value(dest))
+        for source, choice, dest in zip(
+            ordered['source'].tolist(),
+            ordered['label'].tolist(),
+            ordered['destination'].tolist()
+        )
+        if source in stories
+    ]
+    destination_scenes = {dest for _, _, dest in scene_edges if dest}
 
     # 全ての関連シーンのノードを作成
-    all_scenes = valid_scenes.union(destination_scenes)
+    all_scenes = set(stories).union(destination_scenes)
     for scene_id in all_scenes:
-        # シーンIDに対応するデータを探す
-        scene_data = data[data['ID'].astype(str).str.strip() == scene_id]
-        
-        if not scene_data.empty:
+        if scene_id in stories:
             # ストーリーテキストの準備
-            story = process_value(scene_data.iloc[0]['ストーリー'])
+            story = stories[scene_id]
             story_preview = story[:20] + "..." if len(story) > 20 else story
             label = f"{scene_id}\n{story_preview}"
         else:
             # データが見つからない場合
             label = f"{scene_id}\n(未定義のシーン)"
-            
-        graph.node(scene_id, label)
-
-    # エッジの作成
-    for _, row in data.iterrows():
-        scene_id = process_value(row['ID'])
-        if not scene_id:
-            continue
 
-        # 各選択肢についてエッジを追加
-        for i in range(1, 4):
-            choice = process_value(row[f'選択{i}'])
-            dest = process_value(row[f'選択{i}遷移先'])
-
-            if choice and dest:
-                choice_preview = choice[:15] + "..." if len(choice) > 15 else choice
+        if max_visits:
+            count = visits.get(scene_id, 0)
+            graph.node(
+                scene_id, label,
+                fillcolor=heat_color(count / max_visits),
+                tooltip=f"訪問回数: {count}"
+            )
+        else:
+            graph.node(scene_id, label)
+
+    # 各選択肢についてエッジを追加
+    for scene_id, choice, dest in scene_edges:
+        if choice and dest:
+            choice_preview = choice[:15] + "..." if len(choice) > 15 else choice
+            if max_traversals:
+                count = traversals.get((scene_id, dest), 0)
+                penwidth = 1 + (MAX_PENWIDTH - 1) * count / max_traversals
+                graph.edge(
+                    scene_id,
+                    dest,
+                    choice_preview,
+                    tooltip=f"{choice}（通過回数: {count}）",
+                    penwidth=f"{penwidth:.2f}"
+                )
+            else:
                 graph.edge(
                     scene_id,
                     dest,
@@ -111,6 +155,7 @@ def create_scene_graph(data: pd.DataFrame) -> graphviz.Digraph:
 
     return graph
 
+@timed('show_graph_tab')
 def show_graph_tab():
     """シーン関係図タブの表示"""
     try:
@@ -121,9 +166,26 @@ def show_graph_tab():
             st.error("シナリオデータが読み込まれていません。")
             return
             
-        # グラフの生成と表示
-        graph = create_scene_graph(st.session_state.data)
+        show_heat = st.toggle(
+            "訪問回数をヒートマップで表示", key="show_scene_heat"
+        )
+
+        # グラフの生成と表示（データと集計が変わるまで生成済みのグラフを再利用）
+        data = st.session_state.data
+        revision = st.session_state.get('data_revision', 0)
+        heat = scene_heat() if show_heat else None
+        cached = st.session_state.get('scene_graph_cache')
+        if (cached is not None and cached[0] is data and
+                cached[1] == revision and cached[2] == heat):
+            graph = cached[3]
+        else:
+            graph = create_scene_graph(data, st.session_state.edges, heat)
+            st.session_state.scene_graph_cache = (data, revision, heat, graph)
         st.graphviz_chart(graph)
+
+        with st.expander("シーンへの経路とジャンプ"):
+            st.caption("ジャンプすると「ゲームブックを遊ぶ」タブの現在のシーンが変わります。")
+            show_path_navigator('graph_nav')
         
         # 使用方法の説明
         with st.expander("グラフの見方"):
@@ -132,6 +194,7 @@ def show_graph_tab():
             - 各ノードはシーンを表し、シーンIDとストーリーの冒頭を表示しています
             - 矢印は選択肢を表し、選択肢のテキストが表示されています
             - 未定義のシーンは「(未定義のシーン)」と表示されます
+            - ヒートマップでは、よく訪問されたシーンほど濃い色に、よく選ばれた選択肢ほど太い線になります
             - ノードやエッジにカーソルを合わせると詳細が表示されます
             """)
         
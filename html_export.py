@@ -0,0 +1,418 @@
+"""
+ゲームブックを静的なHTMLファイルとして書き出すモジュール。
+
+シーンの表とエッジの表から、プレイヤー（JavaScript）とシーンのデータを
+含む1つのHTMLファイルを作成する。ストーリーの表示、選択肢、画像の表示は
+story_viewer.pyと同じ規則に従い、キャラクターシートの能力値の決定、
+能力値の変更、ダイスロール、メモもブラウザ上で動作する。
+書き出したファイルは任意の静的ファイルのホスティングで配信でき、
+クリックごとのサーバーの処理は不要になる。
+
+HTMLはシーンを一定数ずつ順次書き出すため、出力全体や全シーン分の
+選択肢の一覧をメモリに保持しない。
+画像はdata URIとしてHTMLに埋め込むか（inline）、内容のハッシュを
+ファイル名にしてassetsディレクトリにコピーする（hashed）。バンドル内の
+画像（bundle.member_path）も同じように書き出す。
+
+使用例:
+    python html_export.py scenario.toml gamebook.html --images hashed
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from bundle import is_bundle, read_bundle, read_image_bytes, split_member_path
+from image_cache import image_exists
+from scene_model import choices_by_scene, clean_value
+
+# 画像の出力方法
+IMAGE_MODES = ('inline', 'hashed', 'none')
+
+# ハッシュ化した画像を置くディレクトリ名
+ASSET_DIR = 'assets'
+
+# ファイルの読み込み単位（バイト）
+CHUNK_SIZE = 1 << 16
+
+# 一度に選択肢を集計して書き出すシーンの数
+SCENE_CHUNK_SIZE = 1000
+
+_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+}
+
+_HEAD = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 960px; margin: 0 auto; padding: 1rem; color: #262730; }}
+button {{ margin: 0.2rem; padding: 0.4rem 0.8rem; border: 1px solid #ccc; border-radius: 0.5rem; background: #fff; cursor: pointer; }}
+button:hover {{ border-color: #ff4b4b; color: #ff4b4b; }}
+.stats {{ display: flex; gap: 1rem; flex-wrap: wrap; }}
+.stat {{ flex: 1; min-width: 8rem; }}
+.stat .value {{ font-size: 2rem; }}
+.scene {{ display: flex; gap: 1rem; }}
+.scene > div {{ flex: 1; }}
+.scene img {{ width: 100%; }}
+.choices button {{ display: block; }}
+textarea, input {{ width: 100%; box-sizing: border-box; }}
+#dice {{ min-height: 1.5rem; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div id="character">
+<label>キャラクター名 <input id="name"></label>
+<button id="roll-stats">能力値を決定</button>
+<div class="stats" id="stats"></div>
+<div><button data-dice="combat">戦闘ロール (2d6)</button><button data-dice="luck">幸運判定 (2d6)</button><button data-dice="d6">d6を振る</button></div>
+<div id="dice"></div>
+<label>所持品、ヒント、その他の重要な情報をメモ<textarea id="notes" rows="3"></textarea></label>
+</div>
+<hr>
+<div><button id="back">1つ前のシーンに戻る</button><button id="restart">最初から</button></div>
+<h2 id="scene-title"></h2>
+<div class="scene"><div id="scene-image" hidden></div><div><div id="story"></div><hr><div class="choices" id="choices"></div></div></div>
+"""
+
+_PLAYER = """<script>
+(() => {
+  const SCENES = JSON.parse(document.getElementById('scenes').textContent);
+  const CONFIG = JSON.parse(document.getElementById('config').textContent);
+  const STORAGE_KEY = 'taleforge:' + CONFIG.title;
+  const STAT_LABELS = [['skill', '技能値 (SKILL)'], ['stamina', '体力値 (STAMINA)'], ['luck', '幸運値 (LUCK)']];
+  if (CONFIG.showFear) STAT_LABELS.push(['fear', '恐怖値 (FEAR)']);
+  const $ = (id) => document.getElementById(id);
+
+  const newState = () => ({
+    scene: 'BG', history: [], name: '', notes: '',
+    stats: {skill: {initial: 0, current: 0}, stamina: {initial: 0, current: 0},
+            luck: {initial: 0, current: 0}, fear: {max: 0, current: 0}}
+  });
+  let state;
+  try { state = JSON.parse(localStorage.getItem(STORAGE_KEY)) || newState(); }
+  catch (e) { state = newState(); }
+  const save = () => { try { localStorage.setItem(STORAGE_KEY, JSON.stringify(state)); } catch (e) {} };
+
+  const rollDice = (n) => Array.from({length: n}, () => 1 + Math.floor(Math.random() * 6));
+  const sum = (rolls) => rolls.reduce((a, b) => a + b, 0);
+
+  const escapeHtml = (text) => text.replace(/[&<>"']/g, (c) => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+  const renderMarkdown = (text) => text.split(/\\n\\s*\\n/).map((block) =>
+    '<p>' + escapeHtml(block)
+      .replace(/\\*\\*(.+?)\\*\\*/g, '<strong>$1</strong>')
+      .replace(/\\*(.+?)\\*/g, '<em>$1</em>')
+      .replace(/\\n/g, '<br>') + '</p>').join('');
+
+  function modifyStat(name, value) {
+    const stat = state.stats[name];
+    const limit = name === 'fear' ? stat.max : stat.initial;
+    stat.current = Math.max(0, Math.min(limit, stat.current + value));
+    save(); renderStats();
+  }
+
+  function renderStats() {
+    $('stats').innerHTML = '';
+    if (!state.name) return;
+    for (const [name, label] of STAT_LABELS) {
+      const stat = state.stats[name];
+      const div = document.createElement('div');
+      div.className = 'stat';
+      div.innerHTML = '<div>' + label + '</div><div class="value">' + stat.current + '/' +
+        (name === 'fear' ? stat.max : stat.initial) + '</div>';
+      for (const delta of [-1, 1]) {
+        const button = document.createElement('button');
+        button.textContent = delta > 0 ? '+1' : '-1';
+        button.onclick = () => modifyStat(name, delta);
+        div.appendChild(button);
+      }
+      $('stats').appendChild(div);
+    }
+  }
+
+  function moveTo(destination) {
+    state.history.push(state.scene);
+    if (state.history.length > 50) state.history.shift();
+    state.scene = destination;
+    save(); renderScene(); window.scrollTo(0, 0);
+  }
+
+  function renderScene() {
+    const scene = SCENES[state.scene];
+    $('scene-title').textContent = 'シーン ' + state.scene;
+    if (!scene) { $('story').textContent = 'シーン ' + state.scene + ' が見つかりません。'; $('choices').innerHTML = ''; return; }
+    const [story, choices, image] = scene;
+    $('story').innerHTML = renderMarkdown(story);
+    $('choices').innerHTML = '';
+    for (const [label, destination] of choices) {
+      const button = document.createElement('button');
+      button.textContent = label;
+      button.onclick = () => moveTo(destination);
+      $('choices').appendChild(button);
+    }
+    $('scene-image').hidden = !image;
+    $('scene-image').innerHTML = image ? '<img alt="" src="' + escapeHtml(image) + '">' : '';
+  }
+
+  $('name').value = state.name;
+  $('notes').value = state.notes;
+  $('name').oninput = () => { state.name = $('name').value; save(); renderStats(); };
+  $('notes').oninput = () => { state.notes = $('notes').value; save(); };
+  $('roll-stats').onclick = () => {
+    const skill = sum(rollDice(2)) + 6, stamina = sum(rollDice(2)) + 12, luck = sum(rollDice(2)) + 6;
+    state.stats.skill = {initial: skill, current: skill};
+    state.stats.stamina = {initial: stamina, current: stamina};
+    state.stats.luck = {initial: luck, current: luck};
+    if (CONFIG.showFear) state.stats.fear = {max: sum(rollDice(2)) + 3, current: 0};
+    save(); renderStats();
+  };
+  for (const button of document.querySelectorAll('[data-dice]')) {
+    button.onclick = () => {
+      const kind = button.dataset.dice;
+      const rolls = rollDice(kind === 'd6' ? 1 : 2);
+      let text = '🎲 ' + rolls.join(' + ');
+      if (rolls.length > 1) text += ' = ' + sum(rolls);
+      if (kind === 'luck') text += sum(rolls) <= state.stats.luck.current ? ' (成功！)' : ' (失敗...)';
+      $('dice').textContent = text;
+    };
+  }
+  $('back').onclick = () => { if (state.history.length) { state.scene = state.history.pop(); save(); renderScene(); } };
+  $('restart').onclick = () => { state.scene = 'BG'; state.history = []; save(); renderScene(); };
+  renderStats();
+  renderScene();
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def _script_json(value):
+    """<script>要素に埋め込めるJSONに変換する"""
+    return json.dumps(
+        value, ensure_ascii=False, separators=(',', ':')
+    ).replace('<', '\\u003c')
+
+
+def _file_hash(path):
+    """ファイルの内容のハッシュを分割して読み込みながら計算する"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _image_url(image_path, image_mode, asset_dir, copied):
+    """
+    画像をHTMLから参照するURLを返す。
+
+    引数:
+        image_path (str): 画像ファイルまたはバンドル内の画像のパス。
+        image_mode (str): 画像の出力方法。
+        asset_dir (str): hashedの場合のコピー先ディレクトリ。
+        copied (dict): コピー済みの画像のパスとURLの対応。
+
+    戻り値:
+        str or None: 画像のURL。画像を出力しない場合や読み込めない場合はNone。
+    """
+    if image_mode == 'none' or not image_exists(image_path):
+        return None
+    ext = os.path.splitext(image_path)[1].lower()
+
+    try:
+        if image_mode == 'inline':
+            mime_type = _MIME_TYPES.get(ext, 'application/octet-stream')
+            encoded = base64.b64encode(read_image_bytes(image_path)).decode('ascii')
+            return f"data:{mime_type};base64,{encoded}"
+
+        if image_path not in copied:
+            if split_member_path(image_path) is not None:
+                # バンドル内の画像は1枚分の内容を読み込んで書き出す
+                data = read_image_bytes(image_path)
+                digest = hashlib.sha256(data).hexdigest()
+            else:
+                data = None
+                digest = _file_hash(image_path)
+            name = f"{digest[:16]}{ext}"
+            target = os.path.join(asset_dir, name)
+            if not os.path.exists(target):
+                os.makedirs(asset_dir, exist_ok=True)
+                if data is None:
+                    shutil.copyfile(image_path, target)
+                else:
+                    with open(target, 'wb') as f:
+                        f.write(data)
+            copied[image_path] = f"{ASSET_DIR}/{name}"
+    except (OSError, KeyError):
+        return None
+    return copied[image_path]
+
+
+def iter_scene_chunks(scenes, edges, chunk_size=SCENE_CHUNK_SIZE):
+    """
+    シーンを表の順に一定数ずつ、その選択肢とともに返す。
+
+    エッジは遷移元のシーンの位置で一度だけ並べ替え、各チャンクでは
+    該当する範囲のエッジだけをPythonのオブジェクトに変換する。
+    同じIDのシーンが複数ある場合は、TOMLの書き出しと同じく後の行を使う。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        chunk_size (int, オプション): 1つのチャンクのシーンの数。
+
+    戻り値:
+        generator: (シーンIDのリスト, ストーリーのリスト, 選択肢の辞書)のタプル。
+    """
+    ids = scenes['ID'].fillna('').str.strip()
+    keep = (~ids.duplicated(keep='last') & (ids != '')).to_numpy()
+    ids = ids[keep]
+    stories = scenes['ストーリー'][keep]
+
+    positions = pd.Index(ids).get_indexer(edges['source'])
+    order = np.lexsort((edges['order'].to_numpy(), positions))
+    order = order[positions[order] >= 0]
+    sorted_positions = positions[order]
+
+    for start in range(0, len(ids), chunk_size):
+        stop = start + chunk_size
+        low, high = np.searchsorted(sorted_positions, [start, stop])
+        yield (
+            ids.iloc[start:stop].tolist(),
+            stories.iloc[start:stop].tolist(),
+            choices_by_scene(edges.iloc[order[low:high]])
+        )
+
+
+def write_html(out, scenes, edges, image_data, title='Tale Forge',
+               image_mode='inline', asset_dir=ASSET_DIR, show_fear=False):
+    """
+    ゲームブックを静的なHTMLとして書き出す。
+
+    引数:
+        out: 書き込み先のテキストファイルオブジェクト。
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。
+        title (str, オプション): ゲームブックのタイトル。
+        image_mode (str, オプション): 画像の出力方法（inline、hashed、none）。
+        asset_dir (str, オプション): hashedの場合に画像をコピーするディレクトリ。
+        show_fear (bool, オプション): 恐怖値メカニクスを有効にするかどうか。
+
+    戻り値:
+        int: 書き出したシーンの数。
+
+    例外:
+        ValueError: 画像の出力方法が不正な場合。
+    """
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"画像の出力方法は {', '.join(IMAGE_MODES)} のいずれかです。")
+
+    escaped_title = html.escape(title)
+    out.write(_HEAD.format(title=escaped_title))
+    out.write('<script type="application/json" id="config">')
+    out.write(_script_json({'title': title, 'showFear': bool(show_fear)}))
+    out.write('</script>\n<script type="application/json" id="scenes">{')
+
+    copied = {}
+    count = 0
+    for ids, stories, choices_map in iter_scene_chunks(scenes, edges):
+        for scene_id, story in zip(ids, stories):
+            image_path = image_data.get(scene_id)
+            image = image_path and _image_url(
+                image_path, image_mode, asset_dir, copied
+            )
+            if count:
+                out.write(',')
+            out.write(_script_json(scene_id))
+            out.write(':')
+            out.write(_script_json([
+                clean_value(story), choices_map.get(scene_id, []), image or None
+            ]))
+            count += 1
+
+    out.write('}</script>\n')
+    out.write(_PLAYER)
+    return count
+
+
+def export_html(path, scenes, edges, image_data, image_mode='inline', **kwargs):
+    """
+    ゲームブックを静的なHTMLファイルに書き出す。
+
+    hashedの場合、画像はHTMLファイルと同じディレクトリのassetsにコピーする。
+
+    引数:
+        path (str): 出力するHTMLファイルのパス。
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。
+        image_mode (str, オプション): 画像の出力方法（inline、hashed、none）。
+        **kwargs: write_htmlに渡すその他の引数。
+
+    戻り値:
+        int: 書き出したシーンの数。
+    """
+    asset_dir = os.path.join(os.path.dirname(os.path.abspath(path)), ASSET_DIR)
+    with open(path, 'w', encoding='utf-8') as f:
+        return write_html(
+            f, scenes, edges, image_data,
+            image_mode=image_mode, asset_dir=asset_dir, **kwargs
+        )
+
+
+def main():
+    """コマンドラインからシナリオを静的なHTMLに書き出す"""
+    from settings import get_setting
+    from toml_export import import_toml_stream
+
+    parser = argparse.ArgumentParser(description="ゲームブックを静的なHTMLに書き出す")
+    parser.add_argument('scenario', help="シナリオのTOMLファイルまたはバンドル")
+    parser.add_argument('output', help="出力するHTMLファイル")
+    parser.add_argument('--images', choices=IMAGE_MODES, default='inline')
+    parser.add_argument('--title', default='Tale Forge')
+    args = parser.parse_args()
+
+    if is_bundle(args.scenario):
+        scenes, edges, image_data, _ = read_bundle(args.scenario)
+    else:
+        # ファイル全体を保持しないよう、テーブルごとに読み込む
+        with open(args.scenario, 'rb') as f:
+            scenes, edges, image_data, skipped = import_toml_stream(f)
+        if skipped:
+            print(f"読み込めないシーンを{len(skipped)}件読み飛ばしました: "
+                  + ", ".join(str(scene_id) for scene_id in skipped[:20]))
+        # 画像のパスはbundle.pyと同じくシナリオのファイルからの相対パスとして扱う
+        base = os.path.dirname(os.path.abspath(args.scenario))
+        image_data = {
+            scene_id: os.path.join(base, path)
+            for scene_id, path in image_data.items()
+        }
+
+    count = export_html(
+        args.output, scenes, edges, image_data,
+        image_mode=args.images,
+        title=args.title,
+        show_fear=bool(get_setting('show_fear', False))
+    )
+    print(f"{count}シーンを {args.output} に書き出しました。")
+
+
+if __name__ == "__main__":
+    main()
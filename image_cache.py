@@ -0,0 +1,209 @@
+"""
+シーン画像の読み込みと先読みを提供するモジュール。
+
+読み込んだ画像はプロセス内で共有する容量に上限のあるキャッシュ
+（最近使われていないものから破棄するLRU）に保持する。ファイルの存在と
+更新時刻の確認結果も短い時間だけキャッシュし、再実行のたびにディスクへ
+問い合わせないようにする。
+
+シーンを表示するときに、選択肢の遷移先のシーンの画像を小さなスレッド
+プールで先読みしておくことで、選択肢を選んだ後の画像の表示で
+ディスクの読み込みを待たずに済む。
+
+画像のパスはファイルのほか、バンドル内のメンバーを指すパス
+（bundle.member_path）でもよい。
+"""
+
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from bundle import bundle_members, read_image_bytes, split_member_path
+from settings import get_setting
+
+# キャッシュの既定の上限（MB）
+DEFAULT_CACHE_MB = 64
+
+# 先読みに使うスレッドの既定の数
+DEFAULT_WORKERS = 2
+
+# ファイルの存在と更新時刻の確認結果を再利用する秒数
+STAT_TTL = 2.0
+
+# 保持する確認結果の最大数
+STAT_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+# パスをキー、(確認した時刻, (更新時刻, サイズ)またはNone)を値とする、
+# 確認した順の辞書
+_stats = OrderedDict()
+# パスをキー、画像のエントリーを値とするLRUキャッシュ
+_images = OrderedDict()
+_state = {
+    'bytes': 0,
+    'executor': None,
+    'pending': set(),
+}
+
+
+def _file_stat(path):
+    """ファイルの(更新時刻, サイズ)を返す。結果は一定時間キャッシュする"""
+    now = time.monotonic()
+    cached = _stats.get(path)
+    if cached is not None and now - cached[0] < STAT_TTL:
+        return cached[1]
+    location = split_member_path(path)
+    try:
+        if location is not None:
+            # バンドル内の画像はアーカイブの更新時刻とメンバーの位置で判定する
+            archive, member = location
+            stat = os.stat(archive)
+            member_info = bundle_members(archive).get(member)
+            signature = None if member_info is None else (
+                stat.st_mtime_ns, member_info[0], member_info[1]
+            )
+        else:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+    except (OSError, zipfile.BadZipFile):
+        signature = None
+    with _lock:
+        _stats[path] = (now, signature)
+        _stats.move_to_end(path)
+        # 期限切れの確認結果と上限を超えた分を古い順に破棄する
+        while _stats and (len(_stats) > STAT_CACHE_SIZE or
+                          now - next(iter(_stats.values()))[0] >= STAT_TTL):
+            _stats.popitem(last=False)
+    return signature
+
+
+def image_exists(path):
+    """
+    画像ファイルが存在するかどうかを返す。
+
+    引数:
+        path (str): 画像のパス。
+
+    戻り値:
+        bool: ファイルが存在する場合はTrue。
+    """
+    return bool(path) and _file_stat(path) is not None
+
+
+def _read_image(path, signature):
+    """画像を読み込み、表示に必要な形に準備したエントリーを作成する"""
+    from story_viewer import get_svg_dimensions
+
+    content = read_image_bytes(path)
+    if path.lower().endswith('.svg'):
+        content = content.decode('utf-8')
+        width, height = get_svg_dimensions(content)
+        entry = {'svg': True, 'content': content, 'size': (width, height)}
+    else:
+        entry = {'svg': False, 'content': content, 'size': None}
+    entry['signature'] = signature
+    entry['bytes'] = sys.getsizeof(content)
+    return entry
+
+
+def _store(path, entry):
+    """エントリーをキャッシュに追加し、上限を超えた分を古い順に破棄する"""
+    limit = float(get_setting('image_cache_mb', DEFAULT_CACHE_MB)) * 2**20
+    with _lock:
+        old = _images.pop(path, None)
+        if old is not None:
+            _state['bytes'] -= old['bytes']
+        if entry['bytes'] > limit:
+            return
+        _images[path] = entry
+        _state['bytes'] += entry['bytes']
+        while _state['bytes'] > limit:
+            _, evicted = _images.popitem(last=False)
+            _state['bytes'] -= evicted['bytes']
+
+
+def load_image(path):
+    """
+    画像をキャッシュから取得する。キャッシュにないか、ファイルが更新されていれば
+    読み込んでキャッシュに追加する。
+
+    引数:
+        path (str): 画像のパス。
+
+    戻り値:
+        dict or None: SVGかどうか（svg）、内容（content: SVGは文字列、
+            それ以外はバイト列）、SVGの(幅, 高さ)（size）の辞書。
+            ファイルが存在しない場合はNone。
+
+    例外:
+        OSError: ファイルの読み込みに失敗した場合。
+        KeyError: バンドル内に画像が存在しない場合。
+    """
+    signature = _file_stat(path)
+    if signature is None:
+        return None
+    with _lock:
+        entry = _images.get(path)
+        if entry is not None and entry['signature'] == signature:
+            _images.move_to_end(path)
+            return entry
+    entry = _read_image(path, signature)
+    _store(path, entry)
+    return entry
+
+
+def _prefetch_one(path):
+    """先読みのスレッドで1つの画像を読み込む"""
+    try:
+        load_image(path)
+    except (OSError, KeyError, UnicodeDecodeError, ValueError):
+        # 表示の際に改めて読み込み、エラーを表示する
+        pass
+    finally:
+        with _lock:
+            _state['pending'].discard(path)
+
+
+def prefetch_images(paths):
+    """
+    画像をバックグラウンドで読み込み、キャッシュしておく。
+
+    キャッシュ済みの画像と読み込み中の画像は読み込まない。
+
+    引数:
+        paths (iterable): 画像のパス。
+    """
+    with _lock:
+        paths = [
+            path for path in dict.fromkeys(paths)
+            if path and path not in _state['pending'] and path not in _images
+        ]
+        if not paths:
+            return
+        if _state['executor'] is None:
+            workers = int(get_setting('image_prefetch_workers', DEFAULT_WORKERS))
+            _state['executor'] = ThreadPoolExecutor(
+                max_workers=max(1, workers), thread_name_prefix='image-prefetch'
+            )
+        _state['pending'].update(paths)
+        executor = _state['executor']
+    for path in paths:
+        executor.submit(_prefetch_one, path)
+
+
+def invalidate_image(path):
+    """
+    画像のキャッシュと確認結果を破棄する。画像を書き換えた後に呼び出す。
+
+    引数:
+        path (str): 画像のパス。
+    """
+    with _lock:
+        _stats.pop(path, None)
+        entry = _images.pop(path, None)
+        if entry is not None:
+            _state['bytes'] -= entry['bytes']
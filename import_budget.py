@@ -0,0 +1,140 @@
+"""
+アプリの起動時のインポート時間を計測し、予算と比較するモジュール。
+
+新しいプロセスでapp.pyをインポートし、main()で最初の実行
+（セッションの初期化、シナリオの読み込みと監視の開始）までを行い、
+`python -X importtime`の出力を解析して各モジュールのインポート時間を
+一覧表示する。main()の中で必要になった時点で読み込むモジュールも
+計測に含まれる。合計が予算を超えた場合は終了コード1で終了するため、
+CIでのコールドスタートの確認に使用できる。
+
+使用例:
+    python import_budget.py --budget-ms 500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# app.pyのインポートに許容する時間の既定値（ミリ秒）
+DEFAULT_BUDGET_MS = 500
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 計測の開始位置を示す標準エラー出力の行
+_MARKER = 'import_budget: start'
+
+# 計測するプロセスで実行するスクリプト
+# Streamlitのサーバーを使わずに実行するため、タブの内容は実行されない
+_STARTUP_SCRIPT = '''
+import importlib
+import sys
+sys.stderr.write({marker!r} + '\\n')
+sys.stderr.flush()
+module = importlib.import_module({module!r})
+if {run_main!r} and hasattr(module, 'main'):
+    module.main()
+'''
+
+
+def parse_importtime(output):
+    """
+    `-X importtime`の出力を解析する。
+
+    引数:
+        output (str): 標準エラー出力の内容。
+
+    戻り値:
+        list: モジュール名、自身の時間、累積時間（マイクロ秒）、階層の辞書のリスト。
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line.split(':', 1)[1].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': depth,
+        })
+    return entries
+
+
+def measure_import_time(module='app', run_main=True):
+    """
+    新しいPythonプロセスでモジュールをインポートし、最初の実行までの
+    インポート時間を計測する。
+
+    引数:
+        module (str, オプション): インポートするモジュール名。
+        run_main (bool, オプション): インポートの後にmain()を実行し、
+            その中で読み込まれるモジュールも計測するかどうか。
+
+    戻り値:
+        tuple: (合計時間（ミリ秒）, 解析結果のリスト)。
+    """
+    script = _STARTUP_SCRIPT.format(
+        marker=_MARKER, module=module, run_main=run_main
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        capture_output=True,
+        text=True,
+        cwd=REPO_DIR,
+        check=True
+    )
+    # インタプリタ自体の起動時に読み込まれるモジュールは除外する
+    _, _, output = result.stderr.partition(_MARKER)
+    entries = parse_importtime(output)
+    total_us = sum(
+        entry['cumulative_us'] for entry in entries if entry['depth'] == 0
+    )
+    return total_us / 1000, entries
+
+
+def main():
+    """コマンドラインからインポート時間を計測する"""
+    parser = argparse.ArgumentParser(description="起動時のインポート時間を計測する")
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--import-only', action='store_true',
+                        help="main()を実行せず、インポートだけを計測する")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15,
+                        help="表示する遅いモジュールの数")
+    parser.add_argument('--output', help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    total_ms, entries = measure_import_time(args.module, not args.import_only)
+
+    print(f"{args.module} の起動時のインポート時間: {total_ms:.1f} ms "
+          f"(予算 {args.budget_ms:.0f} ms)")
+    print(f"{'累積 (ms)':>10} {'自身 (ms)':>10}  モジュール")
+    slowest = sorted(entries, key=lambda e: e['cumulative_us'], reverse=True)
+    for entry in slowest[:args.top]:
+        print(f"{entry['cumulative_us'] / 1000:10.1f} "
+              f"{entry['self_us'] / 1000:10.1f}  "
+              f"{'  ' * entry['depth']}{entry['module']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'module': args.module,
+                'total_ms': total_ms,
+                'budget_ms': args.budget_ms,
+                'entries': entries,
+            }, f, ensure_ascii=False, indent=2)
+
+    if total_ms > args.budget_ms:
+        print("インポート時間が予算を超えています。")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+シーン間のリンクの逆引きインデックスを提供するモジュール。
+
+遷移先のシーンIDから、そのシーンを指している選択肢のエッジを
+引けるようにする。シーンIDの変更ではシーンの行数と参照元の数に
+比例する処理だけで全ての遷移元と遷移先を書き換えられる。
+"""
+
+from scene_model import clean_value
+
+
+def new_link_index():
+    """
+    空のリンクインデックスを作成する。
+
+    戻り値:
+        dict: 遷移先ごとのエッジ（incoming）、遷移元ごとのエッジ（outgoing）、
+            エッジごとの(遷移元, 番号, 遷移先)（edges）、シーンIDごとの行（rows）、
+            行ごとのシーンID（row_ids）の辞書。
+    """
+    return {
+        'incoming': {},
+        'outgoing': {},
+        'edges': {},
+        'rows': {},
+        'row_ids': {},
+    }
+
+
+def _add_row(index, label, scene_id):
+    """シーンの行をインデックスに登録する"""
+    index['row_ids'][label] = scene_id
+    index['rows'].setdefault(scene_id, set()).add(label)
+
+
+def _remove_row(index, label):
+    """シーンの行をインデックスから削除する"""
+    scene_id = index['row_ids'].pop(label, None)
+    if scene_id is None:
+        return
+    labels = index['rows'].get(scene_id)
+    if labels is not None:
+        labels.discard(label)
+        if not labels:
+            del index['rows'][scene_id]
+
+
+def _add_edge(index, label, source, order, dest):
+    """エッジをインデックスに登録する"""
+    index['edges'][label] = (source, order, dest)
+    index['outgoing'].setdefault(source, set()).add(label)
+    if dest:
+        index['incoming'].setdefault(dest, set()).add(label)
+
+
+def _discard(mapping, key, label):
+    """集合を値とする辞書から要素を取り除き、空になったキーを削除する"""
+    labels = mapping.get(key)
+    if labels is not None:
+        labels.discard(label)
+        if not labels:
+            del mapping[key]
+
+
+def _remove_edge(index, label):
+    """エッジをインデックスから削除する"""
+    edge = index['edges'].pop(label, None)
+    if edge is None:
+        return
+    source, _, dest = edge
+    _discard(index['outgoing'], source, label)
+    _discard(index['incoming'], dest, label)
+
+
+def build_link_index(df, edges):
+    """
+    シーンの表とエッジの表からリンクインデックスを構築する。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+
+    戻り値:
+        dict: リンクインデックス。
+    """
+    index = new_link_index()
+    for label, scene_id in zip(df.index.tolist(), df['ID'].tolist()):
+        scene_id = clean_value(scene_id)
+        if scene_id:
+            _add_row(index, label, scene_id)
+
+    for label, source, order, dest in zip(
+        edges.index.tolist(),
+        edges['source'].tolist(),
+        edges['order'].tolist(),
+        edges['destination'].tolist()
+    ):
+        _add_edge(index, label, source, int(order), clean_value(dest))
+    return index
+
+
+def update_rows(index, df, labels):
+    """
+    変更されたシーンの行だけをインデックスに反映する。
+
+    引数:
+        index (dict): リンクインデックス。
+        df (pandas.DataFrame): 変更後のシーンの表。
+        labels (iterable): 変更、追加、削除された行のインデックスラベル。
+    """
+    for label in labels:
+        _remove_row(index, label)
+        if label in df.index:
+            scene_id = clean_value(df.at[label, 'ID'])
+            if scene_id:
+                _add_row(index, label, scene_id)
+
+
+def update_edges(index, edges, labels):
+    """
+    変更されたエッジだけをインデックスに反映する。
+
+    引数:
+        index (dict): リンクインデックス。
+        edges (pandas.DataFrame): 変更後のエッジの表。
+        labels (iterable): 変更、追加、削除されたエッジのインデックスラベル。
+    """
+    for label in labels:
+        _remove_edge(index, label)
+        if label in edges.index:
+            _add_edge(
+                index,
+                label,
+                edges.at[label, 'source'],
+                int(edges.at[label, 'order']),
+                clean_value(edges.at[label, 'destination'])
+            )
+
+
+def incoming_links(index, scene_id):
+    """
+    シーンを遷移先とする参照元の一覧を返す。
+
+    引数:
+        index (dict): リンクインデックス。
+        scene_id (str): 遷移先のシーンID。
+
+    戻り値:
+        list: (参照元のシーンID, エッジのインデックスラベル, 選択肢の番号)のリスト。
+    """
+    links = []
+    for label in index['incoming'].get(scene_id, ()):
+        source, order, _ = index['edges'][label]
+        links.append((source, label, order))
+    return sorted(links, key=lambda link: (link[0], link[2]))
+
+
+def rename_scene(df, edges, index, old_id, new_id):
+    """
+    シーンIDを変更し、そのシーンの選択肢と、そのシーンを指す全ての遷移先を書き換える。
+
+    データフレームはその場で更新する。処理量はシーンの行数と
+    選択肢の数に比例し、シナリオ全体の大きさには依存しない。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        index (dict): df、edgesに対応するリンクインデックス。
+        old_id (str): 変更前のシーンID。
+        new_id (str): 変更後のシーンID。
+
+    戻り値:
+        int: 書き換えた遷移先の数。
+
+    例外:
+        ValueError: 変更後のIDが空か既に使われている場合、
+            または変更前のIDのシーンが存在しない場合。
+    """
+    old_id = clean_value(old_id)
+    new_id = clean_value(new_id)
+    if not new_id:
+        raise ValueError("新しいシーンIDが空です。")
+    if new_id in index['rows']:
+        raise ValueError(f"シーンID {new_id} は既に使われています。")
+    if old_id not in index['rows']:
+        raise ValueError(f"シーン {old_id} が見つかりません。")
+
+    # シーン自身の行のIDを変更
+    labels = index['rows'].pop(old_id)
+    for label in labels:
+        df.at[label, 'ID'] = new_id
+        index['row_ids'][label] = new_id
+    index['rows'][new_id] = labels
+
+    # シーンから出ている選択肢の遷移元を変更
+    outgoing = index['outgoing'].pop(old_id, set())
+    for label in outgoing:
+        _, order, dest = index['edges'][label]
+        edges.at[label, 'source'] = new_id
+        index['edges'][label] = (new_id, order, dest)
+    if outgoing:
+        index['outgoing'].setdefault(new_id, set()).update(outgoing)
+
+    # 参照元の遷移先を変更
+    incoming = index['incoming'].pop(old_id, set())
+    for label in incoming:
+        source, order, _ = index['edges'][label]
+        edges.at[label, 'destination'] = new_id
+        index['edges'][label] = (source, order, new_id)
+    if incoming:
+        index['incoming'].setdefault(new_id, set()).update(incoming)
+
+    return len(incoming)
@@ -0,0 +1,211 @@
+"""
+複数のセッションを同時に実行してアプリの処理能力を計測する負荷試験モジュール。
+
+streamlit.testingのAppTestで、ゲームブックを遊ぶセッションを同時実行数を
+増やしながら模擬する。各セッションはシナリオを読み込み、キャラクターを作成し、
+ダイスを振りながらランダムに選択肢を選ぶ。同時実行数ごとに再実行の
+レイテンシのパーセンタイル、スループット、セッションあたりのメモリ使用量（RSS）を
+計測し、結果をJSONで保存する。
+
+AppTestはスクリプトを同じプロセス内で実行するため、計測値は1つのサーバー
+プロセスがブラウザとの通信を除いて処理できる量の目安となる。
+
+使用例:
+    python load_test.py --scenes 1000 --concurrency 1 2 4 8 --output load.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import scenario_generator
+from benchmark import APP_PATH, APP_TABS, git_commit
+from profiling import percentile
+
+# ダイスロールのボタンのラベル
+DICE_BUTTONS = ("戦闘ロール (2d6)", "幸運判定 (2d6)", "d6を振る")
+
+# 1ステップでダイスを振る確率（それ以外は選択肢を選ぶ）
+DICE_PROBABILITY = 0.2
+
+
+def rss_bytes():
+    """
+    現在のプロセスの常駐メモリ（RSS）を返す。
+
+    戻り値:
+        int: RSS（バイト）。/procがない環境では最大RSSを返す。
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _find_button(at, label=None, key_prefix=None):
+    """ラベルまたはキーの接頭辞に一致するボタンの一覧を返す"""
+    return [
+        button for button in at.button
+        if (label is None or button.label == label) and
+        (key_prefix is None or (button.key or '').startswith(key_prefix))
+    ]
+
+
+def simulate_session(steps, seed, timeout=60):
+    """
+    1つのセッションでゲームブックを遊ぶ操作を模擬する。
+
+    引数:
+        steps (int): キャラクター作成後に行う操作（ダイスまたは選択肢）の数。
+        seed (int): 操作を選ぶ乱数のシード。
+        timeout (float, オプション): 1回の実行のタイムアウト秒数。
+
+    戻り値:
+        tuple: (AppTest, 再実行ごとの所要時間（秒）のリスト, エラーの数)。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state['active_tab'] = APP_TABS['gameplay']
+
+    def step(action):
+        nonlocal errors
+        start = time.perf_counter()
+        action()
+        latencies.append(time.perf_counter() - start)
+        errors += len(at.exception)
+
+    step(at.run)
+    step(lambda: at.text_input[0].set_value(f"player{seed}").run())
+    step(lambda: _find_button(at, label="能力値を決定")[0].click().run())
+
+    for _ in range(steps):
+        choices = _find_button(at, key_prefix='choice_')
+        if rng.random() < DICE_PROBABILITY or not choices:
+            # 選択肢がない（結末の）シーンではダイスを振る
+            button = _find_button(at, label=rng.choice(DICE_BUTTONS))[0]
+        else:
+            button = rng.choice(choices)
+        step(lambda: button.click().run())
+
+    return at, latencies, errors
+
+
+def run_level(concurrency, steps, seed=0, timeout=60):
+    """
+    指定した数のセッションを同時に実行し、計測結果を集計する。
+
+    引数:
+        concurrency (int): 同時に実行するセッションの数。
+        steps (int): 各セッションの操作の数。
+        seed (int, オプション): 乱数シードの基準値。
+        timeout (float, オプション): 1回の実行のタイムアウト秒数。
+
+    戻り値:
+        dict: 同時実行数、再実行数、エラー数、レイテンシのパーセンタイル（ミリ秒）、
+            スループット（再実行/秒）、セッションあたりのRSS増加量（MB）の辞書。
+    """
+    gc.collect()
+    rss_before = rss_bytes()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sessions = list(executor.map(
+            lambda i: simulate_session(steps, seed + i, timeout),
+            range(concurrency)
+        ))
+    elapsed = time.perf_counter() - start
+
+    # セッションを保持したままメモリ使用量を計測する
+    gc.collect()
+    rss_after = rss_bytes()
+
+    latencies = sorted(t for _, times, _ in sessions for t in times)
+    result = {
+        'concurrency': concurrency,
+        'reruns': len(latencies),
+        'errors': sum(errors for _, _, errors in sessions),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'rss_mb': rss_after / 2**20,
+        'rss_per_session_mb': (rss_after - rss_before) / 2**20 / concurrency,
+    }
+    for percent in (50, 90, 95, 99):
+        result[f'p{percent}_ms'] = percentile(latencies, percent) * 1000
+    del sessions
+    return result
+
+
+def main():
+    """コマンドラインから負荷試験を実行する"""
+    parser = argparse.ArgumentParser(description="Tale Forgeの負荷試験")
+    parser.add_argument('--scenes', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--steps', type=int, default=20,
+                        help="各セッションの操作の数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', default='load_test_results.json')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        scenario_generator.write_scenario(
+            workdir, args.scenes, image_ratio=0.1, seed=args.seed
+        )
+        # app.pyはカレントディレクトリのscenario.tomlを読み込む
+        os.chdir(workdir)
+        try:
+            # モジュールの読み込みなど初回のみの処理を計測から除く
+            simulate_session(1, args.seed, args.timeout)
+
+            print(f"{'同時実行':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} "
+                  f"{'p99 (ms)':>10} {'再実行/秒':>10} {'MB/セッション':>14}")
+            for concurrency in args.concurrency:
+                result = run_level(
+                    concurrency, args.steps, args.seed, args.timeout
+                )
+                results.append(result)
+                print(f"{concurrency:>8} {result['p50_ms']:>10.1f} "
+                      f"{result['p95_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+                      f"{result['throughput']:>10.1f} "
+                      f"{result['rss_per_session_mb']:>14.2f}")
+                if result['errors']:
+                    print(f"  {result['errors']}件のエラーが発生しました。")
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'scenes': args.scenes,
+            'steps': args.steps,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+ゲームプレイの状態の保存、読み込み、巻き戻しを提供するモジュール。
+
+プレイ状態（現在のシーン、キャラクター、ダイスの乱数シード、最近訪れた
+シーンの経路）を、バージョン番号付きの圧縮したバイト列（スナップショット）に
+変換する。スナップショットは数百バイト程度に収まるため、セーブスロットとして
+ファイルに保存したり、巻き戻し用の履歴としてセッションに保持したりできる。
+
+巻き戻しの履歴と訪問経路は長さに上限のあるリングバッファ（deque）で保持し、
+シーン移動のたびの追加と巻き戻しはいずれも定数時間で行う。
+"""
+
+import json
+import os
+import random
+import re
+import zlib
+from collections import deque
+
+import streamlit as st
+
+from playthrough import is_recording, log_reader, record_event
+from scenario_state import get_choice_map, get_scene_rows, get_shortest_paths
+from scene_paths import START_SCENE, path_to
+from settings import get_setting
+
+# スナップショットの形式のバージョン
+SNAPSHOT_VERSION = 1
+
+# 巻き戻しできるシーン移動の数
+UNDO_LIMIT = 50
+
+# スナップショットに含める最近訪れたシーンの数
+PATH_LENGTH = 16
+
+# セーブスロットのファイルの拡張子
+SLOT_SUFFIX = '.sav'
+
+# セーブスロットの名前に使える文字（英数字、日本語、_、-）
+_SLOT_NAME = re.compile(r'[\w\-]{1,64}')
+
+
+def initialize_play_state():
+    """
+    セッション状態に巻き戻しの履歴、訪問経路、乱数シードがない場合に初期化する。
+    """
+    if 'undo_history' not in st.session_state:
+        st.session_state.undo_history = deque(maxlen=UNDO_LIMIT)
+    if 'visited_path' not in st.session_state:
+        st.session_state.visited_path = deque(maxlen=PATH_LENGTH)
+    if 'dice_seed' not in st.session_state:
+        st.session_state.dice_seed = random.SystemRandom().getrandbits(32)
+        st.session_state.dice_count = 0
+
+
+def dice_rng():
+    """
+    次のダイスロールに使う乱数生成器を返す。
+
+    乱数はシードとロールの回数から決まるため、スナップショットから
+    復元した後も同じ順序でダイスの目が出る。
+
+    戻り値:
+        random.Random: 乱数生成器。
+    """
+    initialize_play_state()
+    count = st.session_state.dice_count
+    st.session_state.dice_count = count + 1
+    return random.Random((st.session_state.dice_seed << 32) | count)
+
+
+def encode_snapshot(snapshot):
+    """
+    スナップショットの辞書をバイト列に変換する。
+
+    引数:
+        snapshot (dict): スナップショットの辞書。
+
+    戻り値:
+        bytes: 先頭1バイトがバージョン番号、残りが圧縮したJSONのバイト列。
+    """
+    body = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+    return bytes([SNAPSHOT_VERSION]) + zlib.compress(body.encode('utf-8'), 9)
+
+
+def decode_snapshot(data):
+    """
+    バイト列をスナップショットの辞書に変換する。
+
+    引数:
+        data (bytes): encode_snapshotで作成したバイト列。
+
+    戻り値:
+        dict: スナップショットの辞書。
+
+    例外:
+        ValueError: バージョンが異なるか、データが壊れている場合。
+    """
+    if not data or data[0] != SNAPSHOT_VERSION:
+        raise ValueError("対応していない形式のセーブデータです。")
+    try:
+        return json.loads(zlib.decompress(data[1:]).decode('utf-8'))
+    except (zlib.error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("セーブデータが壊れています。") from e
+
+
+def take_snapshot():
+    """
+    現在のプレイ状態をスナップショットに変換する。
+
+    戻り値:
+        bytes: スナップショットのバイト列。
+    """
+    initialize_play_state()
+    return encode_snapshot({
+        'scene': st.session_state.get('current_scene', 'BG'),
+        'character': st.session_state.get('character', {}),
+        'seed': st.session_state.dice_seed,
+        'rolls': st.session_state.dice_count,
+        'path': list(st.session_state.visited_path),
+    })
+
+
+def restore_snapshot(data):
+    """
+    スナップショットからプレイ状態を復元する。
+
+    ウィジェットの状態を書き換えるため、ボタンのコールバックから呼び出す。
+
+    引数:
+        data (bytes): スナップショットのバイト列。
+
+    例外:
+        ValueError: スナップショットを読み込めない場合。
+    """
+    snapshot = decode_snapshot(data)
+    initialize_play_state()
+    st.session_state.current_scene = snapshot['scene']
+    st.session_state.character = snapshot['character']
+    st.session_state.dice_seed = snapshot['seed']
+    st.session_state.dice_count = snapshot['rolls']
+    st.session_state.visited_path.clear()
+    st.session_state.visited_path.extend(snapshot['path'])
+    # メモ欄はウィジェットの状態が優先されるため合わせて書き換える
+    st.session_state.character_notes = snapshot['character'].get('notes', '')
+    record_event('restore', snapshot['scene'], snapshot['character'])
+
+
+def record_move(destination):
+    """
+    シーンを移動し、移動前の状態を巻き戻しの履歴に追加する。
+
+    引数:
+        destination (str): 遷移先のシーンID。
+    """
+    initialize_play_state()
+    st.session_state.undo_history.append(take_snapshot())
+    st.session_state.current_scene = destination
+    st.session_state.visited_path.append(destination)
+
+
+def jump_to_scene(scene_id):
+    """
+    選択肢をたどらずにシーンへ移動する。移動前の状態は巻き戻しの履歴に追加する。
+
+    プレイの記録には、再生できるよう状態の復元として記録する。
+
+    引数:
+        scene_id (str): 移動先のシーンID。
+    """
+    record_move(scene_id)
+    record_event('restore', scene_id, st.session_state.get('character', {}))
+
+
+def undo_move():
+    """
+    直前のシーン移動を取り消す。
+
+    戻り値:
+        bool: 取り消せた場合はTrue、履歴が空の場合はFalse。
+    """
+    initialize_play_state()
+    if not st.session_state.undo_history:
+        return False
+    restore_snapshot(st.session_state.undo_history.pop())
+    return True
+
+
+def _slot_dir():
+    """セーブスロットを保存するディレクトリを返す"""
+    return get_setting('save_dir', 'saves')
+
+
+def _slot_path(name):
+    """セーブスロットのファイルのパスを返す"""
+    if not _SLOT_NAME.fullmatch(name):
+        raise ValueError("スロット名には英数字、日本語、_、-のみ使用できます。")
+    return os.path.join(_slot_dir(), name + SLOT_SUFFIX)
+
+
+def list_slots():
+    """
+    保存済みのセーブスロットの一覧を返す。
+
+    戻り値:
+        list: 更新日時が新しい順のスロット名のリスト。
+    """
+    try:
+        entries = [
+            entry for entry in os.scandir(_slot_dir())
+            if entry.is_file() and entry.name.endswith(SLOT_SUFFIX)
+        ]
+    except OSError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [entry.name[:-len(SLOT_SUFFIX)] for entry in entries]
+
+
+def save_slot(name):
+    """
+    現在のプレイ状態をセーブスロットに保存する。
+
+    書き込み途中のファイルが残らないよう、一時ファイルに書いてから置き換える。
+
+    引数:
+        name (str): スロット名。
+
+    戻り値:
+        int: 保存したバイト数。
+
+    例外:
+        ValueError: スロット名が不正な場合。
+        OSError: ファイルの書き込みに失敗した場合。
+    """
+    path = _slot_path(name)
+    data = take_snapshot()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return len(data)
+
+
+def load_slot(name):
+    """
+    セーブスロットからプレイ状態を復元する。巻き戻しの履歴は破棄する。
+
+    引数:
+        name (str): スロット名。
+
+    例外:
+        ValueError: スロット名が不正か、セーブデータを読み込めない場合。
+        OSError: ファイルの読み込みに失敗した場合。
+    """
+    with open(_slot_path(name), 'rb') as f:
+        restore_snapshot(f.read())
+    st.session_state.undo_history.clear()
+
+
+def _undo_callback():
+    """巻き戻しボタンのコールバック"""
+    if not undo_move():
+        st.session_state.play_message = ('info', "これ以上戻れません。")
+
+
+def _save_callback():
+    """セーブボタンのコールバック"""
+    name = st.session_state.save_slot_name.strip()
+    try:
+        size = save_slot(name)
+    except (ValueError, OSError) as e:
+        st.session_state.play_message = ('error', str(e))
+        return
+    st.session_state.play_message = (
+        'success', f"スロット {name} に保存しました（{size}バイト）。"
+    )
+
+
+def _load_callback():
+    """ロードボタンのコールバック"""
+    name = st.session_state.load_slot_name
+    try:
+        load_slot(name)
+    except (ValueError, OSError) as e:
+        st.session_state.play_message = ('error', str(e))
+        return
+    st.session_state.play_message = ('success', f"スロット {name} を読み込みました。")
+
+
+def show_play_controls():
+    """
+    巻き戻しボタンと、セーブスロットの保存・読み込み機能を表示する。
+
+    状態の復元はキャラクターの表示にも影響するため、フラグメントではなく
+    アプリ全体の再実行で反映する。
+    """
+    initialize_play_state()
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.button(
+            "1つ前のシーンに戻る",
+            key="undo_move",
+            on_click=_undo_callback
+        )
+
+    with col2:
+        with st.expander("セーブ・ロード"):
+            save_col, load_col = st.columns(2)
+            with save_col:
+                st.text_input("スロット名", key="save_slot_name")
+                st.button("セーブ", key="save_slot", on_click=_save_callback)
+            with load_col:
+                slots = list_slots()
+                st.selectbox("保存済みのスロット", slots, key="load_slot_name")
+                st.button(
+                    "ロード",
+                    key="load_slot",
+                    on_click=_load_callback,
+                    disabled=not slots
+                )
+            if is_recording():
+                st.download_button(
+                    "プレイ記録をダウンロード",
+                    data=log_reader(),
+                    file_name="playthrough.jsonl",
+                    mime="application/jsonl"
+                )
+
+    message = st.session_state.pop('play_message', None)
+    if message is not None:
+        level, text = message
+        getattr(st, level)(text)
+
+
+def _format_path(path, choice_map):
+    """経路を表示用のMarkdownの番号付きリストに変換する"""
+    lines = []
+    for scene_id, order in path:
+        if order is None:
+            lines.append(f"1. **{scene_id}**")
+        else:
+            label = choice_map[scene_id][order - 1][0]
+            lines.append(f"1. {scene_id} → 選択{order}「{label}」")
+    return '\n'.join(lines)
+
+
+def _jump_callback(input_key):
+    """ジャンプボタンのコールバック"""
+    scene_id = st.session_state[input_key].strip()
+    if scene_id not in get_scene_rows():
+        st.session_state[input_key + '_message'] = (
+            f"シーン {scene_id} が見つかりません。"
+        )
+        return
+    jump_to_scene(scene_id)
+
+
+def show_path_navigator(key):
+    """
+    指定したシーンへ直接移動するボタンと、そこまでの最短経路を表示する。
+
+    深い分岐をテストする作者が、シーン'BG'から選択肢をたどらずに
+    目的のシーンを確認できるようにする。
+
+    引数:
+        key (str): ウィジェットのキーの接頭辞。タブごとに異なる値を指定する。
+    """
+    input_key = f"{key}_scene"
+    st.text_input(
+        "シーンID",
+        value=str(st.session_state.get('current_scene', START_SCENE)),
+        key=input_key
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button(
+            "このシーンへジャンプ",
+            key=f"{key}_jump",
+            on_click=_jump_callback,
+            args=(input_key,)
+        )
+    with col2:
+        show_path = st.button("ここまでの経路を表示", key=f"{key}_show_path")
+
+    message = st.session_state.pop(input_key + '_message', None)
+    if message is not None:
+        st.error(message)
+
+    if show_path:
+        scene_id = st.session_state[input_key].strip()
+        path = path_to(get_shortest_paths(), scene_id)
+        if path is None:
+            st.warning(f"シーン {scene_id} には{START_SCENE}から到達できません。")
+        else:
+            st.caption(f"{START_SCENE}から{len(path) - 1}手")
+            st.markdown(_format_path(path, get_choice_map()))
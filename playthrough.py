@@ -0,0 +1,337 @@
+"""
+プレイの記録と、記録したプレイの再生を提供するモジュール。
+
+settings.tomlの`record_playthroughs`を有効にすると、セッションごとに
+選んだ選択肢、ダイスの出目、能力値の変更をJSON Lines形式で
+`playthrough_dir`に書き出す。1行目はプレイ開始時の状態（ヘッダー）、
+2行目以降は1イベント1行の配列とする。
+
+    ["choice", 遷移元, 選択肢の番号, 遷移先]
+    ["dice", 種類, [出目, ...]]
+    ["stats", 決定した能力値の辞書]
+    ["stat", 能力値の名前, 変化量, 変更後の値]
+    ["restore", シーンID, キャラクターの辞書]（巻き戻し・ロード）
+
+記録は現在のシナリオに対してStreamlitを使わずに再生でき、遷移先やシーンが
+変わって再生できなくなった記録を検出する。シナリオを一度読み込めば
+1件の再生は辞書の参照だけで済むため、大量の記録を回帰テストに使える。
+
+使用例:
+    python playthrough.py --scenario scenario.toml playthroughs/
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import uuid
+
+from settings import get_setting
+
+# 記録の形式のバージョン
+LOG_VERSION = 1
+
+_SESSION_KEY = 'playthrough_log'
+
+# イベントの種類ごとの内容の型
+_EVENT_FIELDS = {
+    'choice': (str, int, str),
+    'dice': (str, list),
+    'stats': (dict,),
+    'stat': (str, int, int),
+    'restore': (str, dict),
+}
+
+
+def is_recording():
+    """
+    プレイの記録が有効かどうかを返す。
+
+    戻り値:
+        bool: settings.tomlでrecord_playthroughsが有効な場合はTrue。
+    """
+    return bool(get_setting('record_playthroughs', False))
+
+
+def _dumps(value):
+    """記録の1行を空白のないJSONに変換する"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _start_log(session_state):
+    """プレイ開始時の状態をヘッダーとして記録を開始する"""
+    log_dir = get_setting('playthrough_dir', 'playthroughs')
+    header = {
+        'v': LOG_VERSION,
+        'started': time.time(),
+        'scene': session_state.get('current_scene', 'BG'),
+        'character': session_state.get('character', {}),
+    }
+    log = {
+        'path': os.path.join(log_dir, f"{uuid.uuid4().hex}.jsonl"),
+        'lines': [_dumps(header)],
+    }
+    os.makedirs(log_dir, exist_ok=True)
+    with open(log['path'], 'w', encoding='utf-8') as f:
+        f.write(log['lines'][0] + '\n')
+    session_state[_SESSION_KEY] = log
+    return log
+
+
+def record_event(kind, *fields):
+    """
+    イベントを現在のセッションの記録に追加する。記録が無効な場合は何もしない。
+
+    引数:
+        kind (str): イベントの種類（choice、dice、stats、stat、restore）。
+        *fields: イベントの内容。
+    """
+    if not is_recording():
+        return
+    import streamlit as st
+
+    log = st.session_state.get(_SESSION_KEY)
+    try:
+        if log is None:
+            log = _start_log(st.session_state)
+        line = _dumps([kind, *fields])
+        log['lines'].append(line)
+        with open(log['path'], 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError:
+        # 記録の失敗でプレイを止めない
+        pass
+
+
+def current_log():
+    """
+    現在のセッションの記録をJSON Linesの文字列として返す。
+
+    戻り値:
+        str: 記録の内容。記録がない場合は空文字列。
+    """
+    import streamlit as st
+
+    log = st.session_state.get(_SESSION_KEY)
+    return '' if log is None else '\n'.join(log['lines']) + '\n'
+
+
+def log_reader():
+    """
+    現在のセッションの記録をJSON Linesの文字列として返す関数を作成する。
+
+    ダウンロードのボタンはデータを作成する関数をスクリプトのスレッドの外で
+    呼び出し、そこではセッションの状態を参照できない。そのため記録と
+    その時点の行数をここで取得しておき、文字列への変換だけを後で行う。
+
+    戻り値:
+        callable: 呼び出した時点までの記録の文字列を返す関数。
+    """
+    import streamlit as st
+
+    log = st.session_state.get(_SESSION_KEY)
+    if log is None:
+        return lambda: ''
+    lines = log['lines']
+    count = len(lines)
+    return lambda: '\n'.join(lines[:count]) + '\n'
+
+
+def load_scenario(path):
+    """
+    再生に使うシナリオを読み込む。
+
+    引数:
+        path (str): シナリオのTOMLファイルのパス。
+
+    戻り値:
+        tuple: (シーンIDの集合, シーンIDごとの(選択肢のテキスト, 遷移先)のリスト)。
+    """
+    from scene_model import choices_by_scene
+    from toml_export import import_from_toml
+
+    with open(path, encoding='utf-8') as f:
+        scenes, edges, _ = import_from_toml(f.read())
+    if scenes is None:
+        raise ValueError(f"シナリオ {path} を読み込めませんでした。")
+    scene_ids = {str(scene_id).strip() for scene_id in scenes['ID'].tolist()}
+    return scene_ids, choices_by_scene(edges)
+
+
+def _event_error(event):
+    """イベントの形式を確認し、正しくない場合は理由を返す"""
+    if not isinstance(event, list) or not event or not isinstance(event[0], str):
+        return "イベントの形式が正しくありません。"
+    kind, *fields = event
+    types = _EVENT_FIELDS.get(kind)
+    if types is None:
+        return f"不明なイベント {kind} です。"
+    if len(fields) != len(types) or not all(
+        isinstance(field, field_type) and not isinstance(field, bool)
+        for field, field_type in zip(fields, types)
+    ):
+        return f"イベント {kind} の形式が正しくありません。"
+    return None
+
+
+def replay_log(lines, scene_ids, choice_map):
+    """
+    記録を現在のシナリオに対して再生する。
+
+    形式が正しくない行や、キャラクターにない能力値の変更も、
+    例外を送出せずに再生できなかったイベントとして報告する。
+
+    引数:
+        lines (iterable): 記録の各行。
+        scene_ids (set): シナリオのシーンIDの集合。
+        choice_map (dict): シーンIDごとの(選択肢のテキスト, 遷移先)のリスト。
+
+    戻り値:
+        dict: 再生できたか（ok）、再生したイベント数（steps）、最後のシーン（scene）、
+            失敗した行番号（line）と理由（error）の辞書。
+    """
+    from character_sheet import apply_stat_change
+
+    result = {'ok': False, 'steps': 0, 'scene': None, 'line': 1, 'error': None}
+    lines = iter(lines)
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, ValueError):
+        result['error'] = "ヘッダーを読み込めません。"
+        return result
+    if not isinstance(header, dict) or header.get('v') != LOG_VERSION:
+        result['error'] = "対応していない形式の記録です。"
+        return result
+    scene = header.get('scene')
+    character = header.get('character')
+    if not isinstance(scene, str) or not isinstance(character, dict):
+        result['error'] = "ヘッダーの形式が正しくありません。"
+        return result
+
+    for number, line in enumerate(lines, start=2):
+        result['line'] = number
+        result['scene'] = scene
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            result['error'] = "イベントを読み込めません。"
+            return result
+        error = _event_error(event)
+        if error is not None:
+            result['error'] = error
+            return result
+        kind, *fields = event
+
+        if kind == 'choice':
+            source, order, destination = fields
+            if source != scene:
+                result['error'] = f"記録のシーン {source} が再生中のシーン {scene} と一致しません。"
+                return result
+            if source not in scene_ids:
+                result['error'] = f"シーン {source} が存在しません。"
+                return result
+            choices = choice_map.get(source, [])
+            if not 1 <= order <= len(choices):
+                result['error'] = f"シーン {source} の選択肢{order}が存在しません。"
+                return result
+            current = choices[order - 1][1]
+            if current != destination:
+                result['error'] = (
+                    f"シーン {source} の選択肢{order}の遷移先が "
+                    f"{destination} から {current} に変わっています。"
+                )
+                return result
+            if destination not in scene_ids:
+                result['error'] = f"遷移先のシーン {destination} が存在しません。"
+                return result
+            scene = destination
+        elif kind == 'restore':
+            scene, character = fields
+            if scene not in scene_ids:
+                result['error'] = f"復元したシーン {scene} が存在しません。"
+                return result
+        elif kind == 'stats':
+            character.update(fields[0])
+        elif kind == 'stat':
+            stat_name, value, expected = fields
+            try:
+                changed = apply_stat_change(character, stat_name, value)
+            except (KeyError, TypeError):
+                result['error'] = f"能力値 {stat_name} がキャラクターにありません。"
+                return result
+            if changed != expected:
+                result['error'] = f"能力値 {stat_name} の変更結果が記録と一致しません。"
+                return result
+        result['steps'] += 1
+
+    result.update(ok=True, scene=scene, line=None)
+    return result
+
+
+def replay_file(path, scene_ids, choice_map):
+    """
+    記録ファイルを再生する。
+
+    引数:
+        path (str): 記録ファイルのパス。
+        scene_ids (set): シナリオのシーンIDの集合。
+        choice_map (dict): シーンIDごとの(選択肢のテキスト, 遷移先)のリスト。
+
+    戻り値:
+        dict: replay_logの結果。ファイルを読み込めない場合も失敗として返す。
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return replay_log(f, scene_ids, choice_map)
+    except (OSError, UnicodeDecodeError) as e:
+        return {
+            'ok': False, 'steps': 0, 'scene': None, 'line': None,
+            'error': f"記録を読み込めません: {e}",
+        }
+
+
+def _log_paths(paths):
+    """ファイルとディレクトリの指定から記録ファイルの一覧を作成する"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.jsonl'))))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    """コマンドラインから記録を再生し、再生できない記録を報告する"""
+    parser = argparse.ArgumentParser(description="プレイの記録を再生する")
+    parser.add_argument('logs', nargs='+', help="記録ファイルまたはディレクトリ")
+    parser.add_argument('--scenario', default='scenario.toml')
+    args = parser.parse_args()
+
+    scene_ids, choice_map = load_scenario(args.scenario)
+    files = _log_paths(args.logs)
+
+    start = time.perf_counter()
+    failures = []
+    for path in files:
+        result = replay_file(path, scene_ids, choice_map)
+        if not result['ok']:
+            failures.append((path, result))
+    elapsed = time.perf_counter() - start
+
+    for path, result in failures:
+        print(f"{path}:{result['line']}: {result['error']}")
+    rate = len(files) / elapsed if elapsed > 0 else float('inf')
+    print(f"{len(files)}件を再生、{len(failures)}件が失敗 "
+          f"({elapsed * 1000:.1f} ms, {rate:.0f}件/秒)")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
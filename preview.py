@@ -5,6 +5,8 @@ import os
 import logging
 import streamlit as st
 
+from scenario_state import get_choice_map
+
 logger = logging.getLogger(__name__)
 
 def show_preview_tab():
@@ -60,19 +62,14 @@ def show_preview_tab():
 def _show_choices(current_scene):
     """選択肢を表示する補助関数"""
     valid_choices = False  # 有効な選択肢があるかどうかのフラグ
+    choices = get_choice_map().get(str(current_scene['ID']).strip(), [])
     
-    for i in range(1, 4):
-        choice = str(current_scene[f'選択{i}']).strip()
-        destination = str(current_scene[f'選択{i}遷移先']).strip()
-        
-        if (choice and destination and 
-            choice.lower() != 'none' and 
-            destination.lower() != 'none'):
-            valid_choices = True
-            button_key = f"choice_{st.session_state.current_scene}_{i}"
-            if st.button(f"{choice}", key=button_key, use_container_width=True):
-                st.session_state.current_scene = destination
-                st.rerun()
+    for i, (choice, destination) in enumerate(choices, start=1):
+        valid_choices = True
+        button_key = f"choice_{st.session_state.current_scene}_{i}"
+        if st.button(f"{choice}", key=button_key, use_container_width=True):
+            st.session_state.current_scene = destination
+            st.rerun()
 
     if not valid_choices:
         st.info("このシーンには選択肢がありません。")
\ No newline at end of file
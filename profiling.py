@@ -0,0 +1,327 @@
+"""
+再実行ごとの処理時間を計測するプロファイリングモジュール。
+
+主要な処理（各タブの表示、TOMLのインポート/エクスポート、画像の読み込み）の
+実行時間をセッション単位とプロセス単位で集計し、サイドバーに表示する。
+settings.tomlの`show_profiling`で有効化し、`profiling_log`にパスを指定すると
+計測結果をJSON Lines形式で書き出す。無効時は設定値の確認のみを行う。
+設定はCONFIG_TTL秒ごとに確認し直すため、サーバーを再起動せずに切り替えられる。
+バッファに残った計測結果はプロセスの終了時に書き出す。書き出しに失敗した
+場合は計測結果をバッファに残して次回に再試行し、失敗をサイドバーに表示する。
+"""
+
+import atexit
+import functools
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from settings import get_setting
+
+# 集計に保持するサンプル数の上限
+MAX_SAMPLES = 1000
+
+# JSON Linesへ書き出す前にバッファに溜める件数
+LOG_BATCH_SIZE = 100
+
+# 書き出しに失敗した場合にバッファに残す件数の上限
+MAX_LOG_BUFFER = LOG_BATCH_SIZE * 10
+
+# 設定を確認し直す間隔（秒）
+CONFIG_TTL = 1.0
+
+_SESSION_KEY = 'profiling_stats'
+
+_config = None
+_lock = threading.Lock()
+_process_stats = {}
+_log_buffer = []
+_log_error = None
+
+
+def _load_config():
+    """
+    プロファイリングの設定を読み込み、プロセス内で保持する。
+    configureで設定した場合を除き、CONFIG_TTL秒ごとに設定ファイルを確認する
+    （settings.pyが更新時刻を比較し、変わっていれば再読み込みする）。
+    """
+    global _config
+    config = _config
+    now = time.monotonic()
+    if config is None or (
+        config['checked'] is not None and now - config['checked'] >= CONFIG_TTL
+    ):
+        config = _config = {
+            'enabled': bool(get_setting('show_profiling', False)),
+            'log_path': get_setting('profiling_log') or None,
+            'checked': now,
+        }
+    return config
+
+
+def is_enabled():
+    """
+    プロファイリングが有効かどうかを返す。
+
+    戻り値:
+        bool: settings.tomlでshow_profilingが有効な場合はTrue。
+    """
+    return _load_config()['enabled']
+
+
+def configure(enabled=None, log_path=None):
+    """
+    設定ファイルを使わずにプロファイリングを設定する。
+
+    引数:
+        enabled (bool or None, オプション): 有効にするかどうか。
+            Noneの場合は次回の確認時に設定ファイルを再読み込みする。
+        log_path (str or None, オプション): JSON Linesの出力先。
+    """
+    global _config
+    if enabled is None:
+        _config = None
+    else:
+        _config = {'enabled': enabled, 'log_path': log_path, 'checked': None}
+
+
+def _current_session():
+    """現在のセッション状態とセッションIDを取得する（Streamlit外ではNone）"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None, None
+    return ctx.session_state, ctx.session_id
+
+
+def record(name, seconds):
+    """
+    計測結果を記録する。
+
+    引数:
+        name (str): 計測対象の名前。
+        seconds (float): 実行時間（秒）。
+    """
+    with _lock:
+        _process_stats.setdefault(name, deque(maxlen=MAX_SAMPLES)).append(seconds)
+
+    session_id = None
+    try:
+        session_state, session_id = _current_session()
+        if session_state is not None:
+            if _SESSION_KEY not in session_state:
+                session_state[_SESSION_KEY] = {}
+            session_state[_SESSION_KEY].setdefault(
+                name, deque(maxlen=MAX_SAMPLES)
+            ).append(seconds)
+    except Exception:
+        pass
+
+    if _load_config()['log_path']:
+        with _lock:
+            _log_buffer.append({
+                'time': time.time(),
+                'session': session_id,
+                'name': name,
+                'seconds': seconds,
+            })
+            should_flush = len(_log_buffer) >= LOG_BATCH_SIZE
+        if should_flush:
+            flush_log()
+
+
+def flush_log():
+    """
+    バッファに溜まった計測結果をJSON Linesファイルへ書き出す。
+
+    書き出しに失敗した場合は例外を送出せず、計測結果をバッファに戻して
+    次回に再試行する（古いものからMAX_LOG_BUFFER件を超えた分は破棄する）。
+    失敗の内容はlog_errorで取得できる。
+
+    戻り値:
+        int: 書き出した件数。失敗した場合は0。
+    """
+    global _log_error
+    log_path = _load_config()['log_path']
+    with _lock:
+        entries = list(_log_buffer)
+        _log_buffer.clear()
+
+    if not log_path or not entries:
+        return 0
+
+    lines = ''.join(
+        json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries
+    )
+    try:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    except OSError as e:
+        with _lock:
+            _log_buffer[:0] = entries
+            del _log_buffer[:-MAX_LOG_BUFFER]
+            _log_error = f"{log_path}: {e}"
+        return 0
+    _log_error = None
+    return len(entries)
+
+
+def log_error():
+    """
+    計測結果の書き出しに失敗した場合の内容を返す。
+
+    戻り値:
+        str or None: 直前の書き出しが失敗した場合はエラーの内容。それ以外はNone。
+    """
+    return _log_error
+
+
+atexit.register(flush_log)
+
+
+@contextmanager
+def timer(name):
+    """
+    withブロックの実行時間を計測するコンテキストマネージャ。
+
+    引数:
+        name (str): 計測対象の名前。
+    """
+    if not is_enabled():
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """
+    関数の実行時間を計測するデコレータ。
+
+    引数:
+        name (str): 計測対象の名前。
+
+    戻り値:
+        callable: デコレータ。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def percentile(sorted_samples, percent):
+    """
+    ソート済みのサンプルから最近傍順位法でパーセンタイルを求める。
+
+    引数:
+        sorted_samples (list): 昇順にソートされたサンプル。
+        percent (float): パーセンタイル（0から100）。
+
+    戻り値:
+        サンプルのうちパーセンタイルに当たる値。
+    """
+    rank = math.ceil(percent / 100 * len(sorted_samples))
+    return sorted_samples[min(max(rank, 1), len(sorted_samples)) - 1]
+
+
+def summarize(stats):
+    """
+    計測結果を集計する。
+
+    引数:
+        stats (dict): 名前をキー、実行時間のサンプルを値とする辞書。
+
+    戻り値:
+        list: 名前、回数、p50、p95（ミリ秒）の辞書のリスト。
+    """
+    rows = []
+    for name, samples in sorted(stats.items()):
+        ordered = sorted(samples)
+        if not ordered:
+            continue
+        rows.append({
+            '処理': name,
+            '回数': len(ordered),
+            'p50 (ms)': round(percentile(ordered, 50) * 1000, 2),
+            'p95 (ms)': round(percentile(ordered, 95) * 1000, 2),
+        })
+    return rows
+
+
+def process_stats():
+    """
+    プロセス全体の計測結果のコピーを返す。
+
+    戻り値:
+        dict: 名前をキー、実行時間のリストを値とする辞書。
+    """
+    with _lock:
+        return {name: list(samples) for name, samples in _process_stats.items()}
+
+
+def reset():
+    """プロセス全体の計測結果を消去する"""
+    with _lock:
+        _process_stats.clear()
+
+
+def show_profiling_panel():
+    """
+    サイドバーにプロファイリング結果を表示する。
+
+    設定で無効化されている場合は何も表示しない。
+    """
+    if not is_enabled():
+        return
+
+    import streamlit as st
+
+    with st.sidebar:
+        st.subheader("プロファイリング")
+
+        st.caption("このセッション")
+        session_rows = summarize(st.session_state.get(_SESSION_KEY, {}))
+        if session_rows:
+            st.dataframe(session_rows, hide_index=True)
+        else:
+            st.write("計測結果はまだありません。")
+
+        st.caption("プロセス全体")
+        process_rows = summarize(process_stats())
+        if process_rows:
+            st.dataframe(process_rows, hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("リセット", key="profiling_reset"):
+                st.session_state[_SESSION_KEY] = {}
+                reset()
+        with col2:
+            if _load_config()['log_path'] and st.button(
+                "ログを書き出す", key="profiling_flush"
+            ):
+                count = flush_log()
+                if log_error() is None:
+                    st.success(f"{count}件を書き出しました。")
+
+        error = log_error()
+        if error is not None:
+            st.error(f"ログを書き出せませんでした（{len(_log_buffer)}件を保持中）: {error}")
@@ -0,0 +1,235 @@
+"""
+ベンチマーク用の合成シナリオを生成するモジュール。
+
+シード値から決定的に、100〜100万シーン規模のゲームブックを生成する。
+分岐数、ストーリーの文字数、SVG/PNG画像の有無を指定できる。
+"""
+
+import argparse
+import os
+import random
+import struct
+import zlib
+
+import toml
+
+# ストーリー生成に使う文字（日本語の本文に近い文字種を混在させる）
+_TEXT_CHARS = (
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよ"
+    "らりるれろわをんがぎぐげござじずぜぞだでどばびぶべぼ"
+    "森城道扉剣影光闇王竜村塔川山火水風石夜朝声手目心"
+    "、。"
+)
+
+_CHOICE_TEMPLATES = [
+    "{}へ進む",
+    "{}を調べる",
+    "{}から逃げる",
+    "{}と話す",
+    "{}を待つ",
+]
+
+
+def scene_ids(num_scenes):
+    """
+    生成するシーンIDの一覧を返す。
+
+    引数:
+        num_scenes (int): シーン数。
+
+    戻り値:
+        list: 先頭が'BG'のシーンIDのリスト。
+    """
+    return ['BG'] + [str(i) for i in range(1, num_scenes)]
+
+
+def _random_text(rng, length):
+    """指定された長さのランダムな本文を生成する"""
+    return ''.join(rng.choice(_TEXT_CHARS) for _ in range(length))
+
+
+def make_svg(rng, width=400, height=300):
+    """
+    単純な図形を含むSVG画像を生成する。
+
+    引数:
+        rng (random.Random): 乱数生成器。
+        width (int, オプション): 画像の幅。
+        height (int, オプション): 画像の高さ。
+
+    戻り値:
+        str: SVGの内容。
+    """
+    color = f"#{rng.randrange(0x1000000):06x}"
+    cx, cy = rng.randrange(width), rng.randrange(height)
+    r = rng.randrange(10, min(width, height) // 2)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="{width}" height="{height}" fill="#f0f0f0"/>'
+        f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>'
+        '</svg>'
+    )
+
+
+def make_png(rng, width=64, height=48):
+    """
+    単色のPNG画像を生成する。
+
+    引数:
+        rng (random.Random): 乱数生成器。
+        width (int, オプション): 画像の幅。
+        height (int, オプション): 画像の高さ。
+
+    戻り値:
+        bytes: PNGファイルの内容。
+    """
+    def chunk(tag, data):
+        body = tag + data
+        return (struct.pack('>I', len(data)) + body
+                + struct.pack('>I', zlib.crc32(body) & 0xffffffff))
+
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + pixel * width for _ in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def iter_scenes(num_scenes, branching=3, text_length=200,
+                image_ratio=0.0, image_format='svg', seed=0):
+    """
+    合成シーンを1件ずつ生成する。
+
+    各シーンの遷移先は後続のシーンから選ぶため、全シーンが'BG'から
+    到達可能な前向きのグラフになる。一部の選択肢は過去のシーンへ戻る。
+
+    引数:
+        num_scenes (int): シーン数。
+        branching (int, オプション): 1シーンあたりの選択肢の数。
+        text_length (int, オプション): ストーリーの文字数。
+        image_ratio (float, オプション): 画像を持つシーンの割合（0〜1）。
+        image_format (str, オプション): 画像形式（'svg'または'png'）。
+        seed (int, オプション): 乱数シード。
+
+    戻り値:
+        generator: (シーンID, シーンデータの辞書, 画像データまたはNone)のタプル。
+    """
+    rng = random.Random(seed)
+    ids = scene_ids(num_scenes)
+
+    for index, scene_id in enumerate(ids):
+        choices = []
+        destinations = []
+        if index < num_scenes - 1:
+            # 次のシーンへの遷移を必ず含め、到達可能性を保証する
+            targets = [index + 1]
+            for _ in range(branching - 1):
+                if rng.random() < 0.1 and index > 0:
+                    targets.append(rng.randrange(0, index))
+                else:
+                    targets.append(rng.randrange(
+                        index + 1, min(num_scenes, index + 50)
+                    ))
+            for target in targets:
+                template = rng.choice(_CHOICE_TEMPLATES)
+                choices.append(template.format(_random_text(rng, 4)))
+                destinations.append(ids[target])
+
+        scene = {
+            'story': _random_text(rng, text_length),
+            'choices': choices,
+            'destinations': destinations,
+        }
+
+        image = None
+        if image_ratio and rng.random() < image_ratio:
+            ext = '.svg' if image_format == 'svg' else '.png'
+            scene['image'] = f"images/{scene_id}{ext}"
+            image = make_svg(rng) if image_format == 'svg' else make_png(rng)
+
+        yield scene_id, scene, image
+
+
+def generate_scenario_toml(num_scenes, **kwargs):
+    """
+    合成シナリオをTOML文字列として生成する。
+
+    引数:
+        num_scenes (int): シーン数。
+        **kwargs: iter_scenesに渡す追加の引数。
+
+    戻り値:
+        str: TOML形式の文字列（画像ファイルは生成しない）。
+    """
+    fragments = [
+        toml.dumps({scene_id: scene})
+        for scene_id, scene, _ in iter_scenes(num_scenes, **kwargs)
+    ]
+    return '\n'.join(fragments)
+
+
+def write_scenario(output_dir, num_scenes, **kwargs):
+    """
+    合成シナリオをscenario.tomlとimagesディレクトリに書き出す。
+
+    シーンごとに書き込むため、大規模なシナリオでもメモリ使用量は一定に保たれる。
+
+    引数:
+        output_dir (str): 出力先ディレクトリ。
+        num_scenes (int): シーン数。
+        **kwargs: iter_scenesに渡す追加の引数。
+
+    戻り値:
+        str: 書き出したscenario.tomlのパス。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    scenario_path = os.path.join(output_dir, 'scenario.toml')
+
+    with open(scenario_path, 'w', encoding='utf-8') as f:
+        for index, (scene_id, scene, image) in enumerate(
+            iter_scenes(num_scenes, **kwargs)
+        ):
+            if index:
+                f.write('\n')
+            f.write(toml.dumps({scene_id: scene}))
+
+            if image is not None:
+                image_path = os.path.join(output_dir, scene['image'])
+                os.makedirs(os.path.dirname(image_path), exist_ok=True)
+                if isinstance(image, str):
+                    with open(image_path, 'w', encoding='utf-8') as img:
+                        img.write(image)
+                else:
+                    with open(image_path, 'wb') as img:
+                        img.write(image)
+
+    return scenario_path
+
+
+def main():
+    """コマンドラインから合成シナリオを生成する"""
+    parser = argparse.ArgumentParser(description="合成シナリオを生成する")
+    parser.add_argument('output_dir', help="出力先ディレクトリ")
+    parser.add_argument('--scenes', type=int, default=100)
+    parser.add_argument('--branching', type=int, default=3)
+    parser.add_argument('--text-length', type=int, default=200)
+    parser.add_argument('--image-ratio', type=float, default=0.0)
+    parser.add_argument('--image-format', choices=['svg', 'png'], default='svg')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = write_scenario(
+        args.output_dir,
+        args.scenes,
+        branching=args.branching,
+        text_length=args.text_length,
+        image_ratio=args.image_ratio,
+        image_format=args.image_format,
+        seed=args.seed,
+    )
+    print(f"{args.scenes}シーンのシナリオを生成しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
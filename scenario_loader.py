@@ -0,0 +1,248 @@
+"""
+scenario.tomlをバックグラウンドで読み込むモジュール。
+
+プロセスごとに1つのスレッドがファイルをテーブルごとに読み込み
+（toml_export.import_toml_stream）、進捗と開始シーン（BG）を読み込んだ時点の
+シナリオを共有する。各セッションは読み込みが短時間で終わらない場合、
+開始シーンまでのシナリオで開始し、読み込みが終わった時点で
+シナリオ全体に置き換える。
+
+読み込んだ結果はファイルの更新時刻とサイズが変わるまで再利用し、
+セッションごとにコピーを渡す。バンドル（bundle.py）の場合は、圧縮された
+シーンの一覧を展開しながら読み込み、画像はバンドル内のメンバーを参照する。
+"""
+
+import hashlib
+import os
+import threading
+
+import streamlit as st
+
+from scenario_state import replace_scenario_data
+from scene_paths import START_SCENE
+
+# 読み込みの完了を待つ秒数（これを超える場合は最初のシーンで開始する）
+BLOCKING_SECONDS = 0.5
+
+# 進捗の表示を更新する間隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+_lock = threading.Lock()
+# ファイルの絶対パスをキー、読み込みの状態の辞書を値とする辞書
+_loaders = {}
+
+
+def _copy_scenario(scenario):
+    """セッションごとに変更できるようシナリオをコピーする"""
+    scenes, edges, image_data = scenario
+    return scenes.copy(), edges.copy(), dict(image_data)
+
+
+def _load(loader, path):
+    """ファイルを読み込むスレッドの処理"""
+    from bundle import index_size, is_bundle, open_index, resolve_images
+    from toml_export import finish_import, import_toml_stream
+
+    digest = hashlib.sha256()
+    bundled = is_bundle(path)
+    # 開始シーンを探し終えたシーンIDの数
+    searched = 0
+
+    def read_lines(f):
+        for line in f:
+            digest.update(line)
+            yield line
+
+    def progress(position, state):
+        nonlocal searched
+        loader['bytes'] = position
+        loader['scenes'] = len(state['ids'])
+        loader['skipped'] = len(state['skipped'])
+        if loader['first'] is None:
+            # 開始シーンのないシナリオではプレイできないため、読み込むまで待つ
+            found = START_SCENE in state['ids'][searched:]
+            searched = len(state['ids'])
+            if not found:
+                return
+            scenes, edges, image_data = finish_import(state)
+            if bundled:
+                image_data = resolve_images(path, image_data)
+            loader['first'] = (scenes, edges, image_data)
+            loader['first_ready'].set()
+
+    try:
+        if bundled:
+            loader['total'] = index_size(path)
+            opened = open_index(path)
+        else:
+            opened = open(path, 'rb')
+        with opened as f:
+            scenes, edges, image_data, skipped = import_toml_stream(
+                read_lines(f), progress
+            )
+        if bundled:
+            image_data = resolve_images(path, image_data)
+        loader['result'] = (scenes, edges, image_data)
+        loader['skipped'] = len(skipped)
+        loader['hash'] = digest.hexdigest()
+    except Exception as e:
+        loader['error'] = str(e)
+    finally:
+        loader['first_ready'].set()
+        loader['done'].set()
+
+
+def loaded_hash(path):
+    """
+    ファイルを読み込んだ結果の内容のハッシュを返す。
+
+    引数:
+        path (str or pathlib.Path): ファイルのパス。
+
+    戻り値:
+        tuple: (読み込みが終わっているかどうか, 内容のハッシュ)。
+            読み込みを開始していない場合と失敗した場合のハッシュはNone。
+    """
+    loader = _loaders.get(os.path.abspath(path))
+    if loader is None:
+        return True, None
+    if not loader['done'].is_set():
+        return False, None
+    return True, loader['hash']
+
+
+def start_loading(path):
+    """
+    ファイルの読み込みを開始する。同じ内容のファイルを読み込み中か
+    読み込み済みの場合は、その状態を返す。
+
+    引数:
+        path (pathlib.Path): シナリオファイルまたはバンドルのパス。
+
+    戻り値:
+        dict: 読み込んだバイト数（bytes）、ファイルのサイズ（total）、
+            シーン数（scenes）、読み飛ばしたテーブルの数（skipped）などを持つ
+            読み込みの状態の辞書。
+
+    例外:
+        OSError: ファイルの情報を取得できない場合。
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        loader = _loaders.get(key)
+        if loader is not None and loader['signature'] == signature:
+            return loader
+        loader = {
+            'signature': signature,
+            'bytes': 0,
+            'total': stat.st_size,
+            'scenes': 0,
+            'skipped': 0,
+            'first': None,
+            'result': None,
+            'hash': None,
+            'error': None,
+            'first_ready': threading.Event(),
+            'done': threading.Event(),
+        }
+        _loaders[key] = loader
+    threading.Thread(
+        target=_load, args=(loader, key), name='scenario-loader', daemon=True
+    ).start()
+    return loader
+
+
+def begin_session_load(path):
+    """
+    セッションのシナリオを読み込む。
+
+    読み込みがBLOCKING_SECONDS以内に終わらない場合は、開始シーン（BG）を
+    読み込んだ時点のシナリオを返し、残りはバックグラウンドで読み込む。
+    開始シーンのないファイルは読み込みが終わるまで待つ。
+    読み込みが終わっていれば、読み飛ばしたテーブルの数をセッションの
+    `scenario_skipped`に記録する。
+
+    引数:
+        path (pathlib.Path): シナリオファイルのパス。
+
+    戻り値:
+        tuple: (シーンの表, エッジの表, 画像データの辞書)。
+
+    例外:
+        OSError: ファイルの情報を取得できない場合。
+        ValueError: ファイルを読み込めなかった場合。
+    """
+    from scenario_watcher import set_scenario_source
+
+    loader = start_loading(path)
+    set_scenario_source(path)
+    if not loader['done'].wait(BLOCKING_SECONDS):
+        loader['first_ready'].wait()
+    if loader['error'] is not None:
+        raise ValueError(loader['error'])
+
+    if loader['result'] is not None:
+        st.session_state.scenario_hash = loader['hash']
+        st.session_state.scenario_skipped = loader['skipped']
+        return _copy_scenario(loader['result'])
+    st.session_state.scenario_loading = loader
+    return _copy_scenario(loader['first'])
+
+
+def is_loading():
+    """
+    セッションのシナリオをバックグラウンドで読み込み中かどうかを返す。
+
+    戻り値:
+        bool: 読み込み中の場合はTrue。
+    """
+    return 'scenario_loading' in st.session_state
+
+
+def apply_loaded_scenario():
+    """
+    バックグラウンドの読み込みが終わっていれば、セッションのシナリオを
+    読み込んだシナリオ全体に置き換える。
+
+    読み飛ばしたテーブルの数はセッションの`scenario_skipped`に記録する。
+
+    戻り値:
+        dict or None: 置き換えた場合は読み込みの状態の辞書、それ以外はNone。
+    """
+    loader = st.session_state.get('scenario_loading')
+    if loader is None or not loader['done'].is_set():
+        return None
+    del st.session_state['scenario_loading']
+    if loader['error'] is not None:
+        st.error(f"シナリオファイルの読み込みに失敗しました: {loader['error']}")
+        return None
+
+    scenes, edges, image_data = _copy_scenario(loader['result'])
+    replace_scenario_data(scenes, edges)
+    st.session_state.image_data.update(image_data)
+    st.session_state.scenario_hash = loader['hash']
+    st.session_state.scenario_skipped = loader['skipped']
+    return loader
+
+
+def show_loading_progress():
+    """
+    バックグラウンドの読み込みの進捗を表示し、終わればアプリ全体を再実行する。
+    """
+    if not is_loading():
+        return
+
+    @st.fragment(run_every=PROGRESS_INTERVAL)
+    def loading_progress():
+        """読み込みの進捗を表示する"""
+        loader = st.session_state.get('scenario_loading')
+        if loader is None or loader['done'].is_set():
+            st.rerun()
+        st.progress(
+            min(loader['bytes'] / max(loader['total'], 1), 1.0),
+            text=f"シナリオを読み込んでいます...（{loader['scenes']}シーン）"
+        )
+
+    loading_progress()
@@ -0,0 +1,239 @@
+"""
+セッションのシナリオデータと、それに付随するインデックスを管理するモジュール。
+
+シナリオはシーンの表（st.session_state.data）と選択肢のエッジの表
+（st.session_state.edges）で保持する。データを置き換えるたびにリビジョン番号を
+進め、全文検索インデックス、リンクインデックス、シーンごとの選択肢の一覧、
+シーンIDから行を引く辞書を、変更された行だけ更新するか、次回の利用時に
+再構築する。
+"""
+
+import streamlit as st
+
+from link_index import (
+    build_link_index,
+    incoming_links,
+    rename_scene,
+    update_edges,
+    update_rows
+)
+from scene_model import choices_by_scene, optimize_scenario, scene_rows
+from scene_paths import shortest_path_tree
+from search_index import build_index, rename_document, update_scenes
+
+# リビジョン番号に対応付けて保持するインデックスのキー
+INDEX_KEYS = ('search_index', 'link_index', 'choice_map', 'scene_rows')
+
+
+def _cached_index(key, builder, message):
+    """リビジョンが一致するインデックスを返し、なければ構築する"""
+    revision = st.session_state.get('data_revision', 0)
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] != revision:
+        with st.spinner(message):
+            cached = (revision, builder(
+                st.session_state.data, st.session_state.edges
+            ))
+        st.session_state[key] = cached
+    return cached[1]
+
+
+def get_search_index():
+    """
+    セッションの全文検索インデックスを取得する。
+
+    最初の検索時に構築し、シナリオデータが置き換えられるまで再利用する。
+
+    戻り値:
+        dict: 全文検索インデックス。
+    """
+    return _cached_index(
+        'search_index', build_index, "検索インデックスを構築しています..."
+    )
+
+
+def get_link_index():
+    """
+    セッションのリンクインデックスを取得する。
+
+    戻り値:
+        dict: リンクインデックス。
+    """
+    return _cached_index(
+        'link_index', build_link_index, "リンクを集計しています..."
+    )
+
+
+def get_choice_map():
+    """
+    シーンごとの選択肢の一覧を取得する。
+
+    戻り値:
+        dict: シーンIDをキー、(選択肢のテキスト, 遷移先)のリストを値とする辞書。
+    """
+    return _cached_index(
+        'choice_map',
+        lambda _, edges: choices_by_scene(edges),
+        "選択肢を集計しています..."
+    )
+
+
+def get_scene_rows():
+    """
+    シーンIDから行のインデックスラベルを引く辞書を取得する。
+
+    戻り値:
+        dict: シーンIDをキー、行のインデックスラベルを値とする辞書。
+    """
+    return _cached_index(
+        'scene_rows', lambda df, _: scene_rows(df), "シーンを集計しています..."
+    )
+
+
+def get_shortest_paths():
+    """
+    シーン'BG'からの最短経路木を取得する。
+
+    編集による変更は経路全体に影響しうるため、差分では更新せず、
+    リビジョンが変わった後の最初の利用時に再構築する。
+
+    戻り値:
+        dict: 到達できるシーンIDをキー、最短経路上の(1つ前のシーンID,
+            選択肢の番号)を値とする辞書。
+    """
+    return _cached_index(
+        'shortest_paths',
+        lambda df, edges: shortest_path_tree(get_choice_map(), get_scene_rows()),
+        "最短経路を計算しています..."
+    )
+
+
+def _row_ids(df, labels):
+    """指定された行のシーンIDの集合を返す"""
+    labels = df.index.intersection(list(labels))
+    return set(df.loc[labels, 'ID'].dropna())
+
+
+def _edge_sources(edges, labels):
+    """指定されたエッジの遷移元のシーンIDの集合を返す"""
+    labels = edges.index.intersection(list(labels))
+    return set(edges.loc[labels, 'source'])
+
+
+def _retag_indexes(revision):
+    """前のリビジョンのインデックスを新しいリビジョンに対応付ける"""
+    for key in INDEX_KEYS:
+        cached = st.session_state.get(key)
+        if cached is not None and cached[0] == revision:
+            st.session_state[key] = (revision + 1, cached[1])
+        else:
+            st.session_state.pop(key, None)
+
+
+def replace_scenario_data(df, edges, changed_rows=None):
+    """
+    セッションのシナリオデータを置き換える。
+
+    シーンの表とエッジの表の列は、メモリ効率のよい型に揃えてから保持する。
+
+    引数:
+        df (pandas.DataFrame): 新しいシーンの表。
+        edges (pandas.DataFrame): 新しいエッジの表。
+        changed_rows (iterable, オプション): 変更されたシーンの行のインデックスラベル。
+            指定された場合は構築済みのインデックスをその行と、追加・削除された
+            行とエッジだけ更新する。Noneの場合は次回の利用時に再構築する。
+            エッジは変更のたびに新しいラベルで追加されることを前提とする。
+    """
+    revision = st.session_state.get('data_revision', 0)
+    old_df = st.session_state.get('data')
+    old_edges = st.session_state.get('edges')
+    df, edges = optimize_scenario(df, edges)
+
+    st.session_state.data = df
+    st.session_state.edges = edges
+    st.session_state.data_revision = revision + 1
+
+    if changed_rows is None or old_df is None or old_edges is None:
+        for key in INDEX_KEYS:
+            st.session_state.pop(key, None)
+        return
+
+    rows = set(changed_rows)
+    rows.update(old_df.index.symmetric_difference(df.index))
+    edge_labels = set(old_edges.index.symmetric_difference(edges.index))
+    changed_ids = (
+        _row_ids(old_df, rows) | _row_ids(df, rows) |
+        _edge_sources(old_edges, edge_labels) | _edge_sources(edges, edge_labels)
+    )
+
+    for key in INDEX_KEYS:
+        cached = st.session_state.get(key)
+        if cached is None or cached[0] != revision:
+            st.session_state.pop(key, None)
+            continue
+
+        if key == 'search_index':
+            update_scenes(cached[1], df, edges, changed_ids)
+        elif key == 'link_index':
+            update_rows(cached[1], df, rows)
+            update_edges(cached[1], edges, edge_labels)
+        elif key == 'scene_rows':
+            rows_by_id = cached[1]
+            for scene_id in changed_ids:
+                rows_by_id.pop(scene_id, None)
+            rows_by_id.update(scene_rows(df[df['ID'].isin(changed_ids)]))
+        else:
+            choice_map = cached[1]
+            for scene_id in changed_ids:
+                choice_map.pop(scene_id, None)
+            choice_map.update(
+                choices_by_scene(edges[edges['source'].isin(changed_ids)])
+            )
+        st.session_state[key] = (revision + 1, cached[1])
+
+
+def rename_scene_id(old_id, new_id):
+    """
+    シーンIDを変更し、そのシーンの選択肢とそのシーンを指す全ての遷移先を書き換える。
+
+    シナリオデータはその場で更新し、インデックスは変更されたシーンだけ更新する。
+
+    引数:
+        old_id (str): 変更前のシーンID。
+        new_id (str): 変更後のシーンID。
+
+    戻り値:
+        int: 書き換えた遷移先の数。
+
+    例外:
+        ValueError: IDを変更できない場合。
+    """
+    df = st.session_state.data
+    edges = st.session_state.edges
+    link_index = get_link_index()
+    revision = st.session_state.get('data_revision', 0)
+
+    count = rename_scene(df, edges, link_index, old_id, new_id)
+
+    search_index = st.session_state.get('search_index')
+    if search_index is not None and search_index[0] == revision:
+        rename_document(search_index[1], old_id, new_id)
+
+    cached = st.session_state.get('scene_rows')
+    if cached is not None and cached[0] == revision and old_id in cached[1]:
+        cached[1][new_id] = cached[1].pop(old_id)
+
+    cached = st.session_state.get('choice_map')
+    if cached is not None and cached[0] == revision:
+        choice_map = cached[1]
+        if old_id in choice_map:
+            choice_map[new_id] = choice_map.pop(old_id)
+        for source in {source for source, _, _ in incoming_links(link_index, new_id)}:
+            choice_map[source] = [
+                (label, new_id if dest == old_id else dest)
+                for label, dest in choice_map.get(source, [])
+            ]
+
+    st.session_state.data_revision = revision + 1
+    _retag_indexes(revision)
+    return count
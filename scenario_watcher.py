@@ -0,0 +1,319 @@
+"""
+外部で編集されたscenario.tomlを実行中のセッションに反映するモジュール。
+
+プロセスごとに1つのバックグラウンドスレッドがファイルの更新時刻を監視し、
+更新時刻が変わった場合は内容のハッシュを比較する。内容が変わっていれば
+バックグラウンドで解析し、解析結果をプロセス内で共有する。最初の確認では
+scenario_loaderが読み込んだ内容のハッシュと比較し、読み込みの後に
+編集されていれば反映する。
+
+各セッションは自分が読み込んだ内容のハッシュを保持し、新しい解析結果が
+あればシーンごとに比較して、変更・追加・削除されたシーンとその選択肢、
+画像だけを反映する。インデックスは変更されたシーンの分だけ更新される。
+
+セッションのシナリオの読み込み元（`scenario_source`）が監視中のファイルで
+ない場合（アップロードしたシナリオやバンドルなど）は反映しない。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import streamlit as st
+
+from bundle import split_member_path
+from scenario_loader import is_loading, loaded_hash
+from scenario_state import replace_scenario_data
+from scene_model import clean_value
+from settings import get_setting
+
+# 監視の既定の間隔（秒）
+DEFAULT_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_state = {
+    'path': None,
+    'mtime': None,
+    'hash': None,
+    'scenario': None,
+    'thread': None,
+}
+
+
+def set_scenario_source(path, digest=None):
+    """
+    セッションのシナリオの読み込み元を記録する。
+
+    引数:
+        path (str or pathlib.Path or None): 読み込み元のファイルのパス。
+            ファイルから読み込んでいない場合はNone。
+        digest (str, オプション): 読み込み元のファイルの内容のハッシュ。
+            指定した場合は、この内容を反映済みとして扱う。
+    """
+    st.session_state.scenario_source = (
+        None if path is None else os.path.abspath(path)
+    )
+    if digest is not None:
+        st.session_state.scenario_hash = digest
+
+
+def file_digest(data):
+    """
+    ファイルの内容のハッシュを計算する。
+
+    引数:
+        data (bytes): ファイルの内容。
+
+    戻り値:
+        str: ハッシュの16進文字列。
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _image_key(path):
+    """
+    画像のパスを比較用の形に変換する。バンドル内の画像はメンバー名
+    （images/シーンID.拡張子）にし、scenario.tomlに記録するパスと一致させる。
+    """
+    if path is None:
+        return None
+    location = split_member_path(path)
+    if location is not None:
+        return location[1]
+    return path.replace(os.sep, '/')
+
+
+def scene_signatures(scenes, edges, image_data):
+    """
+    シーンごとの比較用の値を作成する。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        image_data (dict): 画像データの辞書。
+
+    戻り値:
+        dict: シーンIDをキー、(ストーリー, 選択肢のタプル, 画像のパス)を値とする辞書。
+            バンドル内の画像のパスはメンバー名で比較する。
+    """
+    choices = {}
+    ordered = edges.sort_values('order', kind='stable')
+    for source, order, label, destination in zip(
+        ordered['source'].tolist(),
+        ordered['order'].tolist(),
+        ordered['label'].tolist(),
+        ordered['destination'].tolist()
+    ):
+        choices.setdefault(source, []).append(
+            (int(order), clean_value(label), clean_value(destination))
+        )
+
+    signatures = {}
+    for scene_id, story in zip(scenes['ID'].tolist(), scenes['ストーリー'].tolist()):
+        scene_id = clean_value(scene_id)
+        if scene_id and scene_id not in signatures:
+            signatures[scene_id] = (
+                clean_value(story),
+                tuple(choices.get(scene_id, ())),
+                _image_key(image_data.get(scene_id))
+            )
+    return signatures
+
+
+def _poll(path):
+    """ファイルの更新を確認し、内容が変わっていれば解析して共有する"""
+    from toml_export import import_from_toml
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == _state['mtime']:
+            return
+    except OSError:
+        return
+    if _state['hash'] is None:
+        # 最初の確認は、セッションが読み込んだ内容と比較できるようになってから行う
+        loaded, seed = loaded_hash(path)
+        if not loaded:
+            return
+    else:
+        seed = None
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return
+
+    digest = file_digest(data)
+    with _lock:
+        _state['mtime'] = mtime
+        if digest == _state['hash']:
+            return
+        _state['hash'] = digest
+    if digest == seed:
+        # 読み込み済みの内容から変わっていなければ解析しない
+        return
+
+    try:
+        scenes, edges, image_data = import_from_toml(data.decode('utf-8'))
+    except Exception:
+        return
+    if scenes is None:
+        return
+
+    scenario = {
+        'hash': digest,
+        'scenes': scenes,
+        'edges': edges,
+        'image_data': image_data,
+        'signatures': scene_signatures(scenes, edges, image_data),
+    }
+    with _lock:
+        if _state['hash'] == digest:
+            _state['scenario'] = scenario
+
+
+def _watch(path, interval):
+    """ファイルを定期的に確認するスレッドの処理"""
+    while True:
+        _poll(path)
+        time.sleep(interval)
+
+
+def start_watcher(path):
+    """
+    ファイルの監視を開始する。プロセス内で既に開始している場合は何もしない。
+
+    settings.tomlの`hot_reload`がfalseの場合は監視しない。
+
+    引数:
+        path (pathlib.Path): 監視するシナリオファイルのパス。
+    """
+    if not get_setting('hot_reload', True):
+        return
+    with _lock:
+        if _state['thread'] is not None:
+            return
+        path = Path(os.path.abspath(path))
+        _state['path'] = str(path)
+        interval = float(get_setting('reload_interval', DEFAULT_INTERVAL))
+        _state['thread'] = threading.Thread(
+            target=_watch, args=(path, interval), name='scenario-watcher',
+            daemon=True
+        )
+        _state['thread'].start()
+
+
+def has_update():
+    """
+    セッションが読み込んだ内容より新しい解析結果があるかどうかを返す。
+
+    戻り値:
+        bool: 新しい解析結果があり、セッションのシナリオを監視中のファイルから
+            読み込んでいる場合はTrue。
+    """
+    scenario = _state['scenario']
+    return (scenario is not None and
+            st.session_state.get('scenario_source') == _state['path'] and
+            scenario['hash'] != st.session_state.get('scenario_hash'))
+
+
+def apply_scenario_update():
+    """
+    新しい解析結果とセッションのシナリオをシーンごとに比較し、差分だけを反映する。
+
+    現在のシーンが削除された場合はシーン'BG'に戻す。シナリオを
+    バックグラウンドで読み込み中の場合は、読み込みが終わるまで反映しない。
+    監視中のファイル以外から読み込んだシナリオには反映しない。
+
+    戻り値:
+        int: 変更、追加、削除されたシーンの数。
+    """
+    if not has_update() or is_loading():
+        return 0
+    scenario = _state['scenario']
+    st.session_state.scenario_hash = scenario['hash']
+
+    data = st.session_state.data
+    edges = st.session_state.edges
+    image_data = st.session_state.image_data
+    new_signatures = scenario['signatures']
+    old_signatures = scene_signatures(data, edges, image_data)
+    changed = {
+        scene_id for scene_id in old_signatures.keys() | new_signatures.keys()
+        if old_signatures.get(scene_id) != new_signatures.get(scene_id)
+    }
+    if not changed:
+        return 0
+
+    import pandas as pd
+
+    new_scenes = scenario['scenes']
+    new_edges = scenario['edges']
+    stories = dict(zip(
+        new_scenes['ID'].tolist(), new_scenes['ストーリー'].tolist()
+    ))
+
+    # 既存のシーンは行の位置を保ったまま更新し、削除されたシーンの行を除く
+    ids = data['ID']
+    in_changed = ids.isin(changed)
+    kept = in_changed & ~ids.duplicated() & ids.isin(list(stories))
+    updated = data.drop(index=data.index[in_changed & ~kept])
+    changed_rows = []
+    for label in data.index[kept]:
+        updated.at[label, 'ストーリー'] = stories[ids[label]]
+        changed_rows.append(label)
+
+    added = [
+        scene_id for scene_id in new_scenes['ID'].tolist()
+        if scene_id in changed and scene_id not in old_signatures
+    ]
+    if added:
+        start = (data.index.max() + 1) if len(data.index) else 0
+        labels = pd.RangeIndex(start, start + len(added))
+        updated = pd.concat([updated, pd.DataFrame(
+            {'ID': added, 'ストーリー': [stories[i] for i in added]},
+            index=labels
+        )])
+        changed_rows.extend(labels)
+
+    # 変更されたシーンの選択肢は新しいエッジに置き換える
+    replaced = new_edges[new_edges['source'].isin(changed)]
+    start = (edges.index.max() + 1) if len(edges.index) else 0
+    updated_edges = pd.concat([
+        edges[~edges['source'].isin(changed)],
+        replaced.set_axis(pd.RangeIndex(start, start + len(replaced)))
+    ])
+
+    for scene_id in changed:
+        image_path = scenario['image_data'].get(scene_id)
+        if image_path is None:
+            image_data.pop(scene_id, None)
+        elif _image_key(image_path) != _image_key(image_data.get(scene_id)):
+            # 同じ画像を指している場合はバンドル内の画像のパスを残す
+            image_data[scene_id] = image_path
+
+    replace_scenario_data(updated, updated_edges, changed_rows)
+
+    if st.session_state.get('current_scene') not in new_signatures:
+        st.session_state.current_scene = 'BG'
+    return len(changed)
+
+
+def show_reload_watcher():
+    """
+    解析結果の更新を定期的に確認し、更新があればアプリ全体を再実行する。
+
+    再実行の際にapply_scenario_updateで差分が反映される。
+    """
+    if _state['thread'] is None:
+        return
+    interval = float(get_setting('reload_interval', DEFAULT_INTERVAL))
+
+    @st.fragment(run_every=interval)
+    def check_for_update():
+        """新しい解析結果があればアプリ全体を再実行する"""
+        if has_update():
+            st.rerun()
+
+    check_for_update()
@@ -0,0 +1,314 @@
+"""
+シーンと選択肢のデータモデルを提供するモジュール。
+
+シナリオはシーンの表（ID、ストーリー）と、選択肢のエッジの表
+（source: 遷移元のシーンID、order: 選択肢の番号、label: 選択肢のテキスト、
+destination: 遷移先のシーンID）の2つのDataFrameで保持する。
+選択肢の数に上限はなく、存在しない選択肢の列は持たない。
+データエディターには、選択1、選択1遷移先、...の列を持つ
+平坦化した表として表示する。
+
+シーンIDと選択肢の列は、セルごとのPythonオブジェクトを持たないArrowの
+文字列型で保持する。ストーリーは日本語ではUTF-8のArrowよりPythonの文字列の
+方が小さいため、同じ本文を1つのオブジェクトにまとめたobject型で保持する。
+"""
+
+import re
+import sys
+
+import pandas as pd
+
+SCENE_COLUMNS = ['ID', 'ストーリー']
+EDGE_COLUMNS = ['source', 'order', 'label', 'destination']
+
+# 平坦化した表に最低限用意する選択肢の数
+MIN_CHOICE_SLOTS = 3
+
+# 平坦化した表の遷移先の列名（選択1遷移先、選択2遷移先、...）
+DESTINATION_COLUMN = re.compile(r'選択(\d+)遷移先')
+
+# シーンIDと選択肢の列の型（pyarrowがない場合はobject型）
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype('pyarrow', na_value=float('nan'))
+except (ImportError, TypeError):
+    STRING_DTYPE = object
+
+# Arrowの文字列型で保持するエッジの表の列
+EDGE_STRING_COLUMNS = ['source', 'label', 'destination']
+
+
+def clean_value(value):
+    """
+    セルの値を前後の空白を除いた文字列に変換する。
+
+    引数:
+        value: DataFrameのセル値。
+
+    戻り値:
+        str: 変換された文字列。欠損値や'none'は空文字列。
+    """
+    if value is None or value != value:
+        return ''
+    value = str(value).strip()
+    return '' if value.lower() == 'none' else value
+
+
+def dedupe_strings(values):
+    """
+    同じ内容の文字列を1つのオブジェクトにまとめる。
+
+    引数:
+        values (iterable): 文字列のリスト。
+
+    戻り値:
+        list: 同じ内容の要素が同じオブジェクトを指すリスト。
+    """
+    seen = {}
+    return [seen.setdefault(value, value) for value in values]
+
+
+def new_scenes(ids=(), stories=()):
+    """
+    シーンの表を作成する。
+
+    引数:
+        ids (list, オプション): シーンIDのリスト。
+        stories (list, オプション): ストーリーのリスト。
+
+    戻り値:
+        pandas.DataFrame: シーンの表。
+    """
+    return pd.DataFrame({
+        'ID': pd.Series(list(ids), dtype=STRING_DTYPE),
+        'ストーリー': pd.Series(dedupe_strings(stories), dtype=object),
+    })
+
+
+def new_edges(sources=(), orders=(), labels=(), destinations=()):
+    """
+    選択肢のエッジの表を作成する。
+
+    引数:
+        sources (list, オプション): 遷移元のシーンIDのリスト。
+        orders (list, オプション): 選択肢の番号（1から始まる）のリスト。
+        labels (list, オプション): 選択肢のテキストのリスト。
+        destinations (list, オプション): 遷移先のシーンIDのリスト。
+
+    戻り値:
+        pandas.DataFrame: エッジの表。
+    """
+    return pd.DataFrame({
+        'source': pd.Series(list(sources), dtype=STRING_DTYPE),
+        'order': pd.Series(list(orders), dtype='int32'),
+        'label': pd.Series(list(labels), dtype=STRING_DTYPE),
+        'destination': pd.Series(list(destinations), dtype=STRING_DTYPE),
+    })
+
+
+def optimize_scenario(scenes, edges):
+    """
+    シーンの表とエッジの表の列を、メモリ効率のよい型に揃える。
+
+    既に揃っている列は変換しない。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+
+    戻り値:
+        tuple: 型を揃えた(シーンの表, エッジの表)。
+    """
+    if scenes['ID'].dtype != STRING_DTYPE:
+        scenes = scenes.assign(ID=scenes['ID'].astype(STRING_DTYPE))
+    if scenes['ストーリー'].dtype != object:
+        scenes = scenes.assign(ストーリー=pd.Series(
+            dedupe_strings(scenes['ストーリー'].tolist()),
+            index=scenes.index, dtype=object
+        ))
+
+    converted = {
+        column: edges[column].astype(STRING_DTYPE)
+        for column in EDGE_STRING_COLUMNS
+        if edges[column].dtype != STRING_DTYPE
+    }
+    if edges['order'].dtype != 'int32':
+        converted['order'] = edges['order'].astype('int32')
+    if converted:
+        edges = edges.assign(**converted)
+    return scenes, edges
+
+
+def _column_bytes(series):
+    """列のメモリ使用量を返す。object型では共有された文字列を1回だけ数える"""
+    if series.dtype != object:
+        return int(series.memory_usage(deep=True, index=False))
+    unique = {id(value): value for value in series.tolist()}
+    return 8 * len(series) + sum(sys.getsizeof(value) for value in unique.values())
+
+
+def scene_rows(scenes):
+    """
+    シーンIDから行のインデックスラベルを引く辞書を作成する。
+
+    同じIDの行が複数ある場合は最初の行を使う。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+
+    戻り値:
+        dict: シーンIDをキー、行のインデックスラベルを値とする辞書。
+    """
+    rows = {}
+    for scene_id, label in zip(scenes['ID'].tolist(), scenes.index.tolist()):
+        rows.setdefault(scene_id, label)
+    return rows
+
+
+def memory_report(scenes, edges):
+    """
+    シナリオのメモリ使用量を列ごとに集計する。
+
+    引数:
+        scenes (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+
+    戻り値:
+        list: 表、列、型、バイト数の辞書のリスト。最後の要素は合計。
+    """
+    rows = []
+    for table, frame in (('scenes', scenes), ('edges', edges)):
+        rows.append({
+            'table': table, 'column': 'index', 'dtype': type(frame.index).__name__,
+            'bytes': int(frame.index.memory_usage(deep=True)),
+        })
+        for column in frame.columns:
+            rows.append({
+                'table': table,
+                'column': column,
+                'dtype': str(frame[column].dtype),
+                'bytes': _column_bytes(frame[column]),
+            })
+    rows.append({
+        'table': 'total', 'column': '', 'dtype': '',
+        'bytes': sum(row['bytes'] for row in rows),
+    })
+    return rows
+
+
+def empty_scenario():
+    """
+    シーン'BG'だけを持つ新規シナリオを作成する。
+
+    戻り値:
+        tuple: (シーンの表, エッジの表)。
+    """
+    return new_scenes(['BG'], ['']), new_edges()
+
+
+def choices_by_scene(edges):
+    """
+    シーンごとの選択肢の一覧を作成する。
+
+    テキストと遷移先の両方がある選択肢だけを、番号順に含める。
+
+    引数:
+        edges (pandas.DataFrame): エッジの表。
+
+    戻り値:
+        dict: シーンIDをキー、(選択肢のテキスト, 遷移先)のリストを値とする辞書。
+    """
+    ordered = edges.sort_values(['source', 'order'], kind='stable')
+    choices = {}
+    for source, label, destination in zip(
+        ordered['source'].tolist(),
+        ordered['label'].tolist(),
+        ordered['destination'].tolist()
+    ):
+        label = clean_value(label)
+        destination = clean_value(destination)
+        if label and destination:
+            choices.setdefault(source, []).append((label, destination))
+    return choices
+
+
+def to_flat(scenes, edges, extra_slots=1):
+    """
+    シーンの表とエッジの表を、データエディター用の平坦な表に変換する。
+
+    引数:
+        scenes (pandas.DataFrame): 変換するシーンの表（一部の行でもよい）。
+        edges (pandas.DataFrame): エッジの表。
+        extra_slots (int, オプション): 選択肢を追加できるよう末尾に加える空の列の数。
+
+    戻り値:
+        pandas.DataFrame: scenesと同じインデックスを持つ平坦な表。
+    """
+    ids = [clean_value(value) for value in scenes['ID'].tolist()]
+    related = edges[edges['source'].isin(ids)]
+
+    slots = {}
+    for source, order, label, destination in zip(
+        related['source'].tolist(),
+        related['order'].tolist(),
+        related['label'].tolist(),
+        related['destination'].tolist()
+    ):
+        slots.setdefault((source, int(order)), (label, destination))
+
+    max_order = max((order for _, order in slots), default=0)
+    num_slots = max(MIN_CHOICE_SLOTS, max_order + extra_slots)
+
+    flat = scenes[SCENE_COLUMNS].copy()
+    for i in range(1, num_slots + 1):
+        flat[f'選択{i}'] = [
+            slots.get((scene_id, i), ('', ''))[0] for scene_id in ids
+        ]
+    for i in range(1, num_slots + 1):
+        flat[f'選択{i}遷移先'] = [
+            slots.get((scene_id, i), ('', ''))[1] for scene_id in ids
+        ]
+    return flat
+
+
+def from_flat(flat):
+    """
+    データエディターの平坦な表を、シーンの表とエッジの表に変換する。
+
+    テキストか遷移先のどちらかが入力された選択肢をエッジとして残す。
+
+    引数:
+        flat (pandas.DataFrame): 平坦な表。
+
+    戻り値:
+        tuple: (flatと同じインデックスを持つシーンの表, エッジの表)。
+    """
+    scenes = flat[SCENE_COLUMNS].copy()
+    ids = [clean_value(value) for value in flat['ID'].tolist()]
+    scenes['ID'] = ids
+
+    slots = sorted(
+        int(match.group(1)) for match in
+        (DESTINATION_COLUMN.fullmatch(str(c)) for c in flat.columns) if match
+    )
+    labels_by_slot = {
+        slot: [clean_value(v) for v in flat[f'選択{slot}'].tolist()]
+        if f'選択{slot}' in flat.columns else [''] * len(flat)
+        for slot in slots
+    }
+    dests_by_slot = {
+        slot: [clean_value(v) for v in flat[f'選択{slot}遷移先'].tolist()]
+        for slot in slots
+    }
+
+    records = []
+    for row, scene_id in enumerate(ids):
+        if not scene_id:
+            continue
+        for slot in slots:
+            label = labels_by_slot[slot][row]
+            destination = dests_by_slot[slot][row]
+            if label or destination:
+                records.append((scene_id, slot, label, destination))
+
+    return scenes, new_edges(*zip(*records)) if records else new_edges()
@@ -0,0 +1,70 @@
+"""
+シーン'BG'から各シーンへの最短経路を提供するモジュール。
+
+選択肢をたどる幅優先探索を1回行い、到達できる全てのシーンについて
+最短経路上の1つ前のシーンと選択肢の番号を記録する（最短経路木）。
+経路はこの記録を遷移先から逆にたどるだけで求まるため、100k規模の
+シナリオでも経路の長さに比例する時間で答えられる。
+
+最短経路木はscenario_stateがセッションのリビジョンに対応付けて保持し、
+シナリオが編集されると次回の利用時に再構築する。
+"""
+
+from collections import deque
+
+# 経路の起点のシーン
+START_SCENE = 'BG'
+
+
+def shortest_path_tree(choice_map, scene_ids, start=START_SCENE):
+    """
+    起点のシーンから幅優先探索を行い、最短経路木を作成する。
+
+    存在しないシーンへの選択肢はたどらない。
+
+    引数:
+        choice_map (dict): シーンIDごとの(選択肢のテキスト, 遷移先)のリスト。
+        scene_ids (collections.abc.Container): 存在するシーンIDの集合。
+        start (str, オプション): 起点のシーンID。
+
+    戻り値:
+        dict: 到達できるシーンIDをキー、最短経路上の(1つ前のシーンID,
+            選択肢の番号)を値とする辞書。起点の値はNone。
+            起点が存在しない場合は空の辞書。
+    """
+    if start not in scene_ids:
+        return {}
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        scene_id = queue.popleft()
+        for order, (_, destination) in enumerate(
+            choice_map.get(scene_id, ()), start=1
+        ):
+            if destination not in parents and destination in scene_ids:
+                parents[destination] = (scene_id, order)
+                queue.append(destination)
+    return parents
+
+
+def path_to(parents, scene_id):
+    """
+    最短経路木から起点のシーンまでの経路を求める。
+
+    引数:
+        parents (dict): shortest_path_treeで作成した最短経路木。
+        scene_id (str): 目的のシーンID。
+
+    戻り値:
+        list or None: 起点から順の(シーンID, 次のシーンへ進む選択肢の番号)の
+            リスト。最後の要素の番号はNone。到達できない場合はNone。
+    """
+    if scene_id not in parents:
+        return None
+    path = [(scene_id, None)]
+    step = parents[scene_id]
+    while step is not None:
+        path.append(step)
+        step = parents[step[0]]
+    path.reverse()
+    return path
@@ -0,0 +1,312 @@
+"""
+ストーリーと選択肢の全文検索インデックスを提供するモジュール。
+
+空白で区切られない日本語の本文も検索できるよう、文字のバイグラム
+（と1文字検索用のユニグラム）をキーとする転置インデックスを構築する。
+ポスティングリストには文書番号を整数配列として追加していくため、
+シーンの追加・変更は該当シーン分の処理だけで反映できる。
+削除されたシーンは墓標として残し、一定量を超えたら詰め直す。
+
+検索語の指定方法:
+    - 空白区切りの複数の語は全てを含むシーンに一致する（AND検索）
+    - "..."で囲んだ語は空白を含むフレーズとして検索する
+    - 末尾に*を付けた語は、ストーリーまたは選択肢の先頭に一致する（前方一致）
+"""
+
+import re
+import unicodedata
+from array import array
+from collections import defaultdict
+
+from scene_model import clean_value
+
+# 削除済み文書がこの件数と全体の半分を超えたらインデックスを詰め直す
+COMPACT_THRESHOLD = 1000
+
+_QUERY_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def normalize_text(text):
+    """
+    検索用に文字列を正規化する。
+
+    全角英数字や半角カナの表記ゆれを統一し、大文字と小文字を区別しない。
+
+    引数:
+        text (str): 正規化する文字列。
+
+    戻り値:
+        str: 正規化された文字列。
+    """
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _grams(text):
+    """文字列に含まれるユニグラムとバイグラムの集合を返す"""
+    grams = set(text)
+    grams.update(map(str.__add__, text, text[1:]))
+    grams.discard('\n')
+    return grams
+
+
+def scene_texts(df, edges, scene_ids=None):
+    """
+    シーンごとの検索対象テキストを作成する。
+
+    ストーリーと選択肢のテキストを改行で連結する。
+    同じIDの行が複数ある場合はまとめて1件とする。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+        scene_ids (iterable, オプション): 対象とするシーンID。Noneの場合は全シーン。
+
+    戻り値:
+        dict: シーンIDをキー、正規化されたテキストを値とする辞書。
+    """
+    if scene_ids is not None:
+        wanted = set(scene_ids)
+        df = df[df['ID'].isin(wanted)]
+        edges = edges[edges['source'].isin(wanted)]
+
+    labels = {}
+    ordered = edges.sort_values('order', kind='stable')
+    for source, label in zip(ordered['source'].tolist(), ordered['label'].tolist()):
+        label = clean_value(label)
+        if label:
+            labels.setdefault(source, []).append(label)
+
+    texts = {}
+    for scene_id, story in zip(df['ID'].tolist(), df['ストーリー'].tolist()):
+        scene_id = clean_value(scene_id)
+        if not scene_id:
+            continue
+        fields = [clean_value(story)] if scene_id in texts else [
+            clean_value(story), *labels.get(scene_id, [])
+        ]
+        text = normalize_text('\n'.join(field for field in fields if field))
+        if scene_id in texts:
+            texts[scene_id] += '\n' + text
+        else:
+            texts[scene_id] = text
+    return texts
+
+
+def new_index():
+    """
+    空の検索インデックスを作成する。
+
+    戻り値:
+        dict: 検索インデックス。
+    """
+    return {
+        'postings': {},
+        'docs': [],
+        'scene_ids': [],
+        'doc_ids': {},
+        'removed': 0,
+    }
+
+
+def add_scene(index, scene_id, text):
+    """
+    シーンをインデックスに追加する。既に登録済みの場合は置き換える。
+
+    引数:
+        index (dict): 検索インデックス。
+        scene_id (str): シーンID。
+        text (str): 正規化されたテキスト。
+    """
+    if scene_id in index['doc_ids']:
+        remove_scene(index, scene_id)
+
+    doc = len(index['docs'])
+    index['docs'].append(text)
+    index['scene_ids'].append(scene_id)
+    index['doc_ids'][scene_id] = doc
+
+    postings = index['postings']
+    for gram in _grams(text):
+        posting = postings.get(gram)
+        if posting is None:
+            posting = postings[gram] = array('i')
+        posting.append(doc)
+
+
+def remove_scene(index, scene_id):
+    """
+    シーンをインデックスから削除する。
+
+    引数:
+        index (dict): 検索インデックス。
+        scene_id (str): シーンID。
+    """
+    doc = index['doc_ids'].pop(scene_id, None)
+    if doc is None:
+        return
+
+    index['docs'][doc] = None
+    index['removed'] += 1
+    if (index['removed'] > COMPACT_THRESHOLD and
+            index['removed'] * 2 > len(index['docs'])):
+        _compact(index)
+
+
+def _compact(index):
+    """削除済みの文書を取り除いてインデックスを作り直す"""
+    live = [
+        (index['scene_ids'][doc], index['docs'][doc])
+        for doc in sorted(index['doc_ids'].values())
+    ]
+    index.update(new_index())
+    for scene_id, text in live:
+        add_scene(index, scene_id, text)
+    index['removed'] = 0
+
+
+def build_index(df, edges):
+    """
+    シーンの表とエッジの表から検索インデックスを構築する。
+
+    引数:
+        df (pandas.DataFrame): シーンの表。
+        edges (pandas.DataFrame): 選択肢のエッジの表。
+
+    戻り値:
+        dict: 検索インデックス。
+    """
+    index = new_index()
+    texts = scene_texts(df, edges)
+
+    # 一括構築ではリストに溜めてから整数配列に変換する
+    postings = defaultdict(list)
+    for doc, text in enumerate(texts.values()):
+        for gram in _grams(text):
+            postings[gram].append(doc)
+
+    index['postings'] = {
+        gram: array('i', docs) for gram, docs in postings.items()
+    }
+    index['docs'] = list(texts.values())
+    index['scene_ids'] = list(texts.keys())
+    index['doc_ids'] = {scene_id: doc for doc, scene_id in enumerate(texts)}
+    return index
+
+
+def update_scenes(index, df, edges, scene_ids):
+    """
+    変更されたシーンだけをインデックスに反映する。
+
+    シーンの表に存在しなくなったシーンは削除する。
+
+    引数:
+        index (dict): 検索インデックス。
+        df (pandas.DataFrame): 変更後のシーンの表。
+        edges (pandas.DataFrame): 変更後のエッジの表。
+        scene_ids (iterable): 変更されたシーンID（変更前のIDも含める）。
+    """
+    scene_ids = {str(scene_id).strip() for scene_id in scene_ids}
+    texts = scene_texts(df, edges, scene_ids)
+    for scene_id in scene_ids:
+        if scene_id in texts:
+            add_scene(index, scene_id, texts[scene_id])
+        else:
+            remove_scene(index, scene_id)
+
+
+def rename_document(index, old_id, new_id):
+    """
+    インデックス上のシーンIDを変更する。本文は変わらないため再登録は行わない。
+
+    引数:
+        index (dict): 検索インデックス。
+        old_id (str): 変更前のシーンID。
+        new_id (str): 変更後のシーンID。
+    """
+    if old_id not in index['doc_ids']:
+        return
+    remove_scene(index, new_id)
+    doc = index['doc_ids'].pop(old_id)
+    index['doc_ids'][new_id] = doc
+    index['scene_ids'][doc] = new_id
+
+
+def _candidates(index, term):
+    """語の全てのグラムを含む文書番号の集合を返す"""
+    grams = _grams(term) if len(term) == 1 else {
+        term[i:i + 2] for i in range(len(term) - 1)
+    }
+    postings = [index['postings'].get(gram) for gram in grams]
+    if not postings or any(posting is None for posting in postings):
+        return set()
+
+    # 短いポスティングから順に絞り込む
+    postings.sort(key=len)
+    docs = set(postings[0])
+    for posting in postings[1:3]:
+        docs.intersection_update(posting)
+        if not docs:
+            break
+    return docs
+
+
+def parse_query(query):
+    """
+    検索語を解析する。
+
+    引数:
+        query (str): 検索語。
+
+    戻り値:
+        list: (正規化された語, 前方一致かどうか)のタプルのリスト。
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM.findall(normalize_text(query)):
+        term = phrase or word
+        prefix = term.endswith('*') and len(term) > 1
+        if prefix:
+            term = term[:-1]
+        if term:
+            terms.append((term, prefix))
+    return terms
+
+
+def search(index, query):
+    """
+    検索語に一致するシーンIDを返す。
+
+    候補の文書はバイグラムで絞り込み、本文との照合で確定する。
+
+    引数:
+        index (dict): 検索インデックス。
+        query (str): 検索語。
+
+    戻り値:
+        list: 一致したシーンIDのリスト（登録順）。
+    """
+    terms = parse_query(query)
+    if not terms:
+        return []
+
+    # 候補の少ない語から照合する
+    candidates = sorted(
+        ((term, prefix, _candidates(index, term)) for term, prefix in terms),
+        key=lambda item: len(item[2])
+    )
+    docs = candidates[0][2]
+    for _, _, other in candidates[1:]:
+        docs = docs & other
+
+    docs_text = index['docs']
+    matches = []
+    for doc in sorted(docs):
+        text = docs_text[doc]
+        if text is None:
+            continue
+        if all(
+            (text.startswith(term) or '\n' + term in text) if prefix
+            else term in text
+            for term, prefix, _ in candidates
+        ):
+            matches.append(index['scene_ids'][doc])
+    return matches
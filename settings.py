@@ -0,0 +1,59 @@
+"""
+設定ファイル（settings.toml）の読み込みを提供するモジュール。
+
+設定はプロセス内で一度だけ解析し、ファイルの更新時刻が
+変わった場合にのみ再読み込みする。
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import toml
+
+SETTINGS_PATH = Path('settings.toml')
+
+# 絶対パスをキー、(更新時刻, 設定の辞書)を値とするキャッシュ
+_cache = {}
+_lock = threading.Lock()
+
+
+def load_settings():
+    """
+    設定ファイルから全ての設定を読み込む。
+
+    戻り値:
+        dict: 設定の辞書。ファイルがない場合や読み込みに失敗した場合は空の辞書。
+            キャッシュを共有するため、呼び出し側で変更しないこと。
+    """
+    path = os.path.abspath(SETTINGS_PATH)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        try:
+            settings = toml.load(path)
+        except Exception:
+            settings = {}
+        _cache[path] = (mtime, settings)
+    return settings
+
+
+def get_setting(key, default=None):
+    """
+    設定値を1つ取得する。
+
+    引数:
+        key (str): 設定のキー。
+        default (オプション): キーが存在しない場合の既定値。
+
+    戻り値:
+        設定値。
+    """
+    return load_settings().get(key, default)
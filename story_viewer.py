@@ -6,10 +6,16 @@ SVGイメージの処理、シーンの表示、画像の表示を含む
 ストーリー表示機能を管理する。
 """
 
-import os
 import re
 import streamlit as st
 
+from image_cache import image_exists, load_image, prefetch_images
+from play_state import record_move
+from playthrough import record_event
+from profiling import timed
+from scenario_state import get_choice_map, get_scene_rows
+from telemetry import record_transition
+
 
 def get_svg_dimensions(svg_content):
     """
@@ -60,80 +66,103 @@ def prepare_svg_content(svg_content):
     return svg_content
 
 
+@timed('image_load')
 def show_scene_image(image_path):
     """
     シーン画像を表示する。
 
+    先読み済みの画像はキャッシュから表示する。
+
     引数:
         image_path (str): 表示する画像のパス。
     """
     try:
-        if not os.path.exists(image_path):
+        image = load_image(image_path)
+        if image is None:
             return
 
-        if image_path.lower().endswith('.svg'):
-            with open(image_path, 'r', encoding='utf-8') as f:
-                svg_content = f.read()
-                # SVGのサイズを取得
-                width, height = get_svg_dimensions(svg_content)
-                
-                # アスペクト比を維持しながら表示サイズを調整
-                container_width = 500  # コンテナの幅
-                scale = container_width / width
-                display_height = int(height * scale)
-
-                # SVGを包むdivスタイルを設定
-                wrapper_style = f"""
-                    <div style="width: {container_width}px; 
-                        height: {display_height}px; 
-                        overflow: hidden;">
-                        <div style="width: 100%; 
-                                    height: 100%; 
-                                    display: flex; 
-                                    justify-content: center; 
-                                    align-items: center;">
-                                    {svg_content}
-                        </div>
+        if image['svg']:
+            svg_content = image['content']
+            # SVGのサイズを取得
+            width, height = image['size']
+
+            # アスペクト比を維持しながら表示サイズを調整
+            container_width = 500  # コンテナの幅
+            scale = container_width / width
+            display_height = int(height * scale)
+
+            # SVGを包むdivスタイルを設定
+            wrapper_style = f"""
+                <div style="width: {container_width}px; 
+                    height: {display_height}px; 
+                    overflow: hidden;">
+                    <div style="width: 100%; 
+                                height: 100%; 
+                                display: flex; 
+                                justify-content: center; 
+                                align-items: center;">
+                                {svg_content}
                     </div>
-                """
-                st.components.v1.html(wrapper_style, height=display_height)
+                </div>
+            """
+            st.components.v1.html(wrapper_style, height=display_height)
         else:
-            st.image(image_path, use_container_width=True)
+            st.image(image['content'], use_container_width=True)
     except Exception as e:
         st.error(f"画像の読み込みに失敗しました: {e}")
 
 
-def get_scene(df, scene_id):
+def get_scene(df, scene_id, rows=None):
     """
     シーンデータを取得する。
 
     引数:
-        df (pandas.DataFrame): シーンデータを含むデータフレーム。
+        df (pandas.DataFrame): シーンの表。
         scene_id (str): 取得するシーンのID。
+        rows (dict, オプション): シーンIDから行のインデックスラベルを引く辞書。
+            指定された場合は列を走査せずに行を取得する。
 
     戻り値:
         pandas.Series or None: シーンデータ、見つからない場合はNone。
     """
     try:
         scene_id_str = str(scene_id)
-        matching_scenes = df[df['ID'].astype(str) == scene_id_str]
+        if rows is not None:
+            label = rows.get(scene_id_str)
+            scene = None if label is None else df.loc[label]
+        else:
+            matching_scenes = df[df['ID'] == scene_id_str]
+            scene = None if matching_scenes.empty else matching_scenes.iloc[0]
 
-        if matching_scenes.empty:
+        if scene is None:
             st.error(f"シーン {scene_id} が見つかりません。")
-            return None
-
-        return matching_scenes.iloc[0]
+        return scene
     except Exception as e:
         st.error(f"シーンデータの取得に失敗しました: {e}")
         return None
 
 
-def show_story_content(scene_data):
+def move_to_scene(destination, order=None):
+    """
+    現在のシーンを遷移先に変更する。移動前の状態は巻き戻し用に記録する。
+
+    引数:
+        destination (str): 遷移先のシーンID。
+        order (int, オプション): 選んだ選択肢の番号。プレイの記録に使う。
+    """
+    source = str(st.session_state.current_scene)
+    record_event('choice', source, order, destination)
+    record_transition(source, destination)
+    record_move(destination)
+
+
+def show_story_content(scene_data, choices):
     """
     ストーリーコンテンツを表示する。
 
     引数:
         scene_data (pandas.Series): 表示するシーンのデータ。
+        choices (list): (選択肢のテキスト, 遷移先)のリスト。
     """
     if scene_data is None:
         return
@@ -146,28 +175,22 @@ def show_story_content(scene_data):
     st.divider()
 
     # 選択肢の表示
-    for i in range(1, 4):
-        choice_key = f'選択{i}'
-        dest_key = f'選択{i}遷移先'
-
-        if choice_key in scene_data.index and dest_key in scene_data.index:
-            choice = str(scene_data[choice_key]).strip()
-            destination = str(scene_data[dest_key]).strip()
-
-            if (choice and destination and 
-                choice.lower() != 'none' and 
-                destination.lower() != 'none'):
-                if st.button(
-                    f"{choice}", 
-                    key=f"choice_{st.session_state.current_scene}_{i}"
-                ):
-                    st.session_state.current_scene = destination
-                    st.rerun()
+    for i, (choice, destination) in enumerate(choices, start=1):
+        st.button(
+            f"{choice}", 
+            key=f"choice_{st.session_state.current_scene}_{i}",
+            on_click=move_to_scene,
+            args=(destination, i)
+        )
 
 
+@st.fragment
 def show_story_view():
     """
     シナリオビューを表示する。
+
+    フラグメントとして実行されるため、選択肢のクリックでは
+    ストーリービューのみが再描画される。
     """
     try:
         # 初期シーンの設定
@@ -182,18 +205,25 @@ def show_story_view():
         # 現在のシーンデータを取得
         current_scene = get_scene(
             st.session_state.data, 
-            st.session_state.current_scene
+            st.session_state.current_scene,
+            get_scene_rows()
         )
         if current_scene is None:
             return
 
+        choices = get_choice_map().get(str(st.session_state.current_scene), [])
+
         st.subheader(f"シーン {st.session_state.current_scene}")
 
-        # 画像の有無をチェック
-        image_path = st.session_state.image_data.get(
-            st.session_state.current_scene
+        # 遷移先のシーンの画像を先読みする
+        image_data = st.session_state.image_data
+        prefetch_images(
+            image_data.get(destination) for _, destination in choices
         )
-        has_image = image_path and os.path.exists(image_path)
+
+        # 画像の有無をチェック
+        image_path = image_data.get(st.session_state.current_scene)
+        has_image = image_exists(image_path)
 
         # レイアウトの表示
         if has_image:
@@ -201,9 +231,9 @@ def show_story_view():
             with cols[0]:
                 show_scene_image(image_path)
             with cols[1]:
-                show_story_content(current_scene)
+                show_story_content(current_scene, choices)
         else:
-            show_story_content(current_scene)
+            show_story_content(current_scene, choices)
 
     except Exception as e:
         st.error(f"シーンの表示中にエラーが発生しました: {str(e)}")
\ No newline at end of file
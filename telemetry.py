@@ -0,0 +1,193 @@
+"""
+シーンの訪問回数と選択肢の通過回数を集計するテレメトリーモジュール。
+
+選択肢が選ばれるたびに(遷移元, 遷移先)をプロセス内のキュー（deque）に
+追加する。dequeへの追加はロックを取らずにスレッドセーフに行えるため、
+クリックごとの負荷は追加1回だけで済む。キューは集計の参照時と定期的な
+書き出しの際、およびDRAIN_THRESHOLD件溜まった時点でまとめてカウンターへ
+反映するため、ログを書き出さない設定でもキューは一定の長さを超えない。
+
+settings.tomlの`telemetry_log`にパスを指定すると、バックグラウンドの
+スレッドが`telemetry_interval`秒ごとに前回からの増分を1行のJSONとして
+追記する。シーン関係図ではファイルの集計とプロセス内の集計を合算して
+ヒートマップとして重ねて表示する。ファイルは前回読んだ位置から追記された
+行だけを集計し、ファイルが縮んだ場合や置き換えられた場合は先頭から読み直す。
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from settings import get_setting
+
+# 書き出しの既定の間隔（秒）
+DEFAULT_INTERVAL = 30.0
+
+# キューをカウンターへ反映する件数
+DRAIN_THRESHOLD = 1024
+
+# ロックを取らずに追加する(遷移元, 遷移先)のキュー
+_events = deque()
+
+_lock = threading.Lock()
+_state = {
+    # プロセス内の集計
+    'visits': Counter(),
+    'traversals': Counter(),
+    # 書き出していない増分
+    'unflushed': Counter(),
+    'thread': None,
+    # 集計したファイルの(パス, デバイス, iノード)、読んだ位置と集計結果
+    'log_file': None,
+    'log_offset': 0,
+    'log_counts': (Counter(), Counter()),
+}
+
+
+def record_transition(source, destination):
+    """
+    選択肢による遷移を記録する。
+
+    引数:
+        source (str): 遷移元のシーンID。
+        destination (str): 遷移先のシーンID。
+    """
+    _events.append((source, destination))
+    if len(_events) >= DRAIN_THRESHOLD:
+        with _lock:
+            _drain()
+    if _state['thread'] is None and get_setting('telemetry_log'):
+        _start_flusher()
+
+
+def _drain():
+    """キューの内容をカウンターに反映する。ロックを取得した状態で呼び出す"""
+    visits = _state['visits']
+    traversals = _state['traversals']
+    unflushed = _state['unflushed']
+    while _events:
+        edge = _events.popleft()
+        visits[edge[1]] += 1
+        traversals[edge] += 1
+        unflushed[edge] += 1
+
+
+def flush():
+    """
+    前回の書き出し以降の増分をテレメトリーのログに追記する。
+
+    戻り値:
+        int: 書き出した遷移の数。ログのパスが設定されていない場合は0。
+    """
+    log_path = get_setting('telemetry_log')
+    with _lock:
+        _drain()
+        if not log_path or not _state['unflushed']:
+            return 0
+        batch = _state['unflushed']
+        _state['unflushed'] = Counter()
+
+    line = json.dumps({
+        'time': time.time(),
+        'traversals': [[source, destination, count]
+                       for (source, destination), count in batch.items()],
+    }, ensure_ascii=False, separators=(',', ':'))
+    try:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError:
+        # 書き出せなかった増分は次回に持ち越す
+        with _lock:
+            _state['unflushed'].update(batch)
+        return 0
+    return sum(batch.values())
+
+
+def _flush_loop(interval):
+    """定期的にログを書き出すスレッドの処理"""
+    while True:
+        time.sleep(interval)
+        flush()
+
+
+def _start_flusher():
+    """書き出しのスレッドを開始する。既に開始している場合は何もしない"""
+    with _lock:
+        if _state['thread'] is not None:
+            return
+        interval = float(get_setting('telemetry_interval', DEFAULT_INTERVAL))
+        _state['thread'] = threading.Thread(
+            target=_flush_loop, args=(interval,), name='telemetry-flush',
+            daemon=True
+        )
+        _state['thread'].start()
+    atexit.register(flush)
+
+
+def _log_counts(log_path):
+    """
+    ログを集計する。前回読んだ位置以降に追記された行だけを読み、
+    前回の集計結果に加える。ファイルが縮んだ場合や別のファイルに
+    置き換えられた場合は先頭から集計し直す。ロックを取得した状態で呼び出す。
+    """
+    try:
+        stat = os.stat(log_path)
+    except OSError:
+        return Counter(), Counter()
+    log_file = (log_path, stat.st_dev, stat.st_ino)
+    if log_file != _state['log_file'] or stat.st_size < _state['log_offset']:
+        _state['log_file'] = log_file
+        _state['log_offset'] = 0
+        _state['log_counts'] = (Counter(), Counter())
+    if stat.st_size == _state['log_offset']:
+        return _state['log_counts']
+
+    visits, traversals = _state['log_counts']
+    offset = _state['log_offset']
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 書き込み途中の行は次回に読む
+                    break
+                offset += len(line)
+                try:
+                    batch = json.loads(line)['traversals']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                for source, destination, count in batch:
+                    visits[destination] += count
+                    traversals[source, destination] += count
+    except OSError:
+        pass
+    _state['log_offset'] = offset
+    return visits, traversals
+
+
+def scene_heat():
+    """
+    シーンの訪問回数と選択肢の通過回数を返す。
+
+    ログのパスが設定されている場合は、書き出し済みの集計と
+    まだ書き出していない増分を合算する。
+
+    戻り値:
+        tuple: (シーンIDごとの訪問回数, (遷移元, 遷移先)ごとの通過回数)の
+            Counterのタプル。
+    """
+    log_path = get_setting('telemetry_log')
+    with _lock:
+        _drain()
+        if not log_path:
+            return Counter(_state['visits']), Counter(_state['traversals'])
+        unflushed = Counter(_state['unflushed'])
+        visits, traversals = _log_counts(log_path)
+    visits = Counter(visits)
+    traversals = traversals + unflushed
+    for (_, destination), count in unflushed.items():
+        visits[destination] += count
+    return visits, traversals
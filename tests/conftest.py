@@ -0,0 +1,11 @@
+"""
+テストの共通設定。
+
+アプリのモジュールはリポジトリの直下に置かれているため、
+テストからインポートできるようにリポジトリのディレクトリをパスに追加する。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,204 @@
+"""
+bundle.pyのテスト。
+
+メンバーの位置はローカルファイルヘッダーから求めるため、read_memberの結果が
+zipfile.ZipFile.readと一致することを、ローカルと中央ディレクトリで
+拡張フィールドが異なるアーカイブも含めて確認する。
+"""
+
+import io
+import os
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+import bundle
+from toml_export import import_from_toml
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="20"></svg>'
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+
+SCENARIO = '''[BG]
+story = "始まり"
+choices = ["進む"]
+destinations = ["next"]
+image = "images/BG.svg"
+
+[next]
+story = "次"
+image = "images/next.png"
+
+[plain]
+story = "画像なし"
+'''
+
+
+def _extra_field(header_id, data):
+    """拡張フィールドを1つ作成する"""
+    return struct.pack('<HH', header_id, len(data)) + data
+
+
+def _raw_zip(members):
+    """
+    ローカルファイルヘッダーと中央ディレクトリで拡張フィールドが異なる
+    無圧縮のzipを作成する（zipalignなどが作成する形式）。
+
+    members: (名前, 内容, ローカルの拡張フィールド, 中央の拡張フィールド)のリスト
+    """
+    out = io.BytesIO()
+    central = []
+    for name, data, local_extra, central_extra in members:
+        encoded = name.encode('utf-8')
+        crc = zlib.crc32(data)
+        offset = out.tell()
+        out.write(struct.pack(
+            '<4s2B4HL2L2H', b'PK\x03\x04', 20, 0, 0, zipfile.ZIP_STORED,
+            0, 0x21, crc, len(data), len(data), len(encoded), len(local_extra)
+        ))
+        out.write(encoded + local_extra + data)
+        central.append(struct.pack(
+            '<4s4B4HL2L5H2L', b'PK\x01\x02', 20, 3, 20, 0, 0,
+            zipfile.ZIP_STORED, 0, 0x21, crc, len(data), len(data),
+            len(encoded), len(central_extra), 0, 0, 0, 0, offset
+        ) + encoded + central_extra)
+    start = out.tell()
+    for entry in central:
+        out.write(entry)
+    out.write(struct.pack(
+        '<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central),
+        out.tell() - start, start, 0
+    ))
+    return out.getvalue()
+
+
+def _assert_members_match_zipfile(archive):
+    """全てのメンバーについてread_memberとZipFile.readの結果を比較する"""
+    with zipfile.ZipFile(archive) as zf:
+        names = zf.namelist()
+        assert sorted(bundle.bundle_members(archive)) == sorted(names)
+        for name in names:
+            assert bundle.read_member(archive, name) == zf.read(name)
+
+
+@pytest.fixture
+def scenario(tmp_path):
+    """画像ファイルを含むシナリオ"""
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    (image_dir / 'BG.svg').write_text(SVG, encoding='utf-8')
+    (image_dir / 'next.png').write_bytes(PNG)
+    scenes, edges, image_data = import_from_toml(SCENARIO)
+    image_data = {
+        scene_id: str(tmp_path / path) for scene_id, path in image_data.items()
+    }
+    return scenes, edges, image_data
+
+
+@pytest.fixture
+def archive(tmp_path, scenario):
+    """シナリオを書き出したバンドル"""
+    path = str(tmp_path / 'book.zip')
+    assert bundle.write_bundle(path, *scenario) == 2
+    return path
+
+
+def test_write_bundle_stores_images_and_compresses_index(archive):
+    members = bundle.bundle_members(archive)
+    assert members[bundle.INDEX_MEMBER][2] == zipfile.ZIP_DEFLATED
+    assert members['images/BG.svg'][2] == zipfile.ZIP_STORED
+    assert members['images/next.png'][2] == zipfile.ZIP_STORED
+
+
+def test_read_member_matches_zipfile(archive):
+    _assert_members_match_zipfile(archive)
+    assert bundle.read_member(archive, 'images/next.png') == PNG
+
+
+def test_read_member_with_local_extra_fields(tmp_path):
+    timestamp = _extra_field(0x5455, b'\x01' + struct.pack('<L', 1700000000))
+    padding = _extra_field(0xD935, b'\x00' * 13)
+    path = tmp_path / 'aligned.zip'
+    path.write_bytes(_raw_zip([
+        ('scenario.toml', b'[BG]\nstory = "x"\n', timestamp + padding, timestamp),
+        ('images/a.png', PNG, padding, b''),
+        ('images/empty.svg', b'', timestamp, timestamp),
+        ('images/b.svg', SVG.encode('utf-8'), b'', timestamp),
+    ]))
+    _assert_members_match_zipfile(str(path))
+
+
+def test_read_member_with_extra_fields_written_by_zipfile(tmp_path):
+    path = str(tmp_path / 'extra.zip')
+    with zipfile.ZipFile(path, 'w') as zf:
+        for i, data in enumerate([PNG, b'', SVG.encode('utf-8')]):
+            info = zipfile.ZipInfo(f'images/{i}.bin')
+            info.extra = _extra_field(0xCAFE, b'\xff' * (i * 7))
+            zf.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+        zf.writestr('notes.txt', 'テキスト' * 100, compress_type=zipfile.ZIP_DEFLATED)
+    _assert_members_match_zipfile(path)
+
+
+def test_read_member_missing_member(archive):
+    with pytest.raises(KeyError):
+        bundle.read_member(archive, 'images/missing.png')
+
+
+def test_bundle_members_refreshes_after_rewrite(tmp_path):
+    path = str(tmp_path / 'rewrite.zip')
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('images/a.png', b'old')
+    assert bundle.read_member(path, 'images/a.png') == b'old'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('images/z.png', b'padding')
+        zf.writestr('images/a.png', b'new content')
+    assert bundle.read_member(path, 'images/a.png') == b'new content'
+
+
+def test_read_bundle_round_trip(archive, scenario):
+    scenes, edges, image_data, skipped = bundle.read_bundle(archive)
+    original_scenes, original_edges, original_images = scenario
+    assert skipped == []
+    assert scenes['ID'].tolist() == original_scenes['ID'].tolist()
+    assert scenes['ストーリー'].tolist() == original_scenes['ストーリー'].tolist()
+    assert edges.values.tolist() == original_edges.values.tolist()
+    assert image_data == {
+        'BG': bundle.member_path(archive, 'images/BG.svg'),
+        'next': bundle.member_path(archive, 'images/next.png'),
+    }
+    for scene_id, path in image_data.items():
+        with open(original_images[scene_id], 'rb') as f:
+            assert bundle.read_image_bytes(path) == f.read()
+
+
+def test_member_path_round_trip(archive):
+    path = bundle.member_path(archive, 'images/BG.svg')
+    assert bundle.split_member_path(path) == (archive, 'images/BG.svg')
+    assert bundle.split_member_path('images/BG.svg') is None
+    assert bundle.split_member_path(archive + bundle.SEPARATOR) is None
+    assert bundle.is_bundle(archive)
+    assert not bundle.is_bundle(os.path.dirname(archive))
+
+
+def test_extract_images(archive, tmp_path):
+    image_data = bundle.read_bundle(archive)[2]
+    image_data['plain'] = 'images/plain.png'
+    image_dir = str(tmp_path / 'extracted')
+    extracted = bundle.extract_images(image_data, image_dir)
+    assert sorted(extracted) == sorted([
+        os.path.join(image_dir, 'BG.svg'), os.path.join(image_dir, 'next.png')
+    ])
+    assert image_data['next'] == os.path.join(image_dir, 'next.png')
+    assert image_data['plain'] == 'images/plain.png'
+    with open(image_data['next'], 'rb') as f:
+        assert f.read() == PNG
+
+
+def test_scene_signatures_treat_bundle_and_file_paths_alike(archive):
+    from scenario_watcher import scene_signatures
+
+    scenes, edges, image_data, _ = bundle.read_bundle(archive)
+    with bundle.open_index(archive) as index:
+        saved = import_from_toml(index.read().decode('utf-8'))
+    assert scene_signatures(scenes, edges, image_data) == scene_signatures(*saved)
@@ -0,0 +1,237 @@
+"""
+toml_export.iter_toml_scenesとimport_toml_streamのテスト。
+
+ストリーミングの読み込みは、ファイル全体をtoml.loadsで解析する
+import_from_tomlと同じ結果になることを確認する。
+"""
+
+import pytest
+
+from toml_export import import_from_toml, import_toml_stream, iter_toml_scenes
+
+
+def _lines(text, newline='\n'):
+    """テキストをファイルから読んだ場合と同じバイト列の行に分ける"""
+    return [
+        line.encode('utf-8')
+        for line in text.replace('\n', newline).splitlines(keepends=True)
+    ]
+
+
+def _scenario(scenes, edges, image_data):
+    """比較しやすい形に変換する"""
+    return (
+        scenes['ID'].tolist(),
+        scenes['ストーリー'].tolist(),
+        edges[['source', 'order', 'label', 'destination']].values.tolist(),
+        image_data,
+    )
+
+
+def _assert_same_as_whole(text):
+    """ストリーミングの読み込みとファイル全体の読み込みの結果を比較する"""
+    scenes, edges, image_data, skipped = import_toml_stream(_lines(text))
+    assert skipped == []
+    assert _scenario(scenes, edges, image_data) == _scenario(*import_from_toml(text))
+    return scenes
+
+
+def _ids(text):
+    """テーブルごとに解析したシーンIDの一覧を返す"""
+    return [scene_id for scene_id, _, _ in iter_toml_scenes(_lines(text))]
+
+
+def test_header_inside_basic_multiline_string_is_not_split():
+    text = '''[BG]
+story = """始まり
+[fake]
+["quoted fake"]
+終わり"""
+choices = ["進む"]
+destinations = ["next"]
+
+[next]
+story = "次"
+'''
+    assert _ids(text) == ['BG', 'next']
+    scenes = _assert_same_as_whole(text)
+    assert '[fake]' in scenes['ストーリー'].tolist()[0]
+
+
+def test_header_inside_literal_multiline_string_is_not_split():
+    text = """[BG]
+story = '''
+[fake] # コメントのように見える行
+'''
+
+[next]
+story = "次"
+"""
+    assert _ids(text) == ['BG', 'next']
+    _assert_same_as_whole(text)
+
+
+def test_multiline_string_closed_on_the_same_line():
+    text = '''[BG]
+story = """1行で閉じる"""
+
+[next]
+story = """開く
+閉じる"""
+[last]
+story = "最後"
+'''
+    assert _ids(text) == ['BG', 'next', 'last']
+    _assert_same_as_whole(text)
+
+
+def test_other_delimiter_inside_multiline_string():
+    text = """[BG]
+story = '''開く \"\"\" は区切りではない
+[fake]
+'''
+[next]
+story = "次"
+"""
+    assert _ids(text) == ['BG', 'next']
+    _assert_same_as_whole(text)
+
+
+def test_delimiter_inside_single_line_string():
+    # 区切りを含む1行の文字列で後続のテーブルがまとめて解析されても結果は同じ
+    text = '''[BG]
+story = 'ここに """ がある'
+
+[next]
+story = "次"
+choices = ["戻る"]
+destinations = ["BG"]
+
+[last]
+story = "最後"
+'''
+    ids = [scene_id for scene_id, data, _ in iter_toml_scenes(_lines(text)) if data]
+    assert ids == ['BG', 'next', 'last']
+    _assert_same_as_whole(text)
+
+
+@pytest.mark.parametrize('header, scene_id', [
+    ('["quoted id"]', 'quoted id'),
+    ("['literal id']", 'literal id'),
+    ('["1.5"]', '1.5'),
+    ('[ spaced ]', 'spaced'),
+    ('[commented] # 見出しのコメント', 'commented'),
+    ('["]"]', ']'),
+])
+def test_quoted_and_decorated_table_names(header, scene_id):
+    text = f'{header}\nstory = "本文"\n\n[next]\nstory = "次"\n'
+    assert _ids(text) == [scene_id, 'next']
+    scenes = _assert_same_as_whole(text)
+    assert scenes['ID'].tolist() == [scene_id, 'next']
+
+
+def test_dotted_table_names_match_whole_file_parsing():
+    text = '''[BG]
+story = "始まり"
+
+[BG.notes]
+author = "作者"
+
+[chapter.one]
+story = "入れ子のテーブルはシーンではない"
+
+["chapter.two"]
+story = "引用符付きの点はシーンIDの一部"
+'''
+    scenes = _assert_same_as_whole(text)
+    assert scenes['ID'].tolist() == ['BG', 'chapter.two']
+
+
+def test_array_of_tables_is_not_a_header():
+    text = '''[BG]
+story = "始まり"
+
+[[log]]
+entry = 1
+
+[next]
+story = "次"
+'''
+    assert _ids(text)[-1] == 'next'
+    _assert_same_as_whole(text)
+
+
+def test_crlf_line_endings():
+    text = '[BG]\nstory = """1行目\n[fake]\n"""\n\n[next]\nstory = "次"\n'
+    scenes, _, _, skipped = import_toml_stream(_lines(text, '\r\n'))
+    assert skipped == []
+    assert scenes['ID'].tolist() == ['BG', 'next']
+    # 複数行の文字列の改行はLFとして読み込む
+    assert scenes['ストーリー'].tolist()[0] == '1行目\n[fake]\n'
+    whole, _, _ = import_from_toml(text.replace('\n', '\r\n'))
+    assert whole['ストーリー'].tolist() == scenes['ストーリー'].tolist()
+
+
+def test_malformed_table_is_skipped_and_reading_continues():
+    text = '''[BG]
+story = "始まり"
+
+[broken]
+story = "閉じていない
+
+[next]
+story = "次"
+'''
+    scenes, _, _, skipped = import_toml_stream(_lines(text))
+    assert skipped == ['broken']
+    assert scenes['ID'].tolist() == ['BG', 'next']
+
+
+@pytest.mark.parametrize('fields', [
+    'choices = 5',
+    'destinations = "A"',
+    'choices = ["a"]\ndestinations = {x = 1}',
+])
+def test_table_with_invalid_choices_is_skipped(fields):
+    text = f'''[BG]
+story = "始まり"
+choices = ["進む"]
+destinations = ["B"]
+
+[B]
+story = "y"
+{fields}
+
+[next]
+story = "次"
+'''
+    scenes, edges, _, skipped = import_toml_stream(_lines(text))
+    assert skipped == ['B']
+    assert scenes['ID'].tolist() == ['BG', 'next']
+    assert edges['source'].tolist() == ['BG']
+    # ファイル全体の読み込みでも途中まで追加されたシーンは残らない
+    whole, whole_edges, _ = import_from_toml(text)
+    assert whole['ID'].tolist() == ['BG', 'next']
+    assert whole_edges['source'].tolist() == ['BG']
+
+
+def test_invalid_utf8_table_is_skipped():
+    lines = _lines('[BG]\nstory = "始まり"\n[bad]\n')
+    lines.append(b'story = "\xff"\n')
+    lines.extend(_lines('[next]\nstory = "次"\n'))
+    scenes, _, _, skipped = import_toml_stream(lines)
+    assert skipped == ['bad']
+    assert scenes['ID'].tolist() == ['BG', 'next']
+
+
+def test_progress_reports_positions_and_scene_counts():
+    text = ''.join(f'[s{i}]\nstory = "本文{i}"\n\n' for i in range(1200))
+    lines = _lines(text)
+    calls = []
+    import_toml_stream(
+        lines, lambda position, state: calls.append((position, len(state['ids'])))
+    )
+    assert [count for _, count in calls] == [1, 500, 1000, 1200]
+    assert calls[-1][0] == sum(len(line) for line in lines)
+    positions = [position for position, _ in calls]
+    assert positions == sorted(positions)
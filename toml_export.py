@@ -1,111 +1,327 @@
 """
 TOML形式でのエクスポート/インポート機能を提供するモジュール
+
+大きなファイルはiter_toml_scenesで行単位に読み、トップレベルのテーブル
+（[シーンID]）ごとに解析できる。ファイル全体を1つの文字列や辞書として
+保持しないため、ピークメモリはファイルの大きさではなく1シーン分の
+テキストと読み込み済みの列で決まる。
+
+エクスポートでは、シーンごとのTOMLの断片を内容のハッシュをキーとして
+プロセス内にキャッシュし、新しいシーンと変更されたシーンだけを変換する。
 """
+import hashlib
 import os
+import re
+import threading
 import toml
-import pandas as pd
 
-def export_to_toml(df, image_data):
-    """DataFrameをTOML形式に変換
+from profiling import timed
+from scene_model import choices_by_scene, clean_value, new_edges, new_scenes
+
+_fragment_lock = threading.Lock()
+# シーンの内容のハッシュをキー、そのシーンのTOMLの断片を値とするキャッシュ
+_fragment_cache = {}
+
+def _scene_fragment(scene_id, story, choices, image):
+    """1つのシーンのTOMLの断片を返す。内容が同じシーンはキャッシュを使う"""
+    key = hashlib.blake2b(
+        repr((scene_id, story, choices, image)).encode('utf-8'), digest_size=16
+    ).digest()
+    fragment = _fragment_cache.get(key)
+    if fragment is None:
+        scene = {
+            'story': story,
+            'choices': [choice for choice, _ in choices],
+            'destinations': [dest for _, dest in choices]
+        }
+        if image is not None:
+            scene['image'] = image
+        fragment = toml.dumps({scene_id: scene}, encoder=toml.TomlEncoder())
+    return key, fragment
+
+def clear_fragment_cache():
+    """シーンごとのTOMLの断片のキャッシュを消去する"""
+    with _fragment_lock:
+        _fragment_cache.clear()
+
+@timed('export_to_toml')
+def export_to_toml(df, edges, image_data, choices_map=None):
+    """シーンの表とエッジの表をTOML形式に変換
+
+    各シーンの断片はキャッシュし、前回から変わったシーンだけを変換する。
+    出力はシナリオ全体を一度に変換した場合と同じになる。
 
     Args:
-        df (pd.DataFrame): 変換するDataFrame
+        df (pd.DataFrame): 変換するシーンの表
+        edges (pd.DataFrame): 選択肢のエッジの表
         image_data (dict): 画像データの辞書
+        choices_map (dict, optional): エッジの表から作成済みのシーンごとの
+            選択肢の一覧。指定した場合はエッジの表を集計し直さない
 
     Returns:
         str: TOML形式の文字列
     """
+    if choices_map is None:
+        choices_map = choices_by_scene(edges)
     scenes = {}
-    for _, row in df.iterrows():
+    for scene_id, story in zip(df['ID'].tolist(), df['ストーリー'].tolist()):
         try:
-            scene_id = str(row['ID']).strip()
-            if not scene_id or scene_id.lower() == 'none':
+            scene_id = clean_value(scene_id)
+            if not scene_id:
                 continue
 
-            story = str(row['ストーリー']).strip()
-            if not story or story.lower() == 'none':
+            story = clean_value(story)
+            if not story:
                 continue
 
-            choices = []
-            destinations = []
-            for i in range(1, 4):
-                choice_key = f'選択{i}'
-                dest_key = f'選択{i}遷移先'
-                
-                if choice_key in row and dest_key in row:
-                    choice = str(row[choice_key]).strip()
-                    dest = str(row[dest_key]).strip()
-                    
-                    if (choice and dest and 
-                        choice.lower() != 'none' and 
-                        dest.lower() != 'none'):
-                        choices.append(choice)
-                        destinations.append(dest)
-
-            scenes[scene_id] = {
-                'story': story,
-                'choices': choices,
-                'destinations': destinations
-            }
-
             # 画像パスの保存
+            image = None
             if scene_id in image_data:
                 image_path = image_data[scene_id]
                 # オリジナルのファイル拡張子を保持
                 _, ext = os.path.splitext(image_path)
-                scenes[scene_id]['image'] = f"images/{scene_id}{ext}"
+                image = f"images/{scene_id}{ext}"
+
+            # テキストと遷移先の両方がある選択肢のみを出力
+            scenes[scene_id] = (story, choices_map.get(scene_id, []), image)
 
         except Exception:
             continue
 
-    return toml.dumps(scenes, encoder=toml.TomlEncoder())
+    fragments = [
+        _scene_fragment(scene_id, *scene) for scene_id, scene in scenes.items()
+    ]
 
-def import_from_toml(toml_string):
-    """TOML文字列からDataFrameを生成
+    with _fragment_lock:
+        _fragment_cache.update(fragments)
+        # 編集で使われなくなった断片が溜まりすぎたら、今回の断片だけを残す
+        if len(_fragment_cache) > 2 * len(fragments) + 1000:
+            _fragment_cache.clear()
+            _fragment_cache.update(fragments)
+
+    # toml.dumpsはテーブルの間に空行を1行入れる
+    return '\n'.join(fragment for _, fragment in fragments)
+
+# 進捗を通知するシーン数の間隔
+PROGRESS_INTERVAL = 500
+
+# トップレベルのテーブルの見出し（[シーンID]）
+_TABLE_HEADER = re.compile(r'\[(?!\[)\s*(.+?)\s*\]\s*(?:#.*)?$')
+
+# 複数行の文字列の区切り
+_MULTILINE_DELIMITERS = ('"""', "'''")
+
+def new_import():
+    """読み込み中のシナリオの列を保持する辞書を作成
+
+    Returns:
+        dict: シーンID、ストーリー、エッジの列、画像データ、読み飛ばしたテーブルの辞書
+    """
+    return {
+        'ids': [],
+        'stories': [],
+        'edge_columns': ([], [], [], []),
+        'image_data': {},
+        'skipped': [],
+    }
+
+def add_scene(state, scene_id, scene_data):
+    """1つのシーンを読み込み中のシナリオに追加
+
+    ストーリーのないテーブルは追加しない。形式が正しくないテーブルは
+    何も追加せずに例外を送出する。
 
     Args:
-        toml_string (str): TOML形式の文字列
+        state (dict): new_importで作成した辞書
+        scene_id (str): シーンID
+        scene_data (dict): TOMLのテーブルの内容
+
+    Returns:
+        bool: 追加した場合はTrue
+
+    Raises:
+        TypeError: 選択肢または遷移先が配列でない場合
+    """
+    if not isinstance(scene_data, dict):
+        return False
+
+    if not scene_data.get('story'):
+        return False
+
+    # 途中まで追加されたシーンが残らないよう、追加する前に形式を確認する
+    choices = scene_data.get('choices', [])
+    destinations = scene_data.get('destinations', [])
+    if not isinstance(choices, list) or not isinstance(destinations, list):
+        raise TypeError(f"{scene_id}の選択肢または遷移先が配列ではありません")
+
+    state['ids'].append(scene_id)
+    state['stories'].append(scene_data.get('story', ''))
+
+    # 選択肢と遷移先の設定
+    edge_columns = state['edge_columns']
+
+    for i in range(max(len(choices), len(destinations))):
+        choice = choices[i] if i < len(choices) else ''
+        dest = destinations[i] if i < len(destinations) else ''
+        if choice or dest:
+            edge_columns[0].append(scene_id)
+            edge_columns[1].append(i + 1)
+            edge_columns[2].append(choice)
+            edge_columns[3].append(dest)
+
+    # 画像パスの読み込み
+    if 'image' in scene_data:
+        state['image_data'][scene_id] = scene_data['image']
+    return True
+
+def finish_import(state):
+    """読み込み中のシナリオからシーンの表とエッジの表を生成
+
+    Args:
+        state (dict): new_importで作成した辞書
 
     Returns:
-        tuple: (pd.DataFrame, dict) データフレームと画像データの辞書
+        tuple: (pd.DataFrame, pd.DataFrame, dict) シーンの表、エッジの表、画像データの辞書
     """
+    return (
+        new_scenes(state['ids'], state['stories']),
+        new_edges(*state['edge_columns']),
+        dict(state['image_data'])
+    )
+
+def _multiline_state(line, delimiter):
+    """行末で開いている複数行の文字列の区切りを返す（なければNone）"""
+    pos = 0
+    while True:
+        if delimiter is not None:
+            end = line.find(delimiter, pos)
+            if end < 0:
+                return delimiter
+            pos = end + 3
+            delimiter = None
+        else:
+            starts = [(line.find(d, pos), d) for d in _MULTILINE_DELIMITERS]
+            starts = [start for start in starts if start[0] >= 0]
+            if not starts:
+                return None
+            pos, delimiter = min(starts)
+            pos += 3
+
+def _parse_table(lines, header, broken):
+    """1つのテーブルを解析し、(シーンID, 内容)を順に返す"""
     try:
-        data = toml.loads(toml_string)
-        rows = []
-        image_data = {}
-        
-        for scene_id, scene_data in data.items():
-            try:
-                if not isinstance(scene_data, dict):
-                    continue
+        if broken:
+            raise ValueError(header)
+        # tomlは複数行の文字列内のCRLFを正しく扱えないため、改行をLFにそろえる
+        data = toml.loads(''.join(lines).replace('\r\n', '\n'))
+    except Exception:
+        yield header, None
+        return
+    for scene_id, scene_data in data.items():
+        yield scene_id, scene_data
+
+def iter_toml_scenes(lines):
+    """TOMLファイルをトップレベルのテーブルごとに解析するジェネレーター
+
+    テーブルの見出しは行頭に書かれていることを前提とする。解析できない
+    テーブルは内容をNoneとして返し、残りのテーブルの読み込みを続ける。
+
+    Args:
+        lines (iterable): UTF-8でエンコードされたファイルの各行（バイト列）
+
+    Yields:
+        tuple: (シーンID, テーブルの内容の辞書またはNone, 読み込んだバイト数)
+    """
+    position = 0
+    header = None
+    table = []
+    broken = False
+    delimiter = None
+    for raw in lines:
+        position += len(raw)
+        try:
+            line = raw.decode('utf-8')
+            decoded = True
+        except UnicodeDecodeError:
+            line = raw.decode('utf-8', errors='replace')
+            decoded = False
+        if delimiter is None:
+            match = _TABLE_HEADER.match(line)
+            if match is not None:
+                if table:
+                    for scene_id, scene_data in _parse_table(table, header, broken):
+                        yield scene_id, scene_data, position - len(raw)
+                header = match.group(1).strip('"\'')
+                table = []
+                broken = False
+        table.append(line)
+        # UTF-8として読めない行を含むテーブルは解析できないものとして扱う
+        broken = broken or not decoded
+        delimiter = _multiline_state(line, delimiter)
+    if table:
+        for scene_id, scene_data in _parse_table(table, header, broken):
+            yield scene_id, scene_data, position
+
+@timed('import_toml_stream')
+def import_toml_stream(lines, progress=None):
+    """TOMLファイルをテーブルごとに読み込み、シーンの表とエッジの表を生成
+
+    解析できないテーブルと形式が正しくないテーブルは読み飛ばし、
+    読み込みを中断しない。
+
+    Args:
+        lines (iterable): UTF-8でエンコードされたファイルの各行（バイト列）
+        progress (callable, optional): 最初のシーンを追加した後と、
+            PROGRESS_INTERVALシーンごとに(読み込んだバイト数, 読み込み中の
+            シナリオの辞書)を引数として呼び出す関数
 
-                if not scene_data.get('story'):
-                    continue
+    Returns:
+        tuple: (pd.DataFrame, pd.DataFrame, dict, list) シーンの表、エッジの表、
+            画像データの辞書、読み飛ばしたテーブルの見出しのリスト
+    """
+    state = new_import()
+    position = 0
+    for scene_id, scene_data, position in iter_toml_scenes(lines):
+        if scene_data is None:
+            state['skipped'].append(scene_id)
+            continue
+        try:
+            if not add_scene(state, scene_id, scene_data):
+                continue
+        except Exception:
+            # 形式が正しくないテーブルは読み飛ばし、読み込みを続ける
+            state['skipped'].append(scene_id)
+            continue
+        count = len(state['ids'])
+        if progress is not None and (count == 1 or count % PROGRESS_INTERVAL == 0):
+            progress(position, state)
+    if progress is not None:
+        progress(position, state)
+    return (*finish_import(state), state['skipped'])
 
-                row = {
-                    'ID': scene_id,
-                    'ストーリー': scene_data.get('story', ''),
-                }
+@timed('import_from_toml')
+def import_from_toml(toml_string):
+    """TOML文字列からシーンの表とエッジの表を生成
 
-                # 選択肢と遷移先の設定
-                choices = scene_data.get('choices', [])
-                destinations = scene_data.get('destinations', [])
-                
-                for i in range(1, 4):
-                    row[f'選択{i}'] = choices[i-1] if i <= len(choices) else ''
-                    row[f'選択{i}遷移先'] = destinations[i-1] if i <= len(destinations) else ''
+    選択肢の数に上限はなく、TOMLの配列の要素を全てエッジとして読み込む。
 
-                rows.append(row)
+    Args:
+        toml_string (str): TOML形式の文字列
 
-                # 画像パスの読み込み
-                if 'image' in scene_data:
-                    image_data[scene_id] = scene_data['image']
+    Returns:
+        tuple: (pd.DataFrame, pd.DataFrame, dict) シーンの表、エッジの表、画像データの辞書
+    """
+    try:
+        data = toml.loads(toml_string.replace('\r\n', '\n'))
+        state = new_import()
 
+        for scene_id, scene_data in data.items():
+            try:
+                add_scene(state, scene_id, scene_data)
             except Exception:
                 continue
 
-        df = pd.DataFrame(rows)
-        return df, image_data
+        return finish_import(state)
 
     except Exception as e:
         raise Exception(f"TOMLファイルの読み込みに失敗しました: {str(e)}")
\ No newline at end of file